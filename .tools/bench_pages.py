@@ -0,0 +1,187 @@
+r"""
+Benchmark das consultas das páginas (SQLite ou PostgreSQL), com saída em JSON.
+
+Mede as mesmas consultas que as páginas executam: listagens por status
+(04/05/06/07), consulta do período no Financeiro (08), contagens do
+dashboard (app.py e Administração) e a varredura de fotos órfãs da
+Administração. Cada caso roda --repeat vezes; o JSON guarda min/mediana/máx
+em ms e o número de linhas, junto com volumes, backend e commit do git.
+
+Sem --db nem DATABASE_URL, gera um banco temporário com .tools/seed_data.py.
+
+Usage:
+    python .\.tools\bench_pages.py --scale 0.1 --out bench.json
+    python .\.tools\bench_pages.py --db .\bench.db --baseline bench.json --tolerance 1.5
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import core.db as db  # noqa: E402
+from seed_data import seed, photo_name  # noqa: E402
+from services.order_listing import ensure_order_listing, list_orders  # noqa: E402
+
+# Consultas copiadas das páginas (mantê-las em sincronia ao mudar as páginas);
+# as listagens por status usam a mesma função das páginas (list_orders)
+FINANCE_PERIOD_SQL = """
+    SELECT f.*, o.id AS order_id, o.category, o.type, o.product, c.name AS client_name
+    FROM finance_entries f
+    JOIN orders o ON o.id=f.order_id
+    JOIN clients c ON c.id=o.client_id
+    WHERE date(f.created_at) BETWEEN ? AND ?
+    ORDER BY f.settled ASC, f.created_at DESC
+"""
+DASHBOARD_COUNT_SQL = "SELECT COUNT(*) as c FROM orders WHERE status=?"
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _fetch(sql, params=()):
+    return len(db.exec_query(sql, params).fetchall())
+
+
+def _orphan_scan(uploads: Path):
+    """Varredura de fotos órfãs da Administração (services.reconcile) sobre a pasta temporária."""
+    from services import reconcile
+    reconcile.UPLOAD_DIR = str(uploads)
+    return len(reconcile.find_orphans("local")["orphans"])
+
+
+def _make_uploads(n_files: int, max_order_id: int) -> Path:
+    """Diretório de uploads com metade das fotos referenciadas por pedidos e metade órfãs."""
+    uploads = Path(tempfile.mkdtemp(prefix="bench_uploads_"))
+    step = max(1, max_order_id // max(1, n_files))
+    for i in range(n_files):
+        name = photo_name(i * step + 1, 0) if i % 2 == 0 else f"orphan_{i}.jpg"
+        (uploads / name).write_bytes(b"\xff\xd8\xff\xd9")
+    return uploads
+
+
+def build_cases(uploads: Path):
+    today = date.today()
+    start = (datetime.now() - timedelta(days=30)).date()
+    cases = {}
+    for status in ("CRIADO", "AGUARDANDO_CONF", "EM_ESTOQUE", "RECEBIDO_NC"):
+        cases[f"status_listing[{status}]"] = (lambda s=status: len(list_orders(s)))
+    cases["finance_period[30d]"] = lambda: _fetch(FINANCE_PERIOD_SQL, (start.isoformat(), today.isoformat()))
+
+    def dashboard():
+        for status in ("CRIADO", "AGUARDANDO_CONF", "EM_ESTOQUE"):
+            db.exec_query(DASHBOARD_COUNT_SQL, (status,)).fetchone()
+        db.exec_query("SELECT COUNT(*) as count FROM clients").fetchone()
+        db.exec_query("SELECT COUNT(*) as count FROM orders").fetchone()
+        return 5
+    cases["dashboard_counts"] = dashboard
+    cases["orphan_photo_scan"] = lambda: _orphan_scan(uploads)
+    return cases
+
+
+def run_cases(cases: dict, repeat: int):
+    results = {}
+    for name, fn in cases.items():
+        times, rows = [], 0
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            rows = fn()
+            times.append((time.perf_counter() - t0) * 1000)
+        results[name] = {
+            "min_ms": round(min(times), 3),
+            "median_ms": round(statistics.median(times), 3),
+            "max_ms": round(max(times), 3),
+            "rows": rows,
+        }
+        print(f"{name:<34} mediana={results[name]['median_ms']:10.1f} ms  linhas={rows}", file=sys.stderr)
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    """Casos cuja mediana passou de baseline * tolerance."""
+    regressions = []
+    for name, r in results.items():
+        base = baseline.get("results", {}).get(name)
+        if base and base["median_ms"] > 0 and r["median_ms"] > base["median_ms"] * tolerance:
+            regressions.append({"case": name, "baseline_ms": base["median_ms"], "median_ms": r["median_ms"]})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="SQLite já populado (ou vazio, para gerar os dados nele)")
+    parser.add_argument("--scale", type=float, default=0.1, help="volume ao gerar dados (1 = 500k pedidos)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--photo-files", type=int, default=50, help="arquivos no diretório de uploads da varredura")
+    parser.add_argument("--out", help="arquivo JSON de saída (padrão: stdout)")
+    parser.add_argument("--baseline", help="JSON de uma execução anterior para comparar")
+    parser.add_argument("--tolerance", type=float, default=1.5)
+    args = parser.parse_args()
+
+    if not os.environ.get("DATABASE_URL"):
+        db.DB_PATH = os.path.abspath(args.db) if args.db else os.path.join(tempfile.mkdtemp(prefix="bench_pages_"), "bench.db")
+    db.init_db()
+    conn = db.get_conn()
+
+    seeded = None
+    if not db.exec_query("SELECT 1 AS x FROM orders LIMIT 1").fetchone():
+        t0 = time.perf_counter()
+        seeded = seed(conn, args.scale)
+        print(f"Dados gerados em {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+
+    ensure_order_listing()    # projeção pronta antes de medir (como no início do app)
+
+    volumes = {t: db.exec_query(f"SELECT COUNT(*) AS c FROM {t}").fetchone()['c']
+               for t in ("clients", "orders", "audit_log", "finance_entries", "nonconformities")}
+    max_id = db.exec_query("SELECT COALESCE(MAX(id), 0) AS m FROM orders").fetchone()['m']
+    uploads = _make_uploads(args.photo_files, max_id)
+
+    report = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "backend": "postgres" if db.is_postgres_conn(conn) else "sqlite",
+        "sqlite_version": sqlite3.sqlite_version,
+        "python": platform.python_version(),
+        "scale": args.scale if seeded else None,
+        "volumes": volumes,
+        "photo_files": args.photo_files,
+        "repeat": args.repeat,
+        "results": run_cases(build_cases(uploads), args.repeat),
+    }
+    shutil.rmtree(uploads, ignore_errors=True)
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            report["regressions"] = compare(report["results"], json.load(f), args.tolerance)
+        for r in report["regressions"]:
+            print(f"REGRESSÃO {r['case']}: {r['baseline_ms']} ms → {r['median_ms']} ms", file=sys.stderr)
+        status = 1 if report["regressions"] else 0
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+r"""
+Benchmark do motor de relatórios (services/reports.py) em SQLite.
+
+Gera um banco temporário com ~1 ano de dados sintéticos (.tools/seed_data.py) e mede cada relatório
+a frio (cache limpo) e a quente (cache). Falha (exit 1) se algum relatório
+a frio passar do limite.
+
+Usage:
+    python .\.tools\bench_reports.py
+    python .\.tools\bench_reports.py --orders 50000 --limit 0.5
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.pop('DATABASE_URL', None)  # benchmark sempre em SQLite local
+
+import core.db as db  # noqa: E402
+from seed_data import seed  # noqa: E402
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=3000)
+    parser.add_argument("--limit", type=float, default=0.5, help="tempo máximo (s) por relatório a frio")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_reports_")
+    db.DB_PATH = os.path.join(tmp, "bench.db")
+    db.init_db()
+    volumes = seed(db.get_conn(), clients=args.clients, orders=args.orders, audit_rows=0)
+
+    from services import reports
+
+    end = date.today()
+    start = end - timedelta(days=365)
+    cases = {
+        "lead_times": lambda: reports.lead_times(start, end),
+        "time_in_status[AGUARDANDO_CONF]": lambda: reports.time_in_status("AGUARDANDO_CONF", start, end),
+        "nc_rates[category]": lambda: reports.nc_rates(start, end, "category"),
+        "nc_rates[product]": lambda: reports.nc_rates(start, end, "product"),
+        "nc_kinds": lambda: reports.nc_kinds(start, end),
+        "margin_distribution": lambda: reports.margin_distribution(start, end),
+        "top_clients": lambda: reports.top_clients(start, end, 10),
+    }
+
+    print(f"Volumes: {volumes}")
+    failed = False
+    for name, fn in cases.items():
+        reports.clear_cache()
+        t0 = time.perf_counter()
+        fn()
+        cold = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        fn()
+        warm = time.perf_counter() - t0
+        ok = cold <= args.limit
+        failed |= not ok
+        print(f"{'OK ' if ok else 'LENTO'} {name:<32} frio={cold * 1000:8.1f} ms  cache={warm * 1000:6.3f} ms")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
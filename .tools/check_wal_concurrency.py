@@ -0,0 +1,148 @@
+r"""
+Teste de concorrência do SQLite: leitores não podem esperar por quem escreve.
+
+Cenários (num banco temporário):
+1. Outra conexão (outro processo, script de manutenção) segura uma
+   transação EXCLUSIVE por --hold segundos enquanto --readers threads
+   fazem SELECTs via core.db.exec_query.
+2. Uma thread do app executa uma escrita longa pela conexão compartilhada
+   (segura o lock de core.db) enquanto as outras leem.
+3. Quem escreveu e ainda não confirmou lê as próprias escritas; as outras
+   threads não as veem antes do commit.
+
+Com WAL (padrão) a latência máxima de leitura fica muito abaixo de --hold.
+Para comparar com o modo antigo (rollback journal), rode com
+EXONVAIS_SQLITE_WAL=0: nos cenários 1 e 2 cada leitura espera o commit do
+escritor (até o busy_timeout) e o teste falha.
+
+Usage:
+    python .\.tools\check_wal_concurrency.py
+    python .\.tools\check_wal_concurrency.py --readers 8 --hold 2
+    $env:EXONVAIS_SQLITE_WAL = '0'; python .\.tools\check_wal_concurrency.py
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+
+def _readers(db, n: int, seconds: float):
+    """n threads lendo por `seconds` segundos; retorna (latências, erros)."""
+    latencies, errors = [], []
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + seconds
+
+    def loop():
+        while time.perf_counter() < stop_at:
+            t0 = time.perf_counter()
+            try:
+                db.exec_query("SELECT COUNT(*) AS n, MAX(price_sale) AS m FROM orders WHERE status=?", ("CRIADO",)).fetchone()
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - t0)
+
+    threads = [threading.Thread(target=loop) for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors
+
+
+def _report(name: str, latencies, errors, limit_s: float) -> bool:
+    worst = max(latencies) if latencies else float("inf")
+    ok = not errors and worst < limit_s
+    print(f"{'✅' if ok else '❌'} {name}: {len(latencies)} leituras, máx {worst * 1000:.1f} ms "
+          f"(limite {limit_s * 1000:.0f} ms), erros={len(errors)}{' — ' + errors[0] if errors else ''}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--hold", type=float, default=1.5, help="segundos que o escritor segura a transação")
+    parser.add_argument("--rows", type=int, default=20000)
+    args = parser.parse_args()
+
+    import core.db as db
+
+    db.DB_PATH = os.path.join(tempfile.mkdtemp(prefix="wal_check_"), "wal.db")
+    db.init_db()
+    db.exec_query("INSERT INTO clients(name) VALUES ('Teste')", commit=True)
+    conn = db.get_conn()
+    conn.executemany(
+        "INSERT INTO orders(client_id, category, type, product, price_cost, price_sale, status, created_at, updated_at) "
+        "VALUES (1,'Cama','Lençol','Solteiro',?,?,?,?,?)",
+        [(50.0, 80.0 + i % 50, "CRIADO" if i % 3 else "EM_ESTOQUE", db.now_iso(), db.now_iso()) for i in range(args.rows)],
+    )
+    conn.commit()
+    print(f"Banco: {db.DB_PATH} | journal_mode={db.journal_mode()}")
+    limit = args.hold / 4
+    results = []
+
+    # 1. transação EXCLUSIVE em outra conexão
+    writer = sqlite3.connect(db.DB_PATH, timeout=30, isolation_level=None, check_same_thread=False)
+    started = threading.Event()
+
+    def hold_exclusive():
+        writer.execute("BEGIN EXCLUSIVE")
+        writer.execute("UPDATE orders SET price_sale = price_sale + 1 WHERE id % 7 = 0")
+        started.set()
+        time.sleep(args.hold)
+        writer.execute("COMMIT")
+
+    th = threading.Thread(target=hold_exclusive)
+    th.start()
+    started.wait()
+    lat, err = _readers(db, args.readers, args.hold * 0.8)
+    th.join()
+    writer.close()
+    results.append(_report("outra conexão com transação EXCLUSIVE", lat, err, limit))
+
+    # 2. escrita longa pela conexão compartilhada (segura o lock de core.db)
+    started.clear()
+
+    def long_shared_write():
+        with db.hold_conn() as c:
+            started.set()
+            deadline = time.perf_counter() + args.hold
+            while time.perf_counter() < deadline:
+                c.execute("UPDATE orders SET updated_at=? WHERE id % 11 = 0", (db.now_iso(),))
+            c.commit()
+
+    th = threading.Thread(target=long_shared_write)
+    th.start()
+    started.wait()
+    lat, err = _readers(db, args.readers, args.hold * 0.8)
+    th.join()
+    results.append(_report("escrita longa na conexão compartilhada", lat, err, limit))
+
+    # 3. leitura das próprias escritas antes do commit
+    marker = "WAL_CHECK"
+    db.exec_query("INSERT INTO clients(name) VALUES (?)", (marker,))
+    own = db.exec_query("SELECT COUNT(*) AS n FROM clients WHERE name=?", (marker,)).fetchone()["n"]
+    other = []
+    t = threading.Thread(target=lambda: other.append(
+        db.exec_query("SELECT COUNT(*) AS n FROM clients WHERE name=?", (marker,)).fetchone()["n"]))
+    t.start()
+    t.join()
+    conn.commit()
+    after = db.exec_query("SELECT COUNT(*) AS n FROM clients WHERE name=?", (marker,)).fetchone()["n"]
+    ok = own == 1 and after == 1 and (other[0] == 0 or not db._wal)
+    print(f"{'✅' if ok else '❌'} consistência: própria thread vê {own}, outra thread vê {other[0]} antes do commit, {after} depois")
+    results.append(ok)
+
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+r"""
+Teste de carga: várias sessões simuladas de operadores rodando as páginas
+em paralelo, sem navegador (streamlit.testing.v1.AppTest).
+
+Cada sessão percorre a lista de páginas --iterations vezes. Relata, por
+página e no total, latência p50/p95/p99, tempo gasto no banco (exec_query)
+versus renderização e a disputa pelo lock da conexão compartilhada de core/db.
+
+- --mode thread (padrão): sessões em threads do mesmo processo, como o
+  servidor Streamlit (uma conexão compartilhada; mede o lock).
+- --mode process: uma sessão por processo (conexões independentes, como
+  várias réplicas do app).
+
+Backends:
+    SQLite:   python .\.tools\load_test.py --db .\bench.db --sessions 8
+    Postgres: docker run -d -p 5432:5432 -e POSTGRES_PASSWORD=pg postgres:16
+              $env:DATABASE_URL = 'postgresql://postgres:pg@localhost:5432/postgres'
+              python .\.tools\load_test.py --sessions 8
+
+Sem dados no banco, gera um volume com .tools/seed_data.py (--scale).
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+DEFAULT_PAGES = [
+    "app.py",
+    "pages/04_Pedidos.py",
+    "pages/05_Aguardando_Confeccao.py",
+    "pages/06_Pedidos_em_Estoque.py",
+    "pages/07_Pedidos_Nao_Conformes.py",
+    "pages/08_Financeiro.py",
+    "pages/09_Relatorios.py",
+]
+
+_local = threading.local()
+
+# Cada página roda dentro deste invólucro para que o tempo de banco medido na
+# thread do script (o AppTest executa o script em outra thread) volte para a sessão.
+PAGE_WRAPPER = """
+import runpy
+import core.db as _db
+_timer = _db._execute
+_timer.begin()
+try:
+    runpy.run_path({page!r}, run_name="__main__")
+finally:
+    _timer.end({token!r})
+"""
+
+
+def _install_db_timer(db):
+    """Envolve core.db._execute para somar o tempo de banco da thread corrente.
+
+    exec_query resolve _execute pelo módulo a cada chamada, então páginas e
+    serviços que importaram exec_query antes também passam pela medição. A
+    espera pelo lock da conexão fica de fora (é relatada à parte).
+    """
+    if getattr(db._execute, "totals", None) is not None:
+        return db._execute
+    original = db._execute
+
+    def timed(sql, params, commit, conn=None):
+        t0 = time.perf_counter()
+        try:
+            return original(sql, params, commit, conn)
+        finally:
+            _local.db_s = getattr(_local, "db_s", 0.0) + time.perf_counter() - t0
+
+    def begin():
+        _local.db_s = 0.0
+
+    def end(token):
+        timed.totals[token] = getattr(_local, "db_s", 0.0)
+
+    timed.totals = {}
+    timed.begin = begin
+    timed.end = end
+    db._execute = timed
+    return timed
+
+
+def _percentiles(values):
+    if not values:
+        return {"n": 0}
+    values = sorted(values)
+
+    def pct(p):
+        return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+    return {
+        "n": len(values),
+        "p50_ms": round(pct(50) * 1000, 1),
+        "p95_ms": round(pct(95) * 1000, 1),
+        "p99_ms": round(pct(99) * 1000, 1),
+        "max_ms": round(values[-1] * 1000, 1),
+    }
+
+
+def run_session(session_id: int, pages: list, iterations: int, timeout: float, db_path: str | None = None):
+    """Uma sessão de operador: cada página roda num AppTest próprio (estado de sessão novo)."""
+    from streamlit.testing.v1 import AppTest
+    import core.db as db
+
+    if db_path:
+        db.DB_PATH = db_path
+    timer = _install_db_timer(db)
+
+    samples = []
+    for it in range(iterations):
+        for page in pages:
+            token = f"{session_id}:{it}:{page}"
+            script = PAGE_WRAPPER.format(page=os.path.join(ROOT, page), token=token)
+            t0 = time.perf_counter()
+            at = AppTest.from_string(script, default_timeout=timeout)
+            error = None
+            try:
+                at.run()
+                if at.exception:
+                    error = str(at.exception[0].value)[:200]
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"[:200]
+            total = time.perf_counter() - t0
+            samples.append({"session": session_id, "page": page, "total_s": total,
+                            "db_s": timer.totals.pop(token, 0.0), "error": error})
+    return samples
+
+
+def summarize(samples: list, wall_s: float):
+    by_page = {}
+    for s in samples:
+        by_page.setdefault(s["page"], []).append(s)
+
+    def block(items):
+        totals = [s["total_s"] for s in items]
+        db_s = sum(s["db_s"] for s in items)
+        total_s = sum(totals)
+        return {
+            **_percentiles(totals),
+            "db_ms_avg": round(db_s / len(items) * 1000, 1),
+            "render_ms_avg": round((total_s - db_s) / len(items) * 1000, 1),
+            "db_share": round(db_s / total_s, 3) if total_s else 0.0,
+            "errors": sum(1 for s in items if s["error"]),
+        }
+
+    return {
+        "wall_s": round(wall_s, 2),
+        "throughput_pages_s": round(len(samples) / wall_s, 2) if wall_s else 0.0,
+        "overall": block(samples),
+        "pages": {page: block(items) for page, items in by_page.items()},
+        "first_errors": sorted({s["error"] for s in samples if s["error"]})[:5],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="arquivo SQLite (ignorado se DATABASE_URL estiver definida)")
+    parser.add_argument("--scale", type=float, default=0.02, help="volume gerado se o banco estiver vazio")
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--mode", choices=["thread", "process"], default="thread")
+    parser.add_argument("--pages", nargs="*", default=DEFAULT_PAGES)
+    parser.add_argument("--timeout", type=float, default=60.0, help="timeout (s) por execução de página")
+    parser.add_argument("--out", help="arquivo JSON de saída (padrão: stdout)")
+    args = parser.parse_args()
+
+    import core.db as db
+
+    db_path = None
+    if not os.environ.get("DATABASE_URL"):
+        db_path = os.path.abspath(args.db) if args.db else os.path.join(tempfile.mkdtemp(prefix="load_test_"), "load.db")
+        db.DB_PATH = db_path
+    db.init_db()
+    if not db.exec_query("SELECT 1 AS x FROM orders LIMIT 1").fetchone():
+        from seed_data import seed
+        print(f"Gerando dados (scale={args.scale})...", file=sys.stderr)
+        seed(db.get_conn(), args.scale)
+
+    # Aquecimento: executa cada página uma vez (imports, cache de relatórios, init_db do app.py)
+    run_session(-1, args.pages, 1, args.timeout, db_path)
+    db.reset_lock_stats()
+
+    t0 = time.perf_counter()
+    pool_cls = ThreadPoolExecutor if args.mode == "thread" else ProcessPoolExecutor
+    with pool_cls(max_workers=args.sessions) as pool:
+        futures = [pool.submit(run_session, i, args.pages, args.iterations, args.timeout, db_path)
+                   for i in range(args.sessions)]
+        samples = [s for f in futures for s in f.result()]
+    wall = time.perf_counter() - t0
+
+    report = {
+        "backend": "postgres" if db.is_postgres_conn(db.get_conn()) else "sqlite",
+        "mode": args.mode,
+        "sessions": args.sessions,
+        "iterations": args.iterations,
+        **summarize(samples, wall),
+    }
+    if args.mode == "thread":
+        lock = db.lock_stats()
+        report["conn_lock"] = {
+            "acquisitions": lock["acquisitions"],
+            "contended": lock["contended"],
+            "contended_share": round(lock["contended"] / lock["acquisitions"], 3) if lock["acquisitions"] else 0.0,
+            "wait_ms_total": round(lock["wait_s"] * 1000, 1),
+            "wait_ms_max": round(lock["max_wait_s"] * 1000, 1),
+        }
+
+    overall = report["overall"]
+    print(f"{len(samples)} páginas em {wall:.1f}s | p50={overall.get('p50_ms')} ms p95={overall.get('p95_ms')} ms "
+          f"p99={overall.get('p99_ms')} ms | banco={overall['db_share'] * 100:.0f}% | erros={overall['errors']}",
+          file=sys.stderr)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    sys.exit(1 if overall["errors"] else 0)
+
+
+if __name__ == "__main__":
+    main()
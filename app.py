@@ -1,6 +1,19 @@
 import streamlit as st
 from core.db import init_db, get_conn, HAS_PSYCOPG, exec_query
 from core.models import OrderStatus
+from core.status import backfill_status_history
+from services.rollups import ensure_rollups
+from services.quality import ensure_counters
+from services.photos import ensure_order_photos
+from services.clients import ensure_client_search
+from services.order_search import ensure_order_search
+from services.order_specs import ensure_order_specs
+from services.order_listing import ensure_order_listing
+from services.backup import start_auto_backup
+from services.audit_archive import start_audit_maintenance
+from core import metrics
+
+_page = metrics.page_start(__file__)
 
 st.set_page_config(
     page_title="Estoque Exonvais", 
@@ -9,6 +22,17 @@ st.set_page_config(
 )
 
 init_db()
+backfill_status_history()
+ensure_rollups()
+ensure_counters()
+ensure_order_photos()
+ensure_client_search()
+ensure_order_specs()
+ensure_order_search()
+ensure_order_listing()
+metrics.start_exporters()
+start_auto_backup()
+start_audit_maintenance()
 
 # Verificar se estamos no Streamlit Cloud sem PostgreSQL
 import os
@@ -31,14 +55,9 @@ if is_streamlit_cloud and not HAS_PSYCOPG:
 st.title("🧵 Estoque Exonvais — Dashboard")
 
 # KPIs simples (stub)
-criadas = exec_query("SELECT COUNT(*) as c FROM orders WHERE status=?", (OrderStatus.CRIADO,)).fetchone()
-criadas = (criadas['c'] if isinstance(criadas, dict) or hasattr(criadas, 'keys') else (criadas[0] if criadas else 0))
-
-aguard = exec_query("SELECT COUNT(*) as c FROM orders WHERE status=?", (OrderStatus.AGUARDANDO_CONF,)).fetchone()
-aguard = (aguard['c'] if isinstance(aguard, dict) or hasattr(aguard, 'keys') else (aguard[0] if aguard else 0))
-
-estoque = exec_query("SELECT COUNT(*) as c FROM orders WHERE status=?", (OrderStatus.EM_ESTOQUE,)).fetchone()
-estoque = (estoque['c'] if isinstance(estoque, dict) or hasattr(estoque, 'keys') else (estoque[0] if estoque else 0))
+criadas = exec_query("SELECT COUNT(*) as c FROM orders WHERE status=?", (OrderStatus.CRIADO,)).fetchone()['c']
+aguard = exec_query("SELECT COUNT(*) as c FROM orders WHERE status=?", (OrderStatus.AGUARDANDO_CONF,)).fetchone()['c']
+estoque = exec_query("SELECT COUNT(*) as c FROM orders WHERE status=?", (OrderStatus.EM_ESTOQUE,)).fetchone()['c']
 
 col1, col2, col3 = st.columns(3)
 col1.metric("Pedidos Criados", criadas)
@@ -46,3 +65,5 @@ col2.metric("Aguardando Confecção", aguard)
 col3.metric("Em Estoque", estoque)
 
 st.info("Use o menu 'pages' à esquerda para navegar pelas fases.")
+
+metrics.page_finish(_page)
@@ -1,4 +1,159 @@
-from .db import audit as audit_insert
+"""Auditoria (audit_log) com escrita em lote.
+
+`log_change` fora de um lote grava e faz commit na hora (comportamento
+antigo). Dentro de `audit_batch()` as entradas ficam num buffer da thread e
+saem num único `executemany` na transação do chamador, com um só commit ao
+final do bloco:
+
+    with audit_batch():
+        log_change("order", oid, "UPDATE", "price_cost", old, new)
+        log_change("order", oid, "UPDATE", "price_sale", old, new)
+        exec_query("UPDATE orders SET ... WHERE id=?", (..., oid))
+
+Modo assíncrono (EXONVAIS_AUDIT_ASYNC=1): as entradas vão para uma fila
+limitada (QUEUE_MAX; quem audita espera se ela encher) e uma thread as
+grava em lotes pela própria conexão, fora da transação do chamador. O
+commit da ação deixa de esperar pela auditoria; em troca, uma queda do
+processo pode perder as entradas ainda na fila (`flush()` esvazia).
+"""
+import atexit
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from .db import AUDIT_INSERT_SQL, audit_row, exec_many, get_conn, open_conn
+
+ASYNC = os.environ.get("EXONVAIS_AUDIT_ASYNC") == "1"
+QUEUE_MAX = int(os.environ.get("EXONVAIS_AUDIT_QUEUE_MAX", "1000"))
+FLUSH_ROWS = 200        # máximo de entradas por executemany da thread
+FLUSH_WAIT_S = 0.5      # espera por mais entradas antes de gravar um lote parcial
+
+_tls = threading.local()
+_queue = queue.Queue(maxsize=QUEUE_MAX)
+_writer = None
+_writer_lock = threading.Lock()
+
+
+# Campos guardados na auditoria de exclusão de um pedido (o resto é recuperável pelo histórico)
+ORDER_SNAPSHOT_FIELDS = ("client_id", "category", "type", "product", "price_cost", "price_sale", "status", "created_at")
+
+
+def snapshot(row, fields=ORDER_SNAPSHOT_FIELDS) -> dict:
+    """Resumo de uma linha (sqlite3.Row ou dict) para o `before` de uma exclusão."""
+    keys = row.keys()
+    return {f: row[f] for f in fields if f in keys}
+
 
 def log_change(entity, entity_id, action, field=None, before=None, after=None, username="system"):
-    audit_insert(entity, entity_id, action, field, before, after, username)
+    row = audit_row(entity, entity_id, action, field, before, after, username)
+    buffer = getattr(_tls, "buffer", None)
+    if buffer is not None:
+        buffer.append(row)
+    elif ASYNC:
+        _enqueue([row])
+    else:
+        exec_many(AUDIT_INSERT_SQL, [row], commit=True)
+
+
+@contextmanager
+def audit_batch(commit: bool = True):
+    """Agrupa as auditorias do bloco e grava todas de uma vez ao sair.
+
+    commit=True confirma a transação corrente (escritas do bloco + auditoria)
+    num único commit. Lotes aninhados entregam as entradas ao lote de fora,
+    que decide o commit. Se o bloco levantar exceção as entradas são
+    descartadas e a transação é desfeita. Não chame st.rerun() dentro do
+    bloco: ele interrompe o script antes da gravação.
+    """
+    outer = getattr(_tls, "buffer", None)
+    buffer = _tls.buffer = []
+    try:
+        yield buffer
+    except Exception:
+        if outer is None:
+            get_conn().rollback()
+        raise
+    finally:
+        _tls.buffer = outer
+    if outer is not None:
+        outer.extend(buffer)
+        return
+    if ASYNC:
+        _enqueue(buffer)
+        buffer = []
+    exec_many(AUDIT_INSERT_SQL, buffer)
+    if commit:
+        get_conn().commit()
+
+
+# ---------------------------------------------------------------------------
+# Modo assíncrono
+# ---------------------------------------------------------------------------
+
+def _enqueue(rows: list):
+    _start_writer()
+    for row in rows:
+        _queue.put(row)  # bloqueia com a fila cheia: a auditoria nunca é descartada
+
+
+def _start_writer():
+    global _writer
+    if _writer is not None and _writer.is_alive():
+        return
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_writer_loop, name="audit-writer", daemon=True)
+            _writer.start()
+
+
+def _drain(first) -> list:
+    rows = [first]
+    while len(rows) < FLUSH_ROWS:
+        try:
+            rows.append(_queue.get(timeout=FLUSH_WAIT_S if len(rows) == 1 else 0))
+        except queue.Empty:
+            break
+    return rows
+
+
+def _writer_loop():
+    conn = open_conn()
+    while True:
+        rows = _drain(_queue.get())
+        try:
+            try:
+                exec_many(AUDIT_INSERT_SQL, rows, commit=True, conn=conn)
+            except Exception as e:
+                # conexão perdida ou banco ocupado além do timeout: uma nova tentativa com conexão nova
+                print(f"[audit] falha ao gravar {len(rows)} entradas ({e}); tentando de novo")
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+                conn = open_conn()
+                exec_many(AUDIT_INSERT_SQL, rows, commit=True, conn=conn)
+        except Exception as e:
+            print(f"[audit] {len(rows)} entradas perdidas: {e}")
+        finally:
+            for _ in rows:
+                _queue.task_done()
+
+
+def pending() -> int:
+    """Entradas na fila do modo assíncrono ainda não gravadas."""
+    return _queue.unfinished_tasks
+
+
+def flush(timeout: float | None = None) -> bool:
+    """Espera a thread gravar tudo o que está na fila. Retorna False se esgotar `timeout`."""
+    if _writer is None or not _writer.is_alive():
+        return _queue.unfinished_tasks == 0
+    if timeout is None:
+        _queue.join()
+        return True
+    done = threading.Event()
+    threading.Thread(target=lambda: (_queue.join(), done.set()), daemon=True).start()
+    return done.wait(timeout)
+
+
+atexit.register(flush, 5.0)
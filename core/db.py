@@ -1,27 +1,38 @@
-import json, os, datetime
+import json, os, re, datetime, threading, time
+from functools import lru_cache
+from contextlib import contextmanager
 from typing import Any, Dict, Union
 
-# Detectar se estamos em produção (PostgreSQL) ou desenvolvimento (SQLite)
-DATABASE_URL = os.environ.get('DATABASE_URL')
-print(f"🔍 DATABASE_URL presente: {bool(DATABASE_URL)}")
-if DATABASE_URL:
-    print(f"🔍 DATABASE_URL: {DATABASE_URL[:50]}...")  # Log parcial por segurança
+# Importar este módulo não lê o ambiente, não imprime nada e não carrega o
+# psycopg2: o backend (DATABASE_URL → PostgreSQL, senão SQLite) e as opções
+# EXONVAIS_* são resolvidos na primeira conexão (get_conn).
+# HAS_PSYCOPG / DATABASE_URL continuam disponíveis via __getattr__ do módulo.
+psycopg2 = None
+_psycopg_checked = False
+
+
+def _load_psycopg() -> bool:
+    """Importa o psycopg2 (só com DATABASE_URL definida); True se disponível."""
+    global psycopg2, _psycopg_checked
+    if not _psycopg_checked:
+        _psycopg_checked = True
+        if os.environ.get('DATABASE_URL'):
+            try:
+                import psycopg2  # type: ignore
+                import psycopg2.extras  # type: ignore
+            except ImportError as e:
+                # PostgreSQL não disponível, usar SQLite
+                print(f"⚠️ PostgreSQL não disponível: {e}")
+    return psycopg2 is not None
+
+
+def __getattr__(name):
+    if name == "HAS_PSYCOPG":
+        return _load_psycopg()
+    if name == "DATABASE_URL":
+        return os.environ.get('DATABASE_URL')
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-# Importações condicionais - lazy loading
-HAS_PSYCOPG = False
-if DATABASE_URL:
-    try:
-        import psycopg2  # type: ignore
-        import psycopg2.extras  # type: ignore
-        HAS_PSYCOPG = True
-        print("✅ psycopg2 importado com sucesso")
-    except ImportError as e:
-        # PostgreSQL não disponível, usar SQLite
-        HAS_PSYCOPG = False
-        print(f"⚠️ PostgreSQL não disponível: {e}")
-else:
-    print("ℹ️ Sem DATABASE_URL, usando SQLite")
-    HAS_PSYCOPG = False
 
 import sqlite3
 
@@ -31,6 +42,42 @@ DB_PATH = os.path.abspath(DB_PATH)
 # Conexão global (singleton)
 _conn = None
 
+# SQLite: WAL + leitores só-leitura por thread (SELECTs não esperam pelo lock
+# da conexão compartilhada nem por quem está escrevendo)
+SQLITE_WAL = None                    # EXONVAIS_SQLITE_WAL, lido em _load_settings
+SQLITE_BUSY_TIMEOUT_MS = 5000
+SQLITE_MMAP_BYTES = 256 * 1024 * 1024
+SQLITE_CACHE_KB = 64 * 1024          # conexão de escrita
+SQLITE_READER_CACHE_KB = 16 * 1024   # cada conexão de leitura
+_wal = False
+_tls = threading.local()
+
+# A conexão é compartilhada por todas as sessões do Streamlit (threads):
+# exec_query serializa o uso e contabiliza a espera pelo lock.
+_conn_lock = threading.RLock()
+_lock_stats = {"acquisitions": 0, "contended": 0, "wait_s": 0.0, "max_wait_s": 0.0}
+
+# Instrumentação de consultas (core/querystats.py), desligada por padrão;
+# métricas leves de latência (core/metrics.py), ligadas por padrão.
+# None = ainda não lido do ambiente (_load_settings, na primeira conexão)
+_query_stats = None
+_metrics = None
+_instrumented = False
+_settings_loaded = False
+
+
+def _load_settings():
+    """Lê as opções EXONVAIS_* do ambiente (uma vez, antes da primeira conexão)."""
+    global SQLITE_WAL, _query_stats, _metrics, _instrumented, _settings_loaded
+    if _settings_loaded:
+        return
+    _settings_loaded = True
+    SQLITE_WAL = os.environ.get("EXONVAIS_SQLITE_WAL", "1") != "0"
+    if _query_stats is None:    # set_query_stats antes da conexão prevalece
+        _query_stats = os.environ.get("EXONVAIS_QUERY_STATS") == "1"
+    _metrics = os.environ.get("EXONVAIS_METRICS", "1") != "0"
+    _instrumented = _query_stats or _metrics
+
 # Schema para PostgreSQL
 SCHEMA_SQL_PG = """
 CREATE TABLE IF NOT EXISTS clients (
@@ -58,7 +105,7 @@ CREATE TABLE IF NOT EXISTS orders (
   product TEXT NOT NULL,
   price_cost REAL NOT NULL,
   price_sale REAL NOT NULL,
-  notes_struct TEXT DEFAULT '{}',
+  notes_struct JSONB DEFAULT '{}'::jsonb,
   notes_free TEXT DEFAULT '',
   photos TEXT DEFAULT '[]',
   status TEXT NOT NULL,
@@ -99,6 +146,28 @@ CREATE TABLE IF NOT EXISTS finance_entries (
   FOREIGN KEY(order_id) REFERENCES orders(id)
 );
 
+CREATE TABLE IF NOT EXISTS finance_daily (
+  day TEXT NOT NULL,
+  category TEXT NOT NULL,
+  settled INTEGER NOT NULL,
+  entries INTEGER NOT NULL DEFAULT 0,
+  cost REAL NOT NULL DEFAULT 0,
+  sale REAL NOT NULL DEFAULT 0,
+  margin REAL NOT NULL DEFAULT 0,
+  PRIMARY KEY (day, category, settled)
+);
+
+CREATE TABLE IF NOT EXISTS finance_monthly (
+  month TEXT NOT NULL,
+  category TEXT NOT NULL,
+  settled INTEGER NOT NULL,
+  entries INTEGER NOT NULL DEFAULT 0,
+  cost REAL NOT NULL DEFAULT 0,
+  sale REAL NOT NULL DEFAULT 0,
+  margin REAL NOT NULL DEFAULT 0,
+  PRIMARY KEY (month, category, settled)
+);
+
 CREATE TABLE IF NOT EXISTS payment_batches (
   id SERIAL PRIMARY KEY,
   total REAL NOT NULL,
@@ -121,10 +190,83 @@ CREATE TABLE IF NOT EXISTS config (
   key TEXT PRIMARY KEY,
   value TEXT
 );
+
+CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders(created_at);
+CREATE INDEX IF NOT EXISTS idx_finance_entries_created_at ON finance_entries(created_at);
+CREATE INDEX IF NOT EXISTS idx_nonconformities_order ON nonconformities(order_id);
+CREATE INDEX IF NOT EXISTS idx_audit_log_action_ts ON audit_log(action, ts);
+
+CREATE TABLE IF NOT EXISTS order_status_history (
+  id SERIAL PRIMARY KEY,
+  order_id INTEGER NOT NULL,
+  from_status TEXT,
+  to_status TEXT NOT NULL,
+  ts TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_status_history_order_ts ON order_status_history(order_id, ts);
+CREATE INDEX IF NOT EXISTS idx_status_history_to_ts ON order_status_history(to_status, ts);
+
+CREATE TABLE IF NOT EXISTS nc_counters (
+  scope TEXT NOT NULL,
+  scope_key TEXT NOT NULL,
+  kind TEXT NOT NULL,
+  n INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (scope, scope_key, kind)
+);
+
+CREATE TABLE IF NOT EXISTS order_photos (
+  id SERIAL PRIMARY KEY,
+  order_id INTEGER NOT NULL,
+  nc_id INTEGER,
+  url TEXT NOT NULL,
+  thumb_url TEXT,
+  content_hash TEXT,
+  size INTEGER,
+  position INTEGER NOT NULL DEFAULT 0,
+  created_at TEXT NOT NULL,
+  FOREIGN KEY(order_id) REFERENCES orders(id),
+  FOREIGN KEY(nc_id) REFERENCES nonconformities(id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_order_photos_order ON order_photos(order_id, nc_id, position);
+CREATE INDEX IF NOT EXISTS idx_order_photos_nc ON order_photos(nc_id) WHERE nc_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_order_photos_url ON order_photos(url);
+CREATE INDEX IF NOT EXISTS idx_order_photos_hash ON order_photos(content_hash);
+
+-- Auditoria antiga fora da tabela quente (SQLite: movida por idade, PostgreSQL: linhas vindas de uma migração)
+CREATE TABLE IF NOT EXISTS audit_log_archive (
+  id INTEGER PRIMARY KEY,
+  entity TEXT NOT NULL,
+  entity_id INTEGER NOT NULL,
+  action TEXT NOT NULL,
+  field TEXT,
+  before TEXT,
+  after TEXT,
+  username TEXT,
+  ts TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_audit_log_ts ON audit_log(ts, id);
+CREATE INDEX IF NOT EXISTS idx_audit_log_archive_ts ON audit_log_archive(ts, id);
+
+CREATE INDEX IF NOT EXISTS idx_audit_log_entity ON audit_log(entity, entity_id, ts, id);
+CREATE INDEX IF NOT EXISTS idx_audit_log_username ON audit_log(username, ts, id);
+CREATE INDEX IF NOT EXISTS idx_audit_log_archive_entity ON audit_log_archive(entity, entity_id, ts, id);
+CREATE INDEX IF NOT EXISTS idx_audit_log_archive_action ON audit_log_archive(action, ts, id);
+CREATE INDEX IF NOT EXISTS idx_audit_log_archive_username ON audit_log_archive(username, ts, id);
+
+CREATE INDEX IF NOT EXISTS idx_orders_client ON orders(client_id, status);
+CREATE INDEX IF NOT EXISTS idx_clients_status ON clients(status, id);
+
+CREATE INDEX IF NOT EXISTS idx_finance_entries_order ON finance_entries(order_id, settled);
 """
 
 # Schema para SQLite
+# auto_vacuum só vale para bancos novos; nos existentes é ativado por
+# services.backup.enable_incremental_vacuum (um VACUUM completo, uma vez)
 SCHEMA_SQL_SQLITE = """
+PRAGMA auto_vacuum = INCREMENTAL;
+
 CREATE TABLE IF NOT EXISTS clients (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   name TEXT NOT NULL,
@@ -191,6 +333,28 @@ CREATE TABLE IF NOT EXISTS finance_entries (
   FOREIGN KEY(order_id) REFERENCES orders(id)
 );
 
+CREATE TABLE IF NOT EXISTS finance_daily (
+  day TEXT NOT NULL,
+  category TEXT NOT NULL,
+  settled INTEGER NOT NULL,
+  entries INTEGER NOT NULL DEFAULT 0,
+  cost REAL NOT NULL DEFAULT 0,
+  sale REAL NOT NULL DEFAULT 0,
+  margin REAL NOT NULL DEFAULT 0,
+  PRIMARY KEY (day, category, settled)
+);
+
+CREATE TABLE IF NOT EXISTS finance_monthly (
+  month TEXT NOT NULL,
+  category TEXT NOT NULL,
+  settled INTEGER NOT NULL,
+  entries INTEGER NOT NULL DEFAULT 0,
+  cost REAL NOT NULL DEFAULT 0,
+  sale REAL NOT NULL DEFAULT 0,
+  margin REAL NOT NULL DEFAULT 0,
+  PRIMARY KEY (month, category, settled)
+);
+
 CREATE TABLE IF NOT EXISTS payment_batches (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   total REAL NOT NULL,
@@ -213,35 +377,325 @@ CREATE TABLE IF NOT EXISTS config (
   key TEXT PRIMARY KEY,
   value TEXT
 );
+
+CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders(created_at);
+CREATE INDEX IF NOT EXISTS idx_finance_entries_created_at ON finance_entries(created_at);
+CREATE INDEX IF NOT EXISTS idx_nonconformities_order ON nonconformities(order_id);
+CREATE INDEX IF NOT EXISTS idx_audit_log_action_ts ON audit_log(action, ts);
+
+CREATE TABLE IF NOT EXISTS order_status_history (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  order_id INTEGER NOT NULL,
+  from_status TEXT,
+  to_status TEXT NOT NULL,
+  ts TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_status_history_order_ts ON order_status_history(order_id, ts);
+CREATE INDEX IF NOT EXISTS idx_status_history_to_ts ON order_status_history(to_status, ts);
+
+CREATE TABLE IF NOT EXISTS nc_counters (
+  scope TEXT NOT NULL,
+  scope_key TEXT NOT NULL,
+  kind TEXT NOT NULL,
+  n INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (scope, scope_key, kind)
+);
+
+CREATE TABLE IF NOT EXISTS order_photos (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  order_id INTEGER NOT NULL,
+  nc_id INTEGER,
+  url TEXT NOT NULL,
+  thumb_url TEXT,
+  content_hash TEXT,
+  size INTEGER,
+  position INTEGER NOT NULL DEFAULT 0,
+  created_at TEXT NOT NULL,
+  FOREIGN KEY(order_id) REFERENCES orders(id),
+  FOREIGN KEY(nc_id) REFERENCES nonconformities(id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_order_photos_order ON order_photos(order_id, nc_id, position);
+CREATE INDEX IF NOT EXISTS idx_order_photos_nc ON order_photos(nc_id) WHERE nc_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_order_photos_url ON order_photos(url);
+CREATE INDEX IF NOT EXISTS idx_order_photos_hash ON order_photos(content_hash);
+
+-- Auditoria antiga fora da tabela quente (SQLite: movida por idade, PostgreSQL: linhas vindas de uma migração)
+CREATE TABLE IF NOT EXISTS audit_log_archive (
+  id INTEGER PRIMARY KEY,
+  entity TEXT NOT NULL,
+  entity_id INTEGER NOT NULL,
+  action TEXT NOT NULL,
+  field TEXT,
+  before TEXT,
+  after TEXT,
+  username TEXT,
+  ts TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_audit_log_ts ON audit_log(ts, id);
+CREATE INDEX IF NOT EXISTS idx_audit_log_archive_ts ON audit_log_archive(ts, id);
+
+CREATE INDEX IF NOT EXISTS idx_audit_log_entity ON audit_log(entity, entity_id, ts, id);
+CREATE INDEX IF NOT EXISTS idx_audit_log_username ON audit_log(username, ts, id);
+CREATE INDEX IF NOT EXISTS idx_audit_log_archive_entity ON audit_log_archive(entity, entity_id, ts, id);
+CREATE INDEX IF NOT EXISTS idx_audit_log_archive_action ON audit_log_archive(action, ts, id);
+CREATE INDEX IF NOT EXISTS idx_audit_log_archive_username ON audit_log_archive(username, ts, id);
+
+CREATE INDEX IF NOT EXISTS idx_orders_client ON orders(client_id, status);
+CREATE INDEX IF NOT EXISTS idx_clients_status ON clients(status, id);
+
+CREATE INDEX IF NOT EXISTS idx_finance_entries_order ON finance_entries(order_id, settled);
 """
 
+def _open_sqlite(readonly: bool = False):
+    """Conexão SQLite com os PRAGMAs do app (WAL, synchronous, timeouts, caches).
+
+    A conexão de escrita é a compartilhada (`_conn`); as de leitura
+    (`readonly=True`) são abertas por thread em modo só-leitura e, com WAL,
+    não esperam por quem está escrevendo.
+    """
+    global _wal
+    if readonly:
+        conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_BYTES}")
+    conn.execute(f"PRAGMA cache_size = -{SQLITE_READER_CACHE_KB if readonly else SQLITE_CACHE_KB}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    if not readonly:
+        # só vale em banco novo (antes da primeira tabela); trocar journal_mode já grava o cabeçalho
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        if SQLITE_WAL:
+            mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+            _wal = str(mode).lower() == "wal"
+        # Em WAL, NORMAL só perde as últimas transações numa queda de energia, nunca corrompe
+        conn.execute("PRAGMA synchronous = NORMAL" if _wal else "PRAGMA synchronous = FULL")
+    return conn
+
+
 def get_conn() -> Any:
     global _conn
     if _conn is None:
-        if HAS_PSYCOPG and DATABASE_URL:
+        _load_settings()
+        if _load_psycopg():
             try:
                 # PostgreSQL
-                _conn = psycopg2.connect(DATABASE_URL, cursor_factory=psycopg2.extras.RealDictCursor)
+                _conn = _connect_postgres()
                 print("✅ BACKEND ESCOLHIDO: PostgreSQL (produção)")
             except Exception as e:
                 print(f"⚠️ Falha na conexão PostgreSQL: {e}")
                 print("🔄 Fazendo fallback para SQLite")
                 # Fallback para SQLite se PostgreSQL falhar
-                _conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-                _conn.row_factory = sqlite3.Row
+                _conn = _open_sqlite()
                 print("✅ BACKEND ESCOLHIDO: SQLite (fallback)")
         else:
             # SQLite (desenvolvimento)
-            _conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-            _conn.row_factory = sqlite3.Row
+            _conn = _open_sqlite()
             print("✅ BACKEND ESCOLHIDO: SQLite (desenvolvimento)")
+        _set_dialect(_conn)
     return _conn
 
 
+def journal_mode() -> str:
+    """Modo de journal do SQLite em uso ('wal', 'delete', ...) ou 'postgres'."""
+    conn = get_conn()
+    if is_postgres_conn(conn):
+        return "postgres"
+    with hold_conn():
+        return str(conn.execute("PRAGMA journal_mode").fetchone()[0]).lower()
+
+
+def _reader():
+    """Conexão só-leitura da thread, ou None quando a leitura deve ir pela conexão compartilhada.
+
+    Vai pela compartilhada sem WAL, no PostgreSQL e quando esta thread
+    escreveu algo ainda não confirmado (para ler as próprias escritas).
+    """
+    if not _wal or _conn is None:
+        return None
+    if getattr(_tls, "wrote", False):
+        if _conn.in_transaction:
+            return None
+        _tls.wrote = False
+    conn = getattr(_tls, "reader", None)
+    if conn is None:
+        conn = _tls.reader = _open_sqlite(readonly=True)
+    return conn
+
+
 def is_postgres_conn(conn) -> bool:
     """Verifica se a conexão é PostgreSQL ou SQLite"""
-    # Verifica se é uma conexão psycopg2 (PostgreSQL)
-    return str(type(conn)).startswith("<class 'psycopg2")
+    # só existem os dois backends: o que não é sqlite3 é psycopg2
+    return not isinstance(conn, sqlite3.Connection)
+
+
+# ---------------------------------------------------------------------------
+# Dialeto: o que muda entre os backends, resolvido uma vez na conexão
+# ---------------------------------------------------------------------------
+
+class Dialect:
+    """Backend em uso. O SQL do app é escrito uma vez, com `?`; `sql()` o adapta ao driver."""
+
+    __slots__ = ("name", "is_postgres")
+
+    def __init__(self, name: str, is_postgres: bool):
+        self.name = name
+        self.is_postgres = is_postgres
+
+    def sql(self, sql: str) -> str:
+        return pg_sql(sql) if self.is_postgres else sql
+
+    def __repr__(self):
+        return f"Dialect({self.name!r})"
+
+
+SQLITE = Dialect("sqlite", False)
+POSTGRES = Dialect("postgres", True)
+_dialect = None
+
+
+def _set_dialect(conn):
+    global _dialect
+    _dialect = POSTGRES if is_postgres_conn(conn) else SQLITE
+
+
+def dialect() -> Dialect:
+    """Dialeto da conexão compartilhada (abre a conexão se preciso)."""
+    if _conn is None:
+        get_conn()
+    return _dialect
+
+
+# Literais, identificadores entre aspas, corpos $tag$...$tag$ e comentários
+# passam inteiros; fora deles `?` é placeholder. O psycopg2 formata o texto
+# todo com `%`, então todo `%` (LIKE '%x%', operador % do pg_trgm) é dobrado.
+_SQL_TOKEN = re.compile(
+    r"""'(?:[^']|'')*'|"(?:[^"]|"")*"|(\$\w*\$).*?\1|--[^\n]*|/\*.*?\*/|\?""",
+    re.S,
+)
+
+
+@lru_cache(maxsize=2048)
+def pg_sql(sql: str) -> str:
+    """SQL com `?` → SQL para o psycopg2 (`%s`, `%` literal como `%%`). Em cache por texto."""
+    if "?" not in sql:
+        return sql.replace("%", "%%")
+    return _SQL_TOKEN.sub(lambda m: "%s" if m.group() == "?" else m.group(), sql.replace("%", "%%"))
+
+
+class Row(tuple):
+    """Linha do PostgreSQL com a interface do sqlite3.Row (o que o SQLite entrega).
+
+    Tupla dos valores (r[0], iteração, len, ==) com acesso por nome (r['col']),
+    keys() e portanto dict(r) / {**r}. Uma subclasse por conjunto de colunas
+    guarda o índice dos nomes; nome repetido (o.*, c.*) devolve o primeiro.
+    """
+
+    __slots__ = ()
+    _keys = ()
+    _index = {}
+
+    def __getitem__(self, key):
+        if key.__class__ is str:
+            try:
+                key = self._index[key]
+            except KeyError:
+                raise IndexError(f"No item with that key: {key!r}") from None
+        return tuple.__getitem__(self, key)
+
+    def keys(self) -> list:
+        return list(self._keys)
+
+    def __repr__(self):
+        return f"<Row {dict(self)!r}>"
+
+    def __reduce__(self):
+        return _make_row, (self._keys, tuple(self))
+
+
+@lru_cache(maxsize=512)
+def row_type(keys: tuple) -> type:
+    """Subclasse de Row para as colunas `keys` (uma por SELECT distinto)."""
+    index = {}
+    for i, key in enumerate(keys):
+        index.setdefault(key, i)
+    return type("Row", (Row,), {"__slots__": (), "_keys": keys, "_index": index})
+
+
+def _make_row(keys: tuple, values: tuple) -> Row:
+    return row_type(keys)(values)
+
+
+_row_cursor = None
+
+
+def _row_cursor_class():
+    """Cursor psycopg2 que entrega Row (criado na primeira conexão PostgreSQL)."""
+    global _row_cursor
+    if _row_cursor is None:
+        base = psycopg2.extensions.cursor
+
+        class RowCursor(base):
+            def _row_type(self):
+                return row_type(tuple(d[0] for d in self.description))
+
+            def fetchone(self):
+                values = base.fetchone(self)
+                return None if values is None else self._row_type()(values)
+
+            def fetchmany(self, size=None):
+                rows = base.fetchmany(self, self.arraysize if size is None else size)
+                if not rows:
+                    return []
+                make = self._row_type()
+                return [make(v) for v in rows]
+
+            def fetchall(self):
+                rows = base.fetchall(self)
+                if not rows:
+                    return []
+                make = self._row_type()
+                return [make(v) for v in rows]
+
+            def __iter__(self):
+                while True:
+                    rows = self.fetchmany(self.itersize)
+                    if not rows:
+                        return
+                    yield from rows
+
+        _row_cursor = RowCursor
+    return _row_cursor
+
+
+def _connect_postgres():
+    return psycopg2.connect(os.environ['DATABASE_URL'], cursor_factory=_row_cursor_class())
+
+
+# Colunas renomeadas desde versões antigas do schema: (tabela, nome antigo, nome novo)
+LEGACY_RENAMES = (
+    ("audit_log", "user", "username"),
+    ("audit_log_archive", "user", "username"),
+)
+
+
+def _rename_legacy_columns(conn):
+    """Renomeia as colunas de bancos antigos antes do schema criar índices com os nomes novos."""
+    cursor = conn.cursor()
+    for table, old, new in LEGACY_RENAMES:
+        if is_postgres_conn(conn):
+            cursor.execute(f"SELECT column_name FROM information_schema.columns WHERE table_name = '{table}'")
+        else:
+            cursor.execute(f"SELECT name FROM pragma_table_info('{table}')")
+        columns = {r[0] for r in cursor.fetchall()}
+        if old in columns and new not in columns:
+            print(f"🔄 Renomeando {table}.{old} para {new}")
+            cursor.execute(f'ALTER TABLE {table} RENAME COLUMN "{old}" TO {new}')
+    cursor.close()
 
 
 def init_db():
@@ -250,6 +704,7 @@ def init_db():
     if is_postgres_conn(conn):
         # PostgreSQL - executar cada statement separadamente
         try:
+            _rename_legacy_columns(conn)
             cursor = conn.cursor()
             # Dividir o schema em statements individuais
             statements = [stmt.strip() for stmt in SCHEMA_SQL_PG.split(';') if stmt.strip()]
@@ -264,14 +719,16 @@ def init_db():
             print(f"❌ Erro ao executar schema PostgreSQL: {e}")
             # Fallback para SQLite se schema PostgreSQL falhar
             print("🔄 Fazendo fallback para SQLite")
-            sqlite_conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-            sqlite_conn.row_factory = sqlite3.Row
+            sqlite_conn = _open_sqlite()
+            _rename_legacy_columns(sqlite_conn)
             sqlite_conn.executescript(SCHEMA_SQL_SQLITE)
             sqlite_conn.commit()
             global _conn
             _conn = sqlite_conn
+            _set_dialect(_conn)
     else:
         # SQLite
+        _rename_legacy_columns(conn)
         conn.executescript(SCHEMA_SQL_SQLITE)  # type: ignore
         conn.commit()
         print("✅ Schema SQLite criado/atualizado")
@@ -287,54 +744,40 @@ def to_json(obj):
 
 
 def from_json(txt, default):
+    if isinstance(txt, (dict, list)):
+        return txt      # JSONB no PostgreSQL: o driver já entrega decodificado
     try:
         return json.loads(txt) if txt else default
     except Exception:
         return default
 
 
-def audit(entity: str, entity_id: int, action: str, field: str | None = None, before: Any = None, after: Any = None, username: str = "system"):
-    conn = get_conn()
-    is_pg = is_postgres_conn(conn)
+def order_specs(row) -> dict:
+    """Especificações (notes_struct) de um pedido como dict, em qualquer backend."""
+    specs = from_json(row['notes_struct'], {})
+    return specs if isinstance(specs, dict) else {}
+
+
+AUDIT_INSERT_SQL = "INSERT INTO audit_log(entity, entity_id, action, field, before, after, username, ts) VALUES (?,?,?,?,?,?,?,?)"
+
+
+def audit_row(entity: str, entity_id: int, action: str, field: str | None = None, before: Any = None, after: Any = None, username: str = "system") -> tuple:
+    """Parâmetros de AUDIT_INSERT_SQL para uma entrada (valores em JSON, ts de agora)."""
     before_json = to_json(before) if before is not None else None
     after_json = to_json(after) if after is not None else None
-    
-    if is_pg:
-        cursor = conn.cursor()
-        cursor.execute(
-          "INSERT INTO audit_log(entity, entity_id, action, field, before, after, username, ts) VALUES (%s,%s,%s,%s,%s,%s,%s,%s)",
-          (entity, entity_id, action, field, before_json, after_json, username, now_iso())
-        )
-        conn.commit()
-        cursor.close()
-    else:
-        conn.execute(  # type: ignore
-          "INSERT INTO audit_log(entity, entity_id, action, field, before, after, username, ts) VALUES (?,?,?,?,?,?,?,?)",
-          (entity, entity_id, action, field, before_json, after_json, username, now_iso())
-        )
-        conn.commit()  # type: ignore
+    return (entity, entity_id, action, field, before_json, after_json, username, now_iso())
+
+
+def audit(entity: str, entity_id: int, action: str, field: str | None = None, before: Any = None, after: Any = None, username: str = "system", commit: bool = True):
+    exec_query(AUDIT_INSERT_SQL, audit_row(entity, entity_id, action, field, before, after, username), commit=commit)
 
 
 def load_config(key: str, default: Any):
     """Carrega configuração do banco (centralizado)"""
-    conn = get_conn()
-    is_pg = is_postgres_conn(conn)
-
-    if is_pg:
-        # PostgreSQL
-        cursor = conn.cursor()
-        cursor.execute("CREATE TABLE IF NOT EXISTS config (key TEXT PRIMARY KEY, value TEXT)")
-        cursor.execute("SELECT value FROM config WHERE key=%s", (key,))
-        row = cursor.fetchone()
-        cursor.close()
-    else:
-        # SQLite
-        conn.execute("CREATE TABLE IF NOT EXISTS config (key TEXT PRIMARY KEY, value TEXT)")  # type: ignore
-        cur = conn.execute("SELECT value FROM config WHERE key=?", (key,))  # type: ignore
-        row = cur.fetchone()
-
+    exec_query("CREATE TABLE IF NOT EXISTS config (key TEXT PRIMARY KEY, value TEXT)")
+    row = exec_query("SELECT value FROM config WHERE key=?", (key,)).fetchone()
     if row:
-        return from_json(row['value'] if is_pg else row[0], default)
+        return from_json(row[0], default)
     else:
         # Se não existe, salva o padrão
         save_config(key, default)
@@ -343,40 +786,187 @@ def load_config(key: str, default: Any):
 
 def save_config(key: str, value: Any):
     """Salva configuração no banco (centralizado)"""
-    conn = get_conn()
-    is_pg = is_postgres_conn(conn)
-    if is_pg:
-        # PostgreSQL - usar ON CONFLICT
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO config(key, value) VALUES (%s,%s)
-            ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value
-        """, (key, to_json(value)))
-        conn.commit()
-        cursor.close()
-    else:
-        # SQLite
-        conn.execute("INSERT OR REPLACE INTO config(key, value) VALUES (?,?)", (key, to_json(value)))  # type: ignore
-        conn.commit()  # type: ignore
+    exec_query(
+        "INSERT INTO config(key, value) VALUES (?,?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+        (key, to_json(value)), commit=True,
+    )
+
+
+def _acquire_conn():
+  """Adquire o lock da conexão; só mede o tempo quando há disputa."""
+  if _conn_lock.acquire(blocking=False):
+    _lock_stats["acquisitions"] += 1
+    return
+  t0 = time.perf_counter()
+  _conn_lock.acquire()
+  waited = time.perf_counter() - t0
+  _lock_stats["acquisitions"] += 1
+  _lock_stats["contended"] += 1
+  _lock_stats["wait_s"] += waited
+  if waited > _lock_stats["max_wait_s"]:
+    _lock_stats["max_wait_s"] = waited
+
+
+def lock_stats() -> dict:
+  """Contadores do lock da conexão: aquisições, disputas e tempo de espera (s)."""
+  with _conn_lock:
+    return dict(_lock_stats)
+
+
+def reset_lock_stats():
+  with _conn_lock:
+    _lock_stats.update(acquisitions=0, contended=0, wait_s=0.0, max_wait_s=0.0)
+
+
+@contextmanager
+def hold_conn():
+  """Uso exclusivo da conexão compartilhada (manutenção: backup, vacuum)."""
+  _acquire_conn()
+  try:
+    yield get_conn()
+  finally:
+    _conn_lock.release()
+
+
+def pause_conn(seconds: float):
+  """Dentro de hold_conn: solta a conexão por `seconds` para as outras sessões."""
+  _conn_lock.release()
+  try:
+    time.sleep(seconds)
+  finally:
+    _acquire_conn()
 
 
-def exec_query(sql: str, params: tuple | list | None = None, commit: bool = False):
+def exec_query(sql: str, params: tuple | list | None = None, commit: bool = False, conn=None):
   """Execute uma query abstrata que funciona em SQLite e PostgreSQL.
 
-  - Em PostgreSQL usa `cursor.execute()` e converte placeholders `?` → `%s`.
+  - Em PostgreSQL usa `cursor.execute()` com o SQL traduzido por `pg_sql` (em cache).
   - Em SQLite usa `conn.execute()` com `?`.
-  Retorna o cursor/result proxy (tem `fetchall()` / `fetchone()`).
+  - SQLite em WAL: SELECTs vão por uma conexão só-leitura da thread, sem o lock.
+  - `conn`: conexão própria (ver open_conn); roda nela, sem o lock da compartilhada.
+  Retorna o cursor (`fetchall()` / `fetchone()`); as linhas são sqlite3.Row ou Row,
+  com a mesma interface: r[0], r['col'], keys(), dict(r).
   """
-  conn = get_conn()
+  if conn is not None:
+    return _execute(sql, params, commit, conn)
+  if _conn is None:
+    get_conn()    # resolve backend e opções antes de olhar _wal / _instrumented
+  if _wal and not commit and sql.lstrip()[:6].upper() == "SELECT":
+    reader = _reader()
+    if reader is not None:
+      if not _instrumented:
+        return _execute(sql, params, commit, reader)
+      return _execute_instrumented(sql, params, commit, reader)
+  _acquire_conn()
+  try:
+    if not _instrumented:
+      return _execute(sql, params, commit)
+    return _execute_instrumented(sql, params, commit)
+  finally:
+    _conn_lock.release()
+
+
+def exec_many(sql: str, seq_params, commit: bool = False, conn=None):
+  """executemany com `?` nos dois backends. Retorna o número de linhas enviadas.
+
+  Sem `conn` usa a conexão compartilhada (na transação do chamador).
+  """
+  rows = [tuple(p) for p in seq_params]
+  if not rows:
+    return 0
+  if conn is not None:
+    _executemany(conn, sql, rows, commit)
+    return len(rows)
+  _acquire_conn()
+  try:
+    _executemany(get_conn(), sql, rows, commit)
+  finally:
+    _conn_lock.release()
+  return len(rows)
+
+
+def _executemany(conn, sql: str, rows: list, commit: bool):
+  is_pg = is_postgres_conn(conn)
+  cur = conn.cursor()
+  try:
+    cur.executemany(pg_sql(sql) if is_pg else sql, rows)
+    if commit:
+      conn.commit()
+    elif not is_pg and conn is _conn and conn.in_transaction:
+      _tls.wrote = True
+  except Exception:
+    try:
+      conn.rollback()
+    except Exception:
+      pass
+    raise
+  finally:
+    cur.close()
+
+
+def open_conn() -> Any:
+  """Conexão nova e independente, no mesmo backend da compartilhada.
+
+  Para threads de segundo plano que precisam da própria transação
+  (o commit delas não pode levar junto o trabalho pela metade das sessões).
+  """
+  if dialect().is_postgres:
+    return _connect_postgres()
+  return _open_sqlite()
+
+
+def exec_insert(sql: str, params: tuple | list | None = None):
+  """INSERT que devolve o id gerado (RETURNING id no PostgreSQL, lastrowid no SQLite).
+
+  Não faz commit: roda na transação do chamador.
+  """
+  if dialect().is_postgres:
+    row = exec_query(f"{sql.rstrip().rstrip(';')} RETURNING id", params).fetchone()
+    return row['id'] if row else None
+  return exec_query(sql, params).lastrowid
+
+
+def set_query_stats(enabled: bool):
+  """Liga/desliga a instrumentação de exec_query para o processo todo."""
+  global _query_stats, _instrumented
+  _query_stats = bool(enabled)
+  _instrumented = _query_stats or bool(_metrics)
+
+
+def query_stats_enabled() -> bool:
+  return bool(_query_stats)
+
+
+def _execute_instrumented(sql: str, params, commit: bool, conn=None):
+  from core import querystats, metrics
+  t0 = time.perf_counter()
+  try:
+    cur = _execute(sql, params, commit, conn)
+  except Exception:
+    elapsed = time.perf_counter() - t0
+    if _metrics:
+      metrics.record_query(elapsed, error=True)
+    if _query_stats:
+      querystats.record(sql, elapsed, error=True)
+    raise
+  elapsed = time.perf_counter() - t0
+  if _metrics:
+    metrics.record_query(elapsed)
+  if _query_stats:
+    return querystats.CountingCursor(cur, querystats.record(sql, elapsed))
+  return cur
+
+
+def _execute(sql: str, params: tuple | list | None, commit: bool, conn=None):
+  if conn is None:
+    conn = get_conn()
   is_pg = is_postgres_conn(conn)
   params = tuple(params or ())
 
   if is_pg:
     cur = conn.cursor()
-    if "?" in sql:
-      sql = sql.replace("?", "%s")
     try:
-      cur.execute(sql, params)
+      cur.execute(pg_sql(sql), params)
       if commit:
         conn.commit()
       return cur
@@ -394,6 +984,8 @@ def exec_query(sql: str, params: tuple | list | None = None, commit: bool = Fals
     cur = conn.execute(sql, params)  # type: ignore
     if commit:
       conn.commit()  # type: ignore
+    elif conn is _conn and conn.in_transaction:
+      _tls.wrote = True  # leituras seguintes desta thread vêm pela mesma conexão
     return cur
   except Exception:
     try:
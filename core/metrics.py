@@ -0,0 +1,322 @@
+"""Registro leve de métricas do processo (contadores, gauges e timers).
+
+Quem escreve: core.db (consultas), core.storage (uploads), services.motores
+(PDFs), services.reports (cache) e as páginas (page_start/page_finish).
+Quem lê: a aba Desempenho da Administração e o export Prometheus.
+
+Export em formato texto do Prometheus:
+- EXONVAIS_METRICS_FILE=/caminho/metrics.prom → regravado a cada
+  EXONVAIS_METRICS_INTERVAL segundos (padrão 15), p/ node_exporter textfile;
+- EXONVAIS_METRICS_PORT=9109 → endpoint HTTP /metrics.
+
+Desligado com EXONVAIS_METRICS=0.
+"""
+import functools
+import os
+import threading
+import time
+
+ENABLED = os.environ.get("EXONVAIS_METRICS", "1") != "0"
+
+# Limites (s) dos baldes dos timers
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_counters = {}   # (nome, labels) → valor
+_gauges = {}     # (nome, labels) → valor
+_timers = {}     # (nome, labels) → {'count', 'sum', 'max', 'buckets'}
+_help = {}
+_collectors = []
+_tls = threading.local()
+_exporters_started = False
+
+
+def _key(name: str, labels: dict):
+    return name, tuple(sorted(labels.items()))
+
+
+def describe(name: str, text: str):
+    _help[name] = text
+
+
+def inc(name: str, value: float = 1, **labels):
+    if not ENABLED:
+        return
+    k = _key(name, labels)
+    with _lock:
+        _counters[k] = _counters.get(k, 0) + value
+
+
+def set_gauge(name: str, value: float, **labels):
+    if not ENABLED:
+        return
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name: str, seconds: float, **labels):
+    if not ENABLED:
+        return
+    k = _key(name, labels)
+    with _lock:
+        t = _timers.get(k)
+        if t is None:
+            t = _timers[k] = {"count": 0, "sum": 0.0, "max": 0.0, "buckets": [0] * len(BUCKETS)}
+        t["count"] += 1
+        t["sum"] += seconds
+        if seconds > t["max"]:
+            t["max"] = seconds
+        for i, limit in enumerate(BUCKETS):
+            if seconds <= limit:
+                t["buckets"][i] += 1
+                break
+
+
+class timer:
+    """Mede um bloco (`with metrics.timer(...)`) ou uma função (`@metrics.timer(...)`)."""
+
+    def __init__(self, name: str, **labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.name, time.perf_counter() - self._t0, **self.labels)
+        if exc_type is not None:
+            inc(f"{self.name.rsplit('_seconds', 1)[0]}_errors_total", **self.labels)
+        return False
+
+    def __call__(self, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(self.name, **self.labels):
+                return fn(*args, **kwargs)
+        return wrapper
+
+
+def register_collector(fn):
+    """fn() → [(nome, tipo 'gauge'|'counter', valor, labels)], lido na exportação."""
+    _collectors.append(fn)
+    return fn
+
+
+# ---------------------------------------------------------------------------
+# Consultas e páginas
+# ---------------------------------------------------------------------------
+
+def record_query(seconds: float, error: bool = False):
+    """Chamado por core.db.exec_query a cada execução."""
+    observe("db_query_seconds", seconds)
+    if error:
+        inc("db_query_errors_total")
+    if getattr(_tls, "page", None) is not None:
+        _tls.queries += 1
+        _tls.db_s += seconds
+
+
+def page_start(page: str):
+    """Início da execução (rerun) de uma página; `page` pode ser o __file__ do script."""
+    name = os.path.splitext(os.path.basename(page))[0]
+    _tls.page = name
+    _tls.queries = 0
+    _tls.db_s = 0.0
+    return name, time.perf_counter()
+
+
+def page_finish(token):
+    """Fim da execução: tempo total, tempo no banco e consultas por rerun.
+
+    Execuções interrompidas por st.stop()/st.rerun() não chegam aqui e não
+    entram na média.
+    """
+    name, t0 = token
+    elapsed = time.perf_counter() - t0
+    observe("page_render_seconds", elapsed, page=name)
+    observe("page_db_seconds", getattr(_tls, "db_s", 0.0), page=name)
+    inc("page_queries_total", getattr(_tls, "queries", 0), page=name)
+    _tls.page = None
+
+
+# ---------------------------------------------------------------------------
+# Coletores padrão
+# ---------------------------------------------------------------------------
+
+def rss_bytes() -> int | None:
+    """Memória residente do processo (psutil se disponível; /proc no Linux)."""
+    try:
+        import psutil  # type: ignore
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # pico, em KB no Linux
+    except ImportError:
+        return None
+
+
+@register_collector
+def _process_metrics():
+    rss = rss_bytes()
+    return [("process_resident_memory_bytes", "gauge", rss, {})] if rss is not None else []
+
+
+@register_collector
+def _db_lock_metrics():
+    from core.db import lock_stats
+    s = lock_stats()
+    return [
+        ("db_conn_lock_acquisitions_total", "counter", s["acquisitions"], {}),
+        ("db_conn_lock_contended_total", "counter", s["contended"], {}),
+        ("db_conn_lock_wait_seconds_total", "counter", s["wait_s"], {}),
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Leitura e exportação
+# ---------------------------------------------------------------------------
+
+def snapshot():
+    """Cópia de tudo: {'counters': {...}, 'gauges': {...}, 'timers': {...}} com chaves (nome, labels)."""
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        timers = {k: dict(v, buckets=list(v["buckets"])) for k, v in _timers.items()}
+    for collect in _collectors:
+        try:
+            for name, kind, value, labels in collect():
+                (counters if kind == "counter" else gauges)[_key(name, labels)] = value
+        except Exception as e:
+            print(f"[metrics] coletor falhou: {e}")
+    return {"counters": counters, "gauges": gauges, "timers": timers}
+
+
+def timer_summary(name: str):
+    """[{labels..., count, avg_ms, max_ms, total_ms}] de um timer, por conjunto de labels."""
+    rows = []
+    for (n, labels), t in snapshot()["timers"].items():
+        if n == name and t["count"]:
+            rows.append({**dict(labels), "count": t["count"], "avg_ms": t["sum"] / t["count"] * 1000,
+                         "max_ms": t["max"] * 1000, "total_ms": t["sum"] * 1000})
+    return sorted(rows, key=lambda r: r["total_ms"], reverse=True)
+
+
+def counter_value(name: str, **labels) -> float:
+    return snapshot()["counters"].get(_key(name, labels), 0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def to_prometheus() -> str:
+    """Métricas no formato texto do Prometheus (prefixo exonvais_)."""
+    snap = snapshot()
+    lines = []
+    typed = set()
+
+    def header(name, kind):
+        if name not in typed:
+            typed.add(name)
+            if name in _help:
+                lines.append(f"# HELP exonvais_{name} {_help[name]}")
+            lines.append(f"# TYPE exonvais_{name} {kind}")
+
+    for kind, values in (("counter", snap["counters"]), ("gauge", snap["gauges"])):
+        for (name, labels), value in sorted(values.items()):
+            header(name, kind)
+            lines.append(f"exonvais_{name}{_fmt_labels(labels)} {value}")
+    for (name, labels), t in sorted(snap["timers"].items()):
+        header(name, "histogram")
+        cumulative = 0
+        for limit, n in zip(BUCKETS, t["buckets"]):
+            cumulative += n
+            lines.append(f"exonvais_{name}_bucket{_fmt_labels(labels, [('le', limit)])} {cumulative}")
+        lines.append(f"exonvais_{name}_bucket{_fmt_labels(labels, [('le', '+Inf')])} {t['count']}")
+        lines.append(f"exonvais_{name}_sum{_fmt_labels(labels)} {t['sum']}")
+        lines.append(f"exonvais_{name}_count{_fmt_labels(labels)} {t['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def export_to_file(path: str):
+    """Grava o texto Prometheus de forma atômica (arquivo temporário + rename)."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(to_prometheus())
+    os.replace(tmp, path)
+
+
+def _serve_http(port: int):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"[metrics] endpoint Prometheus em :{port}/metrics")
+
+
+def start_exporters():
+    """Inicia (uma vez por processo) os exports configurados no ambiente."""
+    global _exporters_started
+    with _lock:
+        if _exporters_started or not ENABLED:
+            return
+        _exporters_started = True
+
+    path = os.environ.get("EXONVAIS_METRICS_FILE")
+    if path:
+        interval = float(os.environ.get("EXONVAIS_METRICS_INTERVAL", "15"))
+
+        def loop():
+            while True:
+                try:
+                    export_to_file(path)
+                except Exception as e:
+                    print(f"[metrics] falha ao gravar {path}: {e}")
+                time.sleep(interval)
+        threading.Thread(target=loop, name="metrics-file", daemon=True).start()
+
+    port = os.environ.get("EXONVAIS_METRICS_PORT")
+    if port:
+        try:
+            _serve_http(int(port))
+        except OSError as e:
+            print(f"[metrics] não foi possível abrir a porta {port}: {e}")
+
+
+describe("db_query_seconds", "Latência das consultas via exec_query")
+describe("page_render_seconds", "Tempo de execução (rerun) das páginas")
+describe("page_db_seconds", "Tempo no banco por execução de página")
+describe("page_queries_total", "Consultas executadas pelas páginas")
+describe("upload_seconds", "Duração dos uploads de fotos")
+describe("pdf_seconds", "Duração da geração de PDFs")
+describe("cache_requests_total", "Acessos a caches (result=hit|miss)")
@@ -0,0 +1,154 @@
+"""Estatísticas de consultas (opt-in) alimentadas por core.db.exec_query.
+
+Ligado com EXONVAIS_QUERY_STATS=1 no ambiente ou `core.db.set_query_stats(True)`
+(aba Desempenho da Administração). Desligado, exec_query só testa um bool.
+
+Por fingerprint (SQL normalizado: literais viram ?, espaços colapsados) guarda
+chamadas, tempo total/máximo, linhas lidas, histograma de latência e quem
+chamou (página/módulo). Consultas acima de SLOW_QUERY_MS vão para um log
+circular de lentas e para o stdout.
+"""
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+
+SLOW_QUERY_MS = float(os.environ.get("EXONVAIS_SLOW_QUERY_MS", "200"))
+SLOW_LOG_SIZE = 200
+
+# Limites superiores (ms) dos baldes do histograma; o último balde é "acima de 1000"
+BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000)
+
+_lock = threading.Lock()
+_stats = {}
+_slow = deque(maxlen=SLOW_LOG_SIZE)
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_RE = re.compile(r"%s|\?")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+
+# Frames ignorados ao procurar quem chamou exec_query
+_INTERNAL_FILES = ("db.py", "querystats.py")
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql: str) -> str:
+    """Normaliza o SQL para agrupar execuções da mesma consulta."""
+    fp = _STRING_RE.sub("?", sql)
+    fp = _NUMBER_RE.sub("?", fp)
+    fp = _PLACEHOLDER_RE.sub("?", fp)
+    fp = _IN_LIST_RE.sub("(?...)", fp)
+    return _SPACE_RE.sub(" ", fp).strip()
+
+
+def _caller() -> str:
+    """Arquivo (página, serviço) que chamou exec_query."""
+    f = sys._getframe(2)
+    while f is not None:
+        name = os.path.basename(f.f_code.co_filename)
+        if name not in _INTERNAL_FILES:
+            return name
+        f = f.f_back
+    return "?"
+
+
+def _bucket(ms: float) -> int:
+    for i, limit in enumerate(BUCKETS_MS):
+        if ms <= limit:
+            return i
+    return len(BUCKETS_MS)
+
+
+def record(sql: str, elapsed_s: float, error: bool = False):
+    """Registra uma execução e devolve a entrada (para somar as linhas lidas depois)."""
+    fp = fingerprint(sql)
+    caller = _caller()
+    ms = elapsed_s * 1000
+    with _lock:
+        entry = _stats.get(fp)
+        if entry is None:
+            entry = _stats[fp] = {
+                "sql": fp, "calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0,
+                "rows": 0, "histogram": [0] * (len(BUCKETS_MS) + 1), "callers": {},
+            }
+        entry["calls"] += 1
+        entry["errors"] += int(error)
+        entry["total_ms"] += ms
+        if ms > entry["max_ms"]:
+            entry["max_ms"] = ms
+        entry["histogram"][_bucket(ms)] += 1
+        entry["callers"][caller] = entry["callers"].get(caller, 0) + 1
+        if ms >= SLOW_QUERY_MS:
+            _slow.append({"ts": time.strftime("%Y-%m-%d %H:%M:%S"), "ms": round(ms, 1), "caller": caller, "sql": fp})
+    if ms >= SLOW_QUERY_MS:
+        print(f"[db] consulta lenta ({ms:.0f} ms, {caller}): {fp[:200]}")
+    return entry
+
+
+def add_rows(entry, n: int):
+    with _lock:
+        entry["rows"] += n
+
+
+class CountingCursor:
+    """Cursor que soma as linhas lidas na entrada de estatística da consulta."""
+
+    __slots__ = ("_cur", "_entry")
+
+    def __init__(self, cur, entry):
+        self._cur = cur
+        self._entry = entry
+
+    def fetchone(self):
+        row = self._cur.fetchone()
+        if row is not None:
+            add_rows(self._entry, 1)
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._cur.fetchmany(*args)
+        add_rows(self._entry, len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cur.fetchall()
+        add_rows(self._entry, len(rows))
+        return rows
+
+    def __iter__(self):
+        for row in self._cur:
+            add_rows(self._entry, 1)
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+
+def top(n: int = 20, by: str = "total_ms"):
+    """As N consultas com maior `by` (total_ms, calls, max_ms, rows), com média em ms."""
+    with _lock:
+        entries = [dict(e, callers=dict(e["callers"]), histogram=list(e["histogram"])) for e in _stats.values()]
+    for e in entries:
+        e["avg_ms"] = e["total_ms"] / e["calls"] if e["calls"] else 0.0
+    return sorted(entries, key=lambda e: e[by], reverse=True)[:n]
+
+
+def slow_queries(n: int = 50):
+    """Consultas lentas mais recentes primeiro."""
+    with _lock:
+        return list(_slow)[::-1][:n]
+
+
+def histogram_labels():
+    return [f"≤{b} ms" for b in BUCKETS_MS] + [f">{BUCKETS_MS[-1]} ms"]
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+        _slow.clear()
@@ -0,0 +1,65 @@
+"""Transições de status de pedidos e histórico compacto (order_status_history).
+
+Toda mudança de status deve passar por `change_status`, que atualiza o pedido,
+grava a linha de histórico e audita com a ação padronizada STATUS_UPDATE.
+
+Backfill único a partir do audit_log (bancos anteriores à tabela):
+    python -m core.status backfill
+"""
+import sys
+from core.db import exec_query, init_db, now_iso, load_config, save_config
+from core.audit import audit_batch, log_change
+
+BACKFILL_KEY = "status_history_backfilled"
+
+
+def change_status(order_id: int, from_status: str, to_status: str, username: str = "system"):
+    """Move o pedido de `from_status` para `to_status` na transação corrente.
+
+    UPDATE + histórico + auditoria saem num único commit; dentro de um
+    `audit_batch` do chamador, o commit fica para o fim do lote dele.
+    """
+    ts = now_iso()
+    with audit_batch():
+        exec_query("UPDATE orders SET status=?, updated_at=? WHERE id=?", (to_status, ts, order_id))
+        exec_query(
+            "INSERT INTO order_status_history(order_id, from_status, to_status, ts) VALUES (?,?,?,?)",
+            (order_id, from_status, to_status, ts),
+        )
+        log_change("order", order_id, "STATUS_UPDATE", "status", from_status, to_status, username)
+
+
+def backfill_status_history() -> int:
+    """Copia as transições já registradas no audit_log para order_status_history.
+
+    Aceita as duas grafias históricas (STATUS_UPDATE com valores JSON e
+    status_changed com texto puro). Só roda uma vez por banco, e não roda
+    se o histórico já tem linhas (banco gerado/migrado com o histórico pronto):
+    copiar de novo duplicaria cada transição.
+    """
+    if load_config(BACKFILL_KEY, False):
+        return 0
+    if exec_query("SELECT 1 AS x FROM order_status_history LIMIT 1").fetchone():
+        save_config(BACKFILL_KEY, True)
+        return 0
+    cur = exec_query(
+        """
+        INSERT INTO order_status_history(order_id, from_status, to_status, ts)
+        SELECT entity_id, REPLACE(before, '"', ''), REPLACE(after, '"', ''), ts
+        FROM audit_log
+        WHERE action IN ('STATUS_UPDATE', 'status_changed') AND field='status' AND after IS NOT NULL
+        ORDER BY ts
+        """
+    )
+    copied = cur.rowcount
+    save_config(BACKFILL_KEY, True)  # commit junto com o INSERT
+    return copied
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] != "backfill":
+        print("Uso: python -m core.status backfill")
+        sys.exit(1)
+    init_db()
+    n = backfill_status_history()
+    print(f"✅ {n} transições copiadas do audit_log" if n else "ℹ️ Histórico de status já preenchido")
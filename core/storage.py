@@ -1,13 +1,15 @@
+import hashlib
 import os
 from io import BytesIO
-from PIL import Image
-import requests
 import traceback
 from urllib.parse import quote
+from core import metrics
 
 # Local upload directory (fallback)
 BASE_UPLOAD = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "uploads"))
-os.makedirs(BASE_UPLOAD, exist_ok=True)
+
+# Largura das miniaturas usadas nas listagens
+THUMB_W = 320
 
 
 def _upload_to_supabase(buf: BytesIO, key: str) -> str | None:
@@ -29,6 +31,7 @@ def _upload_to_supabase(buf: BytesIO, key: str) -> str | None:
         'x-upsert': 'true',
     }
     data = buf.getvalue()
+    import requests
     print(f"[storage] upload bytes len={len(data)}")
     try:
         print(f"[storage] supabase upload start: url={upload_url} name={key}")
@@ -65,8 +68,21 @@ def _upload_to_supabase(buf: BytesIO, key: str) -> str | None:
         return None
 
 
-def save_and_resize(img_file, filename_base: str, max_w: int = 1200):
-    """img_file: streamlit UploadedFile; retorna URL pública ou caminho salvo localmente."""
+def _jpeg(img, quality: int = 85) -> BytesIO:
+    buf = BytesIO()
+    img.save(buf, format="JPEG", quality=quality)
+    buf.seek(0)
+    return buf
+
+
+def save_photo(img_file, filename_base: str, max_w: int = 1200, thumb_w: int = THUMB_W):
+    """Redimensiona, envia a foto e uma miniatura (<base>_thumb.jpg).
+
+    Retorna {'url', 'thumb_url', 'content_hash', 'size'} (sha256 e bytes do
+    JPEG enviado) ou None se o upload da foto falhar. Sem miniatura,
+    thumb_url fica None.
+    """
+    from PIL import Image
     img = Image.open(img_file)
 
     # Converter RGBA para RGB (JPEG não suporta transparência)
@@ -84,14 +100,33 @@ def save_and_resize(img_file, filename_base: str, max_w: int = 1200):
     key = fname  # store at root of bucket under filename
 
     # Primeiro, tentar fazer upload para Supabase se configurado
-    buf = BytesIO()
-    img.save(buf, format="JPEG", quality=85)
-    buf.seek(0)
+    buf = _jpeg(img)
+    data = buf.getvalue()
 
-    public_url = _upload_to_supabase(buf, key)
-    if public_url:
-        return public_url
+    with metrics.timer("upload_seconds", backend="supabase"):
+        public_url = _upload_to_supabase(buf, key)
+    metrics.inc("uploads_total", result="ok" if public_url else "failed")
+    if not public_url:
+        # No fallback in production: do not save local files.
+        print("[storage] upload failed, photo will not be persisted")
+        return None
+
+    # Miniatura para listagens (falha aqui não invalida a foto)
+    thumb = img.copy()
+    thumb.thumbnail((thumb_w, thumb_w * 4))
+    with metrics.timer("upload_seconds", backend="supabase"):
+        thumb_url = _upload_to_supabase(_jpeg(thumb, quality=80), f"{filename_base}_thumb.jpg")
+    metrics.inc("uploads_total", result="ok" if thumb_url else "failed")
 
-    # No fallback in production: do not save local files.
-    print("[storage] upload failed, photo will not be persisted")
-    return None
+    return {
+        "url": public_url,
+        "thumb_url": thumb_url,
+        "content_hash": hashlib.sha256(data).hexdigest(),
+        "size": len(data),
+    }
+
+
+def save_and_resize(img_file, filename_base: str, max_w: int = 1200):
+    """img_file: streamlit UploadedFile; retorna a URL pública da foto ou None."""
+    meta = save_photo(img_file, filename_base, max_w)
+    return meta["url"] if meta else None
@@ -1,17 +1,40 @@
 #!/usr/bin/env python3
 """
-Script de migração: SQLite → PostgreSQL
+Script de migração: SQLite → PostgreSQL (e PostgreSQL → SQLite para snapshots locais)
 
 Uso:
 1. Configure DATABASE_URL no ambiente
 2. Execute: python migrate_to_postgres.py
 3. O script criará as tabelas e migrará os dados
 
-ATENÇÃO: Isso sobrescreverá dados existentes no PostgreSQL!
+Opções:
+    --workers N      conexões paralelas (tabelas independentes migram juntas; FKs respeitadas)
+    --fresh          limpa o destino e o checkpoint antes de começar
+    --reverse        PostgreSQL → SQLite (snapshot local em --sqlite)
+    --sqlite PATH    arquivo SQLite de origem/destino (padrão: exonvais.db; no --reverse: exonvais_snapshot.db)
+    --verify-only    apenas compara contagens e checksums
+    --no-verify      pula a verificação final
+
+Uma execução interrompida continua de onde parou: o progresso de cada tabela
+(último id migrado) fica em .migration_checkpoint.json, por par origem/destino
+(arquivo SQLite + host/porta/banco do PostgreSQL), e é conferido com o MAX(id)
+do destino. A entrada do par é apagada quando a migração termina e confere;
+uma nova execução para o mesmo destino copia só as linhas novas (id > MAX(id)).
+
+ATENÇÃO: com --fresh, isso sobrescreverá dados existentes no destino!
 """
 
+import argparse
+import hashlib
+import io
+import json
 import os
 import sqlite3
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 try:
     import psycopg2  # type: ignore
     import psycopg2.extras  # type: ignore
@@ -19,106 +42,456 @@ except ImportError:
     # PostgreSQL não disponível
     print("❌ PostgreSQL não disponível. Instale com: pip install psycopg2-binary")
     exit(1)
-from core.db import SCHEMA_SQL_PG, to_json, from_json
+from core.db import SCHEMA_SQL_PG, SCHEMA_SQL_SQLITE
 
 # Configurações
 SQLITE_DB = os.path.join(os.path.dirname(__file__), "exonvais.db")
+SNAPSHOT_DB = os.path.join(os.path.dirname(__file__), "exonvais_snapshot.db")
+CHECKPOINT_FILE = os.path.join(os.path.dirname(__file__), ".migration_checkpoint.json")
 DATABASE_URL = os.environ.get('DATABASE_URL')
 
-if not DATABASE_URL:
-    print("❌ Erro: DATABASE_URL não configurada!")
-    print("Configure a variável de ambiente DATABASE_URL primeiro.")
-    exit(1)
+# Linhas por bloco: limita a memória usada por tabela e define a granularidade do checkpoint
+CHUNK_ROWS = 5000
+
+# Colunas JSON que não podem ficar vazias no destino
+JSON_DEFAULTS = {'notes_struct': '{}', 'photos': '[]'}
+# Texto que não é JSON válido vira {chave: texto} (igual à conversão de notes_struct para JSONB)
+JSON_INVALID_KEY = {'notes_struct': 'observacao'}
+
+# Colunas renomeadas no schema atual (bancos SQLite antigos ainda usam o nome original)
+LEGACY_COLUMNS = {'user': 'username'}
+
+# Níveis de dependência (FKs): tabelas de um mesmo nível migram em paralelo,
+# e um nível só começa depois que o anterior terminou sem erros.
+TABLE_LEVELS = [
+    ['clients', 'product_catalog', 'payment_batches', 'audit_log', 'audit_log_archive', 'config',
+     'order_status_history', 'finance_daily', 'finance_monthly', 'nc_counters'],
+    ['orders'],
+    ['shipments', 'nonconformities', 'finance_entries'],
+    ['order_photos'],
+]
+
+
+def _copy_value(value):
+    """Formata um valor para o formato texto do COPY (tab-separado, \\N = NULL)."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return (str(value)
+            .replace('\\', '\\\\')
+            .replace('\t', '\\t')
+            .replace('\n', '\\n')
+            .replace('\r', '\\r'))
+
+
+def _checksum_value(value):
+    """Representação estável entre backends (REAL no PostgreSQL tem 4 bytes: compara como float4).
+
+    Arredondar o texto (6 dígitos) falha na fronteira: 32624.25 e
+    32624.25000000001 viram '32624.2' e '32624.3'. Os dois viram o mesmo float4.
+    """
+    if value is None:
+        return '\\N'
+    if isinstance(value, float):
+        return repr(struct.unpack('f', struct.pack('f', value))[0])
+    return str(value)
+
+
+class SqliteEndpoint:
+    name = "SQLite"
+
+    def __init__(self, path):
+        self.path = path
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=60)
+        return conn
+
+    def create_schema(self, conn):
+        conn.executescript(SCHEMA_SQL_SQLITE)
+        conn.commit()
+
+    def has_table(self, conn, table):
+        return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone() is not None
+
+    def has_id(self, conn, table):
+        return 'id' in [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]
+
+    def max_id(self, conn, table):
+        return conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+
+    def select(self, conn, sql, params=()):
+        cur = conn.cursor()
+        cur.execute(sql.replace('%s', '?'), params)
+        return cur
+
+    def write(self, conn, table, columns, rows):
+        placeholders = ','.join(['?'] * len(columns))
+        conn.executemany(f"INSERT INTO {table} ({','.join(columns)}) VALUES ({placeholders})", rows)
+
+    def clear(self, conn, tables):
+        for table in tables:
+            conn.execute(f"DELETE FROM {table}")
+        conn.commit()
+
+    def finish_table(self, conn, table):
+        # AUTOINCREMENT: sqlite_sequence já acompanha ids explícitos
+        pass
+
+    def set_triggers(self, conn, tables, enabled):
+        # SQLite grava um bloco por vez (sem corrida entre os workers): triggers ficam ligados
+        pass
+
+    def rebuild_derived(self):
+        pass
+
+
+class PostgresEndpoint:
+    name = "PostgreSQL"
+
+    def __init__(self, url):
+        self.url = url
+
+    def connect(self):
+        return psycopg2.connect(self.url)
+
+    def create_schema(self, conn):
+        cur = conn.cursor()
+        cur.execute(SCHEMA_SQL_PG)
+        conn.commit()
+
+    def has_table(self, conn, table):
+        cur = conn.cursor()
+        cur.execute("SELECT to_regclass(%s) IS NOT NULL", (table,))
+        return cur.fetchone()[0]
+
+    def has_id(self, conn, table):
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT 1 FROM information_schema.columns WHERE table_name=%s AND column_name='id'",
+            (table,),
+        )
+        return cur.fetchone() is not None
+
+    def max_id(self, conn, table):
+        cur = conn.cursor()
+        cur.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+        return cur.fetchone()[0]
 
-def migrate_table(table_name, sqlite_conn, pg_conn):
-    """Migra uma tabela específica"""
-    print(f"📋 Migrando tabela: {table_name}")
+    def select(self, conn, sql, params=()):
+        cur = conn.cursor()
+        cur.execute(sql, params)
+        return cur
 
-    # Buscar dados do SQLite
-    sqlite_cur = sqlite_conn.cursor()
-    sqlite_cur.execute(f"SELECT * FROM {table_name}")
-    rows = sqlite_cur.fetchall()
+    def write(self, conn, table, columns, rows):
+        buf = io.StringIO()
+        for row in rows:
+            buf.write('\t'.join(map(_copy_value, row)))
+            buf.write('\n')
+        buf.seek(0)
+        conn.cursor().copy_expert(f"COPY {table} ({','.join(columns)}) FROM STDIN", buf)
 
-    if not rows:
-        print(f"   ℹ️ Tabela {table_name} vazia, pulando...")
-        return
+    def clear(self, conn, tables):
+        conn.cursor().execute(f"TRUNCATE {', '.join(tables)} RESTART IDENTITY CASCADE")
+        conn.commit()
 
-    # Inserir no PostgreSQL
-    pg_cur = pg_conn.cursor()
+    def finish_table(self, conn, table):
+        """Ajusta a sequência SERIAL de `id` para o maior id migrado."""
+        conn.cursor().execute(
+            f"SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) FROM {table}",
+            (table,),
+        )
+        conn.commit()
 
-    # Obter nomes das colunas
-    columns = [desc[0] for desc in sqlite_cur.description]
+    def set_triggers(self, conn, tables, enabled):
+        """Liga/desliga os triggers do app (projeção e busca de pedidos) nas tabelas migradas.
 
-    # Criar query de insert
-    placeholders = ','.join(['%s'] * len(columns))
-    query = f"INSERT INTO {table_name} ({','.join(columns)}) VALUES ({placeholders})"
+        Com eles ligados, cada linha do COPY recalcularia a linha derivada e
+        workers paralelos (nonconformities e finance_entries) disputariam a
+        mesma linha de order_listing. As derivadas são recalculadas no fim.
+        """
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT DISTINCT c.relname FROM pg_trigger t JOIN pg_class c ON c.oid = t.tgrelid "
+            "WHERE NOT t.tgisinternal AND c.relname = ANY(%s)",
+            (list(tables),),
+        )
+        for (table,) in cur.fetchall():
+            cur.execute(f"ALTER TABLE {table} {'ENABLE' if enabled else 'DISABLE'} TRIGGER USER")
+        conn.commit()
 
-    # Inserir dados
+    def rebuild_derived(self):
+        """Recalcula projeção e índice de busca de pedidos, se o app já os criou no destino."""
+        from core.db import exec_query
+        from services.order_listing import rebuild_listing
+        from services.order_search import rebuild_index
+        for table, rebuild in (("order_listing", rebuild_listing), ("order_search", rebuild_index)):
+            if exec_query("SELECT to_regclass(?) IS NOT NULL AS e", (table,)).fetchone()["e"]:
+                print(f"🔄 Recalculando {table}...")
+                rebuild()
+
+
+def checkpoint_key(direction, sqlite_path, url):
+    """Identifica o par origem/destino: direção, arquivo SQLite e host:porta/banco (sem senha)."""
+    dsn = psycopg2.extensions.parse_dsn(url)
+    pg = f"{dsn.get('host', '')}:{dsn.get('port', '5432')}/{dsn.get('dbname', '')}"
+    return f"{direction} {os.path.abspath(sqlite_path)} {pg}"
+
+
+class Checkpoint:
+    """Progresso por tabela ({tabela: {'last_id': n, 'done': bool}}) de um par origem/destino, em JSON."""
+
+    def __init__(self, path, key):
+        self.path = path
+        self.key = key
+        self._lock = threading.Lock()
+        self._data = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self._data = json.load(f)
+        self._data.setdefault(key, {})
+
+    def get(self, table):
+        with self._lock:
+            return dict(self._data[self.key].get(table, {'last_id': 0, 'done': False}))
+
+    def update(self, table, **fields):
+        with self._lock:
+            self._data[self.key].setdefault(table, {'last_id': 0, 'done': False}).update(fields)
+            self._save()
+
+    def reset(self):
+        with self._lock:
+            self._data[self.key] = {}
+        self.update('_started', last_id=0, done=False)
+
+    def discard(self):
+        """Apaga o progresso do par (migração concluída); o arquivo some se ficar vazio."""
+        with self._lock:
+            self._data.pop(self.key, None)
+            if self._data:
+                self._save()
+            elif os.path.exists(self.path):
+                os.remove(self.path)
+
+    def _save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self._data, f, indent=2)
+        os.replace(tmp, self.path)
+
+
+def _columns(cur):
+    return [LEGACY_COLUMNS.get(d[0], d[0]) for d in cur.description]
+
+
+def _json_value(column, value, canonical=False):
+    """Texto JSON válido para a coluna: vazio vira o padrão, dict/list (JSONB) é serializado.
+
+    `canonical` ordena as chaves (JSONB não guarda a ordem nem os espaços do
+    texto original), para o checksum comparar o conteúdo nos dois backends.
+    """
+    if isinstance(value, (dict, list)):
+        parsed = value
+    elif not value:
+        return JSON_DEFAULTS[column]
+    else:
+        try:
+            parsed = json.loads(value)
+        except ValueError:
+            key = JSON_INVALID_KEY.get(column)
+            parsed = {key: value} if key else json.loads(JSON_DEFAULTS[column])
+        else:
+            if not canonical:
+                return value
+    return json.dumps(parsed, ensure_ascii=False, sort_keys=canonical)
+
+
+def _fix_json_values(columns, rows, canonical=False):
+    json_cols = [(i, c) for i, c in enumerate(columns) if c in JSON_DEFAULTS]
+    if not json_cols:
+        return [tuple(r) for r in rows]
+    fixed = []
     for row in rows:
-        values = []
-        for col_name, value in zip(columns, row):
-            # Converter tipos se necessário
-            if isinstance(value, str) and col_name in ['notes_struct', 'notes_free', 'photos']:
-                # Garantir que JSON strings sejam válidas
-                try:
-                    from_json(value, {})
-                    values.append(value)
-                except:
-                    values.append('{}')
-            else:
-                values.append(value)
-
-        pg_cur.execute(query, values)
-
-    pg_conn.commit()
-    print(f"   ✅ {len(rows)} registros migrados")
+        values = list(row)
+        for i, column in json_cols:
+            values[i] = _json_value(column, values[i], canonical)
+        fixed.append(tuple(values))
+    return fixed
 
-def main():
-    print("🚀 Iniciando migração SQLite → PostgreSQL")
-    print(f"📁 SQLite: {SQLITE_DB}")
-    print(f"🗄️ PostgreSQL: {(DATABASE_URL[:50] + '...') if DATABASE_URL else 'NÃO CONFIGURADO'}")
 
-    # Conectar aos bancos
-    sqlite_conn = sqlite3.connect(SQLITE_DB)
-    pg_conn = psycopg2.connect(DATABASE_URL)
+def migrate_table(table_name, source, target, checkpoint):
+    """Migra uma tabela em blocos de CHUNK_ROWS linhas, com checkpoint por último id."""
+    state = checkpoint.get(table_name)
+    if state['done']:
+        print(f"   ⏭️ {table_name}: já migrada (checkpoint)")
+        return 0
 
+    started = time.perf_counter()
+    src = source.connect()
+    dst = target.connect()
+    total = 0
     try:
-        # Criar tabelas no PostgreSQL
-        print("🏗️ Criando tabelas no PostgreSQL...")
-        pg_cur = pg_conn.cursor()
-        pg_cur.execute(SCHEMA_SQL_PG)
-        pg_conn.commit()
-
-        # Lista de tabelas para migrar (ordem importa por causa das FKs)
-        tables = [
-            'clients',
-            'product_catalog',
-            'orders',
-            'shipments',
-            'nonconformities',
-            'finance_entries',
-            'payment_batches',
-            'audit_log',
-            'config'
-        ]
-
-        # Migrar cada tabela
-        for table in tables:
-            try:
-                migrate_table(table, sqlite_conn, pg_conn)
-            except Exception as e:
-                print(f"   ❌ Erro na tabela {table}: {e}")
-                continue
+        if not source.has_table(src, table_name):
+            # Banco de origem anterior à tabela: nada a copiar
+            print(f"   ⏭️ {table_name}: não existe na origem")
+            checkpoint.update(table_name, done=True)
+            return 0
+        if source.has_id(src, table_name):
+            # O destino é a fonte de verdade: cobre blocos gravados antes de o checkpoint ser salvo
+            last_id = max(state['last_id'], target.max_id(dst, table_name))
+            if last_id:
+                print(f"   ↪️ {table_name}: retomando após id {last_id}")
+            while True:
+                cur = source.select(src, f"SELECT * FROM {table_name} WHERE id > %s ORDER BY id LIMIT {CHUNK_ROWS}", (last_id,))
+                columns = _columns(cur)
+                rows = cur.fetchall()
+                if not rows:
+                    break
+                target.write(dst, table_name, columns, _fix_json_values(columns, rows))
+                dst.commit()
+                last_id = rows[-1][columns.index('id')]
+                total += len(rows)
+                checkpoint.update(table_name, last_id=last_id)
+            target.finish_table(dst, table_name)
+        else:
+            # Tabelas sem id (config, agregados) são pequenas: recopiadas por inteiro numa transação
+            target.clear(dst, [table_name])
+            cur = source.select(src, f"SELECT * FROM {table_name}")
+            columns = _columns(cur)
+            while True:
+                rows = cur.fetchmany(CHUNK_ROWS)
+                if not rows:
+                    break
+                target.write(dst, table_name, columns, _fix_json_values(columns, rows))
+                total += len(rows)
+            dst.commit()
+        checkpoint.update(table_name, done=True)
+    finally:
+        src.close()
+        dst.close()
 
-        print("🎉 Migração concluída!")
+    elapsed = time.perf_counter() - started
+    rate = total / elapsed if elapsed > 0 else 0
+    print(f"   ✅ {table_name}: {total} registros em {elapsed:.2f}s ({rate:,.0f} linhas/s)")
+    return total
 
-    except Exception as e:
-        print(f"❌ Erro durante migração: {e}")
-        pg_conn.rollback()
 
+def table_digest(endpoint, table_name):
+    """(contagem, checksum) independente da ordem das linhas: soma dos hashes de cada linha."""
+    conn = endpoint.connect()
+    try:
+        if not endpoint.has_table(conn, table_name):
+            return 0, f"{0:016x}"
+        cur = endpoint.select(conn, f"SELECT * FROM {table_name}")
+        columns = _columns(cur)
+        order = sorted(range(len(columns)), key=lambda i: columns[i])
+        count, acc = 0, 0
+        while True:
+            rows = cur.fetchmany(CHUNK_ROWS)
+            if not rows:
+                break
+            for row in _fix_json_values(columns, rows, canonical=True):
+                text = '\x1f'.join(_checksum_value(row[i]) for i in order)
+                acc = (acc + int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'big')) % (1 << 64)
+                count += 1
+        return count, f"{acc:016x}"
     finally:
-        sqlite_conn.close()
-        pg_conn.close()
+        conn.close()
+
+
+def verify(source, target, tables, workers):
+    """Compara contagens e checksums de cada tabela nos dois lados. Retorna lista de divergências."""
+    print("🔎 Verificando contagens e checksums...")
+    mismatches = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {t: (pool.submit(table_digest, source, t), pool.submit(table_digest, target, t)) for t in tables}
+        for table, (f_src, f_dst) in futures.items():
+            (n_src, h_src), (n_dst, h_dst) = f_src.result(), f_dst.result()
+            ok = n_src == n_dst and h_src == h_dst
+            print(f"   {'✅' if ok else '❌'} {table}: origem={n_src} ({h_src}) destino={n_dst} ({h_dst})")
+            if not ok:
+                mismatches.append(table)
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migração SQLite ⇄ PostgreSQL")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--fresh', action='store_true')
+    parser.add_argument('--reverse', action='store_true')
+    parser.add_argument('--sqlite')
+    parser.add_argument('--verify-only', action='store_true')
+    parser.add_argument('--no-verify', action='store_true')
+    args = parser.parse_args()
+
+    if not DATABASE_URL:
+        print("❌ Erro: DATABASE_URL não configurada!")
+        print("Configure a variável de ambiente DATABASE_URL primeiro.")
+        sys.exit(1)
+
+    sqlite_path = args.sqlite or (SNAPSHOT_DB if args.reverse else SQLITE_DB)
+    sqlite_ep, pg_ep = SqliteEndpoint(sqlite_path), PostgresEndpoint(DATABASE_URL)
+    source, target = (pg_ep, sqlite_ep) if args.reverse else (sqlite_ep, pg_ep)
+    direction = "pg->sqlite" if args.reverse else "sqlite->pg"
+    tables = [t for level in TABLE_LEVELS for t in level]
+
+    print(f"🚀 Iniciando migração {source.name} → {target.name}")
+    print(f"📁 SQLite: {sqlite_path}")
+    print(f"🗄️ PostgreSQL: {DATABASE_URL[:50]}...")
+
+    checkpoint = None
+    if not args.verify_only:
+        checkpoint = Checkpoint(CHECKPOINT_FILE, checkpoint_key(direction, sqlite_path, DATABASE_URL))
+
+        # Criar tabelas no destino
+        print(f"🏗️ Criando tabelas no {target.name}...")
+        conn = target.connect()
+        try:
+            target.create_schema(conn)
+            if args.fresh:
+                print("🧹 Limpando destino (--fresh)...")
+                target.clear(conn, tables)
+                checkpoint.reset()
+        finally:
+            conn.close()
+
+        started = time.perf_counter()
+        failed = {}
+        # Triggers das tabelas derivadas desligados durante a carga (religados mesmo com erro)
+        conn = target.connect()
+        target.set_triggers(conn, tables, enabled=False)
+        try:
+            for level in TABLE_LEVELS:
+                with ThreadPoolExecutor(max_workers=args.workers) as pool:
+                    futures = {t: pool.submit(migrate_table, t, source, target, checkpoint) for t in level}
+                    for table, future in futures.items():
+                        try:
+                            future.result()
+                        except Exception as e:
+                            failed[table] = e
+                            print(f"   ❌ Erro na tabela {table}: {e}")
+                if failed:
+                    # Níveis seguintes dependem deste (FKs): parar aqui e retomar depois
+                    print(f"❌ Migração interrompida: {len(failed)} tabela(s) com erro. Corrija e rode novamente para retomar.")
+                    sys.exit(1)
+        finally:
+            target.set_triggers(conn, tables, enabled=True)
+            conn.close()
+        target.rebuild_derived()
+        print(f"🎉 Migração concluída em {time.perf_counter() - started:.1f}s!")
+
+    if not args.no_verify:
+        mismatches = verify(source, target, tables, args.workers)
+        if mismatches:
+            print(f"❌ Divergências em: {', '.join(mismatches)}")
+            sys.exit(2)
+        print("✅ Origem e destino conferem")
+    if checkpoint:
+        # concluída: a próxima execução recomeça do MAX(id) do destino, sem tabelas "já migradas"
+        checkpoint.discard()
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,5 +1,8 @@
 import streamlit as st
 from core.db import get_conn, to_json, from_json, load_config, save_config
+from core import metrics
+
+_page = metrics.page_start(__file__)
 
 st.title("⚙️ Configurações do Sistema")
 
@@ -178,3 +181,5 @@ with tab2:
     
     with col3:
         manage_simple_list("✨ Acabamentos", "acabamentos", ["Bordado", "Renda", "Babado", "Liso", "Estampado"])
+
+metrics.page_finish(_page)
@@ -1,6 +1,10 @@
 import streamlit as st
 from core.db import get_conn, exec_query
 from ui.components import section
+from services.clients import count_clients, list_clients
+from core import metrics
+
+_page = metrics.page_start(__file__)
 
 st.title("Clientes")
 conn = get_conn()
@@ -16,6 +20,48 @@ with st.form("novo_cliente"):
         st.success("Cliente salvo")
 
 section("Lista")
-rows = exec_query("SELECT * FROM clients ORDER BY id DESC").fetchall()
-for r in rows:
-    st.write(f"#{r['id']} — {r['name']} ({r['status']})")
+col_search, col_status, col_size = st.columns([3, 1, 1])
+search = col_search.text_input("🔎 Buscar", placeholder="Nome, CPF ou telefone", key="clients_search")
+status_filter = col_status.selectbox("Status", ["Todos", "ADIMPLENTE", "INADIMPLENTE"], key="clients_status")
+page_size = col_size.selectbox("Por página", [25, 50, 100], index=1, key="clients_page_size")
+status_filter = None if status_filter == "Todos" else status_filter
+
+# cursores das páginas já vistas; voltam ao início quando a busca ou o filtro mudam
+filters_key = (search.strip(), status_filter, page_size)
+if st.session_state.get("clients_filters_key") != filters_key:
+    st.session_state["clients_filters_key"] = filters_key
+    st.session_state["clients_cursors"] = [None]
+cursors = st.session_state["clients_cursors"]
+
+rows, next_cursor = list_clients(search, status_filter, after_id=cursors[-1], limit=page_size)
+total = count_clients(search, status_filter)
+
+if rows:
+    st.dataframe(
+        rows,
+        column_config={
+            "id": st.column_config.NumberColumn("#", format="%d"),
+            "name": "Nome",
+            "address": "Endereço",
+            "cpf": "CPF",
+            "phone": "Telefone",
+            "status": "Status",
+            "orders": st.column_config.NumberColumn("Pedidos", format="%d"),
+            "open_balance": st.column_config.NumberColumn("Em aberto (R$)", format="%.2f"),
+        },
+        hide_index=True,
+        use_container_width=True,
+    )
+else:
+    st.info("Nenhum cliente encontrado")
+
+col_prev, col_page, col_next = st.columns([1, 2, 1])
+if col_prev.button("⬅️ Anterior", disabled=len(cursors) == 1, use_container_width=True):
+    cursors.pop()
+    st.rerun()
+col_page.caption(f"Página {len(cursors)} · {total} clientes")
+if col_next.button("Próxima ➡️", disabled=next_cursor is None, use_container_width=True):
+    cursors.append(next_cursor)
+    st.rerun()
+
+metrics.page_finish(_page)
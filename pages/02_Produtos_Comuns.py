@@ -1,9 +1,14 @@
 import streamlit as st
-from core.db import get_conn, now_iso, to_json, from_json, load_config, save_config, exec_query
+from core.db import get_conn, now_iso, to_json, from_json, load_config, save_config, exec_query, exec_insert
 from core.models import OrderStatus
 from core.validators import validate_prices
-from core.storage import save_and_resize
+from core.storage import save_photo
+from services.photos import add_photos
+from services.clients import client_label, has_clients, recent_clients, search_clients
 from ui.components import section, photo_uploader
+from core import metrics
+
+_page = metrics.page_start(__file__)
 
 st.session_state.setdefault("form_ver", 0)
 st.session_state.setdefault("uploader_ver", 0)
@@ -11,46 +16,18 @@ st.session_state.setdefault("uploader_ver", 0)
 st.title("Produtos Comuns — Novo Pedido")
 conn = get_conn()
 
-# Buscar últimos 5 clientes usados (com pedidos recentes) OU recém cadastrados
-# PostgreSQL não permite ORDER BY em uma query DISTINCT por coluna não selecionada.
-# Selecionamos client_id ordenados por created_at e deduplicamos em Python.
-recentes_pedidos = exec_query(
-    "SELECT client_id FROM orders ORDER BY created_at DESC LIMIT 5"
-).fetchall()
-recentes_cadastrados = exec_query(
-    "SELECT id as client_id FROM clients ORDER BY id DESC LIMIT 5"
-).fetchall()
-
-# Unir e remover duplicatas, mantendo ordem (recentes pedidos + recentes cadastrados)
-recentes_ids = set()
-for r in recentes_pedidos:
-    recentes_ids.add(r['client_id'])
-for r in recentes_cadastrados:
-    recentes_ids.add(r['client_id'])
-
-# Todos os clientes
-all_clients = exec_query("SELECT id, name FROM clients ORDER BY name").fetchall()  # type: ignore
-
-# Montar lista com recentes no topo
+# Clientes: recentes (pedidos e cadastros) sem busca; com busca, os melhores resultados do índice
+client_query = st.text_input("🔎 Buscar cliente", placeholder="Nome, CPF ou telefone", key="client_query")
+if client_query.strip():
+    client_rows = search_clients(client_query)
+else:
+    client_rows = recent_clients()
 client_list = []
 client_map = {}
-
-# Recentes primeiro
-for c in all_clients:
-    if c['id'] in recentes_ids:
-        label = f"🌟 {c['name']} (#{c['id']})"
-        client_list.append(label)
-        client_map[label] = c['id']
-
-# Depois os outros em ordem alfabética
-if client_list:
-    client_list.append("─" * 40)  # Divisor visual
-
-for c in all_clients:
-    if c['id'] not in recentes_ids:
-        label = f"{c['name']} (#{c['id']})"
-        client_list.append(label)
-        client_map[label] = c['id']
+for c in client_rows:
+    label = f"🌟 {client_label(c)}" if not client_query.strip() else client_label(c)
+    client_list.append(label)
+    client_map[label] = c['id']
 
 # Carrega configurações
 hierarchy = load_config("product_hierarchy", {
@@ -70,7 +47,10 @@ cores = load_config("cores", ["Branco", "Bege", "Azul", "Rosa", "Cinza", "Colori
 acabamentos = load_config("acabamentos", ["Bordado", "Renda", "Babado", "Liso", "Estampado"])
 
 if not client_list:
-    st.warning("⚠️ Cadastre um cliente primeiro na página 'Clientes'.")
+    if not has_clients():
+        st.warning("⚠️ Cadastre um cliente primeiro na página 'Clientes'.")
+    else:
+        st.info("🔎 Nenhum cliente encontrado para essa busca.")
     st.stop()
 
 if not hierarchy:
@@ -142,24 +122,26 @@ if button_clicked:
     notes_struct = {"tecido":tecido, "cor":cor, "acabamento":acabamento}
     
     # Salvar fotos se existirem (apenas URLs válidas serão persistidas)
-    photos_paths = []
+    photos = []
     if fotos:
         for idx, foto in enumerate(fotos):
             filename_base = f"order_{now_iso().replace(':', '-')}_{idx}"
-            url = save_and_resize(foto, filename_base)
-            if url:
-                photos_paths.append(url)
+            meta = save_photo(foto, filename_base)
+            if meta:
+                photos.append(meta)
             else:
                 print("[order] photo upload failed, continuing without this photo")
+    photos_paths = [p['url'] for p in photos]
 
-    exec_query(
+    order_id = exec_insert(
         """
         INSERT INTO orders(client_id, category, type, product, price_cost, price_sale, notes_struct, notes_free, photos, status, created_at, updated_at)
         VALUES (?,?,?,?,?,?,?,?,?,?,?,?)
         """,
         (client_map[client_sel], category, type_, product, price_cost, price_sale, to_json(notes_struct), obs_livre, to_json(photos_paths), OrderStatus.CRIADO, now_iso(), now_iso()),
-        commit=True
     )
+    add_photos(order_id, photos)
+    conn.commit()
     st.success("✅ Pedido criado com sucesso! Enviado para Status > Pedidos")
     # Incrementar versões para resetar o form e o uploader de forma limpa
     st.session_state["form_ver"] += 1
@@ -173,3 +155,5 @@ if button_clicked:
             st.rerun()
         except Exception:
             pass
+
+metrics.page_finish(_page)
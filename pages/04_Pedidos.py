@@ -1,20 +1,29 @@
 import streamlit as st
 import urllib.parse
 import os
-from core.db import get_conn, now_iso, from_json, to_json, exec_query
+from core.db import get_conn, now_iso, to_json, exec_query
 from core.models import OrderStatus
-from core.audit import log_change
+from core.audit import audit_batch, log_change, snapshot
+from core.status import change_status
 from ui.status_badges import badge
 from services.motores.pdf_generator import generate_order_pdf
 from services.messenger import generate_whatsapp_message
+from services.order_listing import list_orders, order_row, specs_items
+from services.photos import photos_for_orders, display_url
+from services.quality import unregister_order_ncs
+from services.rollups import forget_order_entries
+from core import metrics
+
+_page = metrics.page_start(__file__)
 
 st.title("Pedidos")
 conn = get_conn()
 
-rows = exec_query("SELECT o.*, c.name AS client_name FROM orders o JOIN clients c ON c.id=o.client_id WHERE o.status=? ORDER BY o.id DESC", (OrderStatus.CRIADO,)).fetchall()
+rows = list_orders(OrderStatus.CRIADO)
+photos_by_order = photos_for_orders([r['id'] for r in rows if r['photo_count']])
 
 for r in rows:
-    with st.expander(f"#{r['id']} — {r['client_name']} • {r['category']}/{r['type']}/{r['product']}"):
+    with st.expander(f"#{r['id']} — {r['client_name']} • {r['product_path']}"):
         cols = st.columns([1,1,1])
         with cols[0]:
             st.write(f"Custo: R$ {r['price_cost']:.2f}")
@@ -28,14 +37,14 @@ for r in rows:
             st.write(r['notes_free'])
         
         # Exibir especificações estruturadas
-        notes_struct = from_json(r['notes_struct'], {})
-        if notes_struct:
+        specs = specs_items(r)
+        if specs:
             st.subheader("⚙️ Especificações")
-            for key, value in notes_struct.items():
+            for key, value in specs:
                 st.write(f"**{key}**: {value}")
         
         # Exibir fotos se existirem
-        photos = from_json(r['photos'], [])
+        photos = [display_url(ph) for ph in photos_by_order.get(r['id'], [])]
         if photos:
             st.subheader("📸 Fotos do Pedido")
             photo_cols = st.columns(6)
@@ -73,7 +82,7 @@ for r in rows:
         if st.session_state.get(f"send_mode_{r['id']}", False):
             # Gerar PDF com fotos automaticamente (só uma vez)
             if f"pdf_path_{r['id']}" not in st.session_state:
-                pdf_path = generate_order_pdf(r)
+                pdf_path = generate_order_pdf(order_row(r['id']))
                 st.session_state[f"pdf_path_{r['id']}"] = pdf_path
                 st.success("✅ PDF gerado com sucesso!")
             else:
@@ -98,11 +107,10 @@ for r in rows:
             
             with col_confeccionar:
                 if st.button("🔄 Confeccionar", key=f"confeccionar_{r['id']}", use_container_width=True):
-                    # Atualizar status após confeccionar
-                    exec_query("UPDATE orders SET status=?, updated_at=? WHERE id=?", (OrderStatus.AGUARDANDO_CONF, now_iso(), r['id']), commit=True)
+                    # Registrar envio e atualizar status após confeccionar
                     exec_query("INSERT INTO shipments(order_id, medium, when_ts, document_path) VALUES (?,?,?,?)", 
-                        (r['id'], "COMPARTILHADO", now_iso(), pdf_path), commit=True)
-                    log_change("order", r['id'], "STATUS_UPDATE", "status", OrderStatus.CRIADO, OrderStatus.AGUARDANDO_CONF)
+                        (r['id'], "COMPARTILHADO", now_iso(), pdf_path))
+                    change_status(r['id'], OrderStatus.CRIADO, OrderStatus.AGUARDANDO_CONF)
                     
                     # Limpar session_state
                     st.session_state[f"send_mode_{r['id']}"] = False
@@ -125,13 +133,17 @@ for r in rows:
             col_confirm, col_cancel = st.columns(2)
             with col_confirm:
                 if st.button("✅ Sim, excluir", key=f"confirm_del_{r['id']}", use_container_width=True):
-                    log_change("order", r['id'], "DELETE", "all", str(r), None)
-                    # Remover registros dependentes para evitar ForeignKeyViolation no Postgres
-                    exec_query("DELETE FROM shipments WHERE order_id=?", (r['id'],), commit=True)
-                    exec_query("DELETE FROM nonconformities WHERE order_id=?", (r['id'],), commit=True)
-                    exec_query("DELETE FROM finance_entries WHERE order_id=?", (r['id'],), commit=True)
-                    # Depois remover o pedido
-                    exec_query("DELETE FROM orders WHERE id=?", (r['id'],), commit=True)
+                    with audit_batch():
+                        log_change("order", r['id'], "DELETE", "all", snapshot(r), None)
+                        # Remover registros dependentes para evitar ForeignKeyViolation no Postgres
+                        exec_query("DELETE FROM order_photos WHERE order_id=?", (r['id'],))
+                        exec_query("DELETE FROM shipments WHERE order_id=?", (r['id'],))
+                        unregister_order_ncs(r)
+                        exec_query("DELETE FROM nonconformities WHERE order_id=?", (r['id'],))
+                        forget_order_entries(r['id'])
+                        exec_query("DELETE FROM finance_entries WHERE order_id=?", (r['id'],))
+                        # Depois remover o pedido
+                        exec_query("DELETE FROM orders WHERE id=?", (r['id'],))
                     st.success("Pedido excluído com sucesso")
                     st.session_state[f"delete_mode_{r['id']}"] = False
                     st.rerun()
@@ -149,15 +161,19 @@ for r in rows:
                 new_notes = st.text_area("Observações", value=r['notes_free'], key=f"enotes_{r['id']}")
                 
                 if st.form_submit_button("Salvar alterações"):
-                    if r['price_cost'] != new_cost:
-                        log_change("order", r['id'], "UPDATE", "price_cost", r['price_cost'], new_cost)
-                    if r['price_sale'] != new_sale:
-                        log_change("order", r['id'], "UPDATE", "price_sale", r['price_sale'], new_sale)
-                    if r['notes_free'] != new_notes:
-                        log_change("order", r['id'], "UPDATE", "notes_free", r['notes_free'], new_notes)
-                    
-                    exec_query("UPDATE orders SET price_cost=?, price_sale=?, notes_free=?, updated_at=? WHERE id=?", 
-                        (new_cost, new_sale, new_notes, now_iso(), r['id']), commit=True)
+                    # auditoria + UPDATE num único commit
+                    with audit_batch():
+                        if r['price_cost'] != new_cost:
+                            log_change("order", r['id'], "UPDATE", "price_cost", r['price_cost'], new_cost)
+                        if r['price_sale'] != new_sale:
+                            log_change("order", r['id'], "UPDATE", "price_sale", r['price_sale'], new_sale)
+                        if r['notes_free'] != new_notes:
+                            log_change("order", r['id'], "UPDATE", "notes_free", r['notes_free'], new_notes)
+
+                        exec_query("UPDATE orders SET price_cost=?, price_sale=?, notes_free=?, updated_at=? WHERE id=?",
+                            (new_cost, new_sale, new_notes, now_iso(), r['id']))
                     st.session_state[f"edit_mode_{r['id']}"] = False
                     st.success("Alterações salvas")
                     st.rerun()
+
+metrics.page_finish(_page)
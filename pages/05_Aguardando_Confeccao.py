@@ -1,16 +1,22 @@
 import streamlit as st
 import os
-from core.db import get_conn, now_iso, from_json, exec_query
+from core.db import get_conn, now_iso, exec_query
 from core.models import OrderStatus
-from core.audit import log_change
+from core.status import change_status
 from ui.status_badges import badge
+from services.order_listing import list_orders, specs_items
+from services.photos import photos_for_orders, display_url
+from core import metrics
+
+_page = metrics.page_start(__file__)
 
 st.title("Aguardando Confecção")
 conn = get_conn()
-rows = exec_query("SELECT o.*, c.name AS client_name FROM orders o JOIN clients c ON c.id=o.client_id WHERE o.status=? ORDER BY o.id DESC", (OrderStatus.AGUARDANDO_CONF,)).fetchall()
+rows = list_orders(OrderStatus.AGUARDANDO_CONF)
+photos_by_order = photos_for_orders([r['id'] for r in rows if r['photo_count']])
 
 for r in rows:
-    with st.expander(f"#{r['id']} — {r['client_name']} • {r['category']}/{r['type']}/{r['product']}"):
+    with st.expander(f"#{r['id']} — {r['client_name']} • {r['product_path']}"):
         # Exibir informações do pedido
         cols = st.columns([1,1,1])
         with cols[0]:
@@ -25,14 +31,14 @@ for r in rows:
             st.write(r['notes_free'])
         
         # Exibir especificações estruturadas
-        notes_struct = from_json(r['notes_struct'], {})
-        if notes_struct:
+        specs = specs_items(r)
+        if specs:
             st.subheader("⚙️ Especificações")
-            for key, value in notes_struct.items():
+            for key, value in specs:
                 st.write(f"**{key}**: {value}")
         
         # Exibir fotos
-        photos = from_json(r['photos'], [])
+        photos = [display_url(ph) for ph in photos_by_order.get(r['id'], [])]
         if photos:
             st.subheader("📸 Fotos do Pedido")
             photo_cols = st.columns(6)
@@ -56,19 +62,18 @@ for r in rows:
         
         with action_cols[0]:
             if st.button("✅ Chegou conforme", key=f"ok_{r['id']}", use_container_width=True):
-                exec_query("UPDATE orders SET status=?, updated_at=? WHERE id=?", (OrderStatus.EM_ESTOQUE, now_iso(), r['id']), commit=True)
-                log_change("order", r['id'], "STATUS_UPDATE", "status", OrderStatus.AGUARDANDO_CONF, OrderStatus.EM_ESTOQUE)
+                change_status(r['id'], OrderStatus.AGUARDANDO_CONF, OrderStatus.EM_ESTOQUE)
                 st.success("Movido para 'Pedidos em Estoque'")
         
         with action_cols[1]:
             if st.button("❌ Não conforme", key=f"nc_{r['id']}", use_container_width=True):
-                exec_query("UPDATE orders SET status=?, updated_at=? WHERE id=?", (OrderStatus.RECEBIDO_NC, now_iso(), r['id']), commit=True)
-                log_change("order", r['id'], "STATUS_UPDATE", "status", OrderStatus.AGUARDANDO_CONF, OrderStatus.RECEBIDO_NC)
+                change_status(r['id'], OrderStatus.AGUARDANDO_CONF, OrderStatus.RECEBIDO_NC)
                 st.warning("Movido para 'Não Conformes'")
         
         with action_cols[2]:
             if st.button("🔙 Retornar para editar", key=f"return_{r['id']}", use_container_width=True):
-                exec_query("UPDATE orders SET status=?, updated_at=? WHERE id=?", (OrderStatus.CRIADO, now_iso(), r['id']), commit=True)
-                log_change("order", r['id'], "STATUS_UPDATE", "status", OrderStatus.AGUARDANDO_CONF, OrderStatus.CRIADO)
+                change_status(r['id'], OrderStatus.AGUARDANDO_CONF, OrderStatus.CRIADO)
                 st.info("Pedido retornado para 'Pedidos' — você pode editá-lo agora")
                 st.rerun()
+
+metrics.page_finish(_page)
@@ -1,15 +1,24 @@
 import streamlit as st
-from core.db import get_conn, now_iso, from_json, exec_query
+from core.db import get_conn, now_iso, exec_query
 from core.models import OrderStatus
 from ui.status_badges import badge
-from core.audit import log_change
+from core.audit import audit_batch, log_change, snapshot
+from core.status import change_status
+from services.rollups import record_entry, forget_order_entries
+from services.order_listing import list_orders, specs_items
+from services.photos import photos_for_orders, display_url
+from services.quality import unregister_order_ncs
+from core import metrics
+
+_page = metrics.page_start(__file__)
 
 st.title("Pedidos em Estoque")
 conn = get_conn()
-rows = exec_query("SELECT o.*, c.name AS client_name FROM orders o JOIN clients c ON c.id=o.client_id WHERE o.status=? ORDER BY o.id DESC", (OrderStatus.EM_ESTOQUE,)).fetchall()
+rows = list_orders(OrderStatus.EM_ESTOQUE)
+photos_by_order = photos_for_orders([r['id'] for r in rows if r['photo_count']])
 
 for r in rows:
-    with st.expander(f"#{r['id']} — {r['client_name']} • {r['category']}/{r['type']}/{r['product']}"):
+    with st.expander(f"#{r['id']} — {r['client_name']} • {r['product_path']}"):
         # Preços e Status
         cols = st.columns([1,1,1])
         with cols[0]:
@@ -24,14 +33,14 @@ for r in rows:
             st.write(r['notes_free'])
         
         # Exibir especificações estruturadas
-        notes_struct = from_json(r['notes_struct'], {})
-        if notes_struct:
+        specs = specs_items(r)
+        if specs:
             st.subheader("⚙️ Especificações")
-            for key, value in notes_struct.items():
+            for key, value in specs:
                 st.write(f"**{key}**: {value}")
         
         # Exibir fotos se existirem
-        photos = from_json(r['photos'], [])
+        photos = [display_url(ph) for ph in photos_by_order.get(r['id'], [])]
         if photos:
             st.subheader("📸 Fotos do Pedido")
             photo_cols = st.columns(6)
@@ -64,27 +73,28 @@ for r in rows:
         
         with col1:
             if st.button("✅ Concluir Entrega", key=f"done_{r['id']}", use_container_width=True):
-                if edit:
-                    log_change("order", r['id'], "PRICE_UPDATE", "price_cost", r['price_cost'], new_cost)
-                    log_change("order", r['id'], "PRICE_UPDATE", "price_sale", r['price_sale'], new_sale)
-                    exec_query("UPDATE orders SET price_cost=?, price_sale=?, updated_at=? WHERE id=?", (new_cost, new_sale, now_iso(), r['id']), commit=False)
-                
-                # Criar lançamento financeiro
-                margin = (new_sale or 0.0) - (new_cost or 0.0)
-                exec_query("INSERT INTO finance_entries(order_id, cost, sale, margin, settled, created_at) VALUES (?,?,?,?,0, ?)", (r['id'], new_cost, new_sale, margin, now_iso()), commit=False)
-                
-                # Atualizar status
-                exec_query("UPDATE orders SET status=?, updated_at=? WHERE id=?", (OrderStatus.ENTREGUE, now_iso(), r['id']), commit=True)
-                
-                log_change("order", r['id'], "STATUS_UPDATE", "status", OrderStatus.EM_ESTOQUE, OrderStatus.ENTREGUE)
+                # preços, lançamento, agregados, status e auditoria num único commit
+                with audit_batch():
+                    if edit:
+                        log_change("order", r['id'], "PRICE_UPDATE", "price_cost", r['price_cost'], new_cost)
+                        log_change("order", r['id'], "PRICE_UPDATE", "price_sale", r['price_sale'], new_sale)
+                        exec_query("UPDATE orders SET price_cost=?, price_sale=?, updated_at=? WHERE id=?", (new_cost, new_sale, now_iso(), r['id']), commit=False)
+
+                    # Criar lançamento financeiro
+                    margin = (new_sale or 0.0) - (new_cost or 0.0)
+                    created_at = now_iso()
+                    exec_query("INSERT INTO finance_entries(order_id, cost, sale, margin, settled, created_at) VALUES (?,?,?,?,0, ?)", (r['id'], new_cost, new_sale, margin, created_at), commit=False)
+                    record_entry(created_at, r['category'], new_cost, new_sale, margin)
+
+                    # Atualizar status
+                    change_status(r['id'], OrderStatus.EM_ESTOQUE, OrderStatus.ENTREGUE)
                 
                 st.success("✅ Entrega concluída e lançamento financeiro criado")
                 st.rerun()
         
         with col2:
             if st.button("🔙 Retornar para Confecção", key=f"return_{r['id']}", use_container_width=True):
-                exec_query("UPDATE orders SET status=?, updated_at=? WHERE id=?", (OrderStatus.AGUARDANDO_CONF, now_iso(), r['id']), commit=True)
-                log_change("order", r['id'], "STATUS_UPDATE", "status", OrderStatus.EM_ESTOQUE, OrderStatus.AGUARDANDO_CONF)
+                change_status(r['id'], OrderStatus.EM_ESTOQUE, OrderStatus.AGUARDANDO_CONF)
                 st.warning("↩️ Pedido retornado para Aguardando Confecção")
                 st.rerun()
         
@@ -98,8 +108,16 @@ for r in rows:
             col_confirm, col_cancel = st.columns(2)
             with col_confirm:
                 if st.button("✅ Sim, excluir", key=f"confirm_del_{r['id']}", use_container_width=True):
-                    log_change("order", r['id'], "DELETE", "all", str(r), None)
-                    exec_query("DELETE FROM orders WHERE id=?", (r['id'],), commit=True)
+                    with audit_batch():
+                        log_change("order", r['id'], "DELETE", "all", snapshot(r), None)
+                        # Remover registros dependentes (chaves estrangeiras ativas no SQLite e no Postgres)
+                        exec_query("DELETE FROM order_photos WHERE order_id=?", (r['id'],))
+                        exec_query("DELETE FROM shipments WHERE order_id=?", (r['id'],))
+                        unregister_order_ncs(r)
+                        exec_query("DELETE FROM nonconformities WHERE order_id=?", (r['id'],))
+                        forget_order_entries(r['id'])
+                        exec_query("DELETE FROM finance_entries WHERE order_id=?", (r['id'],))
+                        exec_query("DELETE FROM orders WHERE id=?", (r['id'],))
                     st.success("✅ Pedido deletado com sucesso")
                     st.rerun()
             
@@ -107,3 +125,5 @@ for r in rows:
                 if st.button("❌ Cancelar", key=f"cancel_del_{r['id']}", use_container_width=True):
                     st.session_state[f"delete_mode_{r['id']}"] = False
                     st.rerun()
+
+metrics.page_finish(_page)
@@ -2,15 +2,23 @@ import streamlit as st
 import os
 from core.db import get_conn, now_iso, to_json, from_json, exec_query
 from core.models import OrderStatus
-from core.storage import save_and_resize
+from core.status import change_status
+from services.quality import register_nc
+from core.storage import save_photo
 from services.motores.nc_pdf_generator import generate_nc_pdf
+from services.order_listing import list_orders
+from services.photos import photos_for_orders, display_url
+from core import metrics
+
+_page = metrics.page_start(__file__)
 
 st.title("Pedidos Não Conformes")
 conn = get_conn()
-rows = exec_query("SELECT o.*, c.name AS client_name FROM orders o JOIN clients c ON c.id=o.client_id WHERE o.status=? ORDER BY o.id DESC", (OrderStatus.RECEBIDO_NC,)).fetchall()
+rows = list_orders(OrderStatus.RECEBIDO_NC)
+photos_by_order = photos_for_orders([r['id'] for r in rows if r['photo_count']])
 
 for r in rows:
-    with st.expander(f"#{r['id']} — {r['client_name']} • {r['category']}/{r['type']}/{r['product']}"):
+    with st.expander(f"#{r['id']} — {r['client_name']} • {r['product_path']}"):
         # Informações do pedido
         col1, col2, col3 = st.columns(3)
         with col1:
@@ -20,10 +28,15 @@ for r in rows:
         with col3:
             st.caption(f"**Produto:** {r['product']}")
         
+        # Reincidência (NCs já registradas, da projeção)
+        ncs_anteriores = r['nc_count']
+        if ncs_anteriores:
+            st.warning(f"🔁 Reincidência: este pedido já teve {ncs_anteriores} NC(s) registrada(s)")
+        
         st.divider()
         
         # Fotos Originais do Pedido
-        original_photos = from_json(r['photos'], [])
+        original_photos = [display_url(ph) for ph in photos_by_order.get(r['id'], [])]
         if original_photos:
             st.caption("📷 Fotos Originais do Pedido")
             photo_cols = st.columns(3)
@@ -74,11 +87,12 @@ for r in rows:
                     saved_photos = []
                     if problem_photos:
                         for idx, photo in enumerate(problem_photos):
-                            photo_path = save_and_resize(photo, filename_base=f"nc_pedido_{r['id']}_{idx}")
-                            saved_photos.append(photo_path)
+                            meta = save_photo(photo, filename_base=f"nc_pedido_{r['id']}_{idx}")
+                            if meta:
+                                saved_photos.append(meta)
                     
                     # Gerar PDF
-                    pdf_path = generate_nc_pdf(r, kind, desc, saved_photos)
+                    pdf_path = generate_nc_pdf(r, kind, desc, [p['url'] for p in saved_photos])
                     
                     # Preparar para download
                     with open(pdf_path, "rb") as pdf_file:
@@ -101,27 +115,15 @@ for r in rows:
                     saved_photos = []
                     if problem_photos:
                         for idx, photo in enumerate(problem_photos):
-                            photo_path = save_and_resize(photo, filename_base=f"nc_pedido_{r['id']}_{idx}")
-                            saved_photos.append(photo_path)
+                            meta = save_photo(photo, filename_base=f"nc_pedido_{r['id']}_{idx}")
+                            if meta:
+                                saved_photos.append(meta)
                     
-                    # Registrar NC
-                    exec_query(
-                        "INSERT INTO nonconformities(order_id, kind, description, photos, created_at) VALUES (?,?,?,?,?)",
-                        (r['id'], kind, desc, to_json(saved_photos), now_iso()),
-                        commit=True
-                    )
+                    # Registrar NC (atualiza contadores de reincidência)
+                    register_nc(r, kind, desc, saved_photos)
                     
-                    # Mover para Aguardando Confecção
-                    exec_query(
-                        "UPDATE orders SET status=?, updated_at=? WHERE id=?",
-                        (OrderStatus.AGUARDANDO_CONF, now_iso(), r['id']),
-                        commit=True
-                    )
-                    
-                    # Registrar auditoria
-                    exec_query(
-                        "INSERT INTO audit_log(entity, entity_id, action, field, before, after, username, ts) VALUES (?,?,?,?,?,?,?,?)",
-                        ('orders', r['id'], 'status_changed', 'status', OrderStatus.RECEBIDO_NC, OrderStatus.AGUARDANDO_CONF, 'system', now_iso()),
-                        commit=True
-                    )
+                    # Mover para Aguardando Confecção (histórico + auditoria, mesma transação)
+                    change_status(r['id'], OrderStatus.RECEBIDO_NC, OrderStatus.AGUARDANDO_CONF)
                     st.success("✅ NC registrada! Pedido retornou para 'Aguardando Confecção'")
+
+metrics.page_finish(_page)
@@ -1,8 +1,11 @@
 import streamlit as st
-import pandas as pd
 from datetime import datetime, timedelta
 from core.db import get_conn, exec_query
 from services.payments import create_payment_batch
+from services.rollups import period_totals
+from core import metrics
+
+_page = metrics.page_start(__file__)
 
 st.title("💰 Financeiro")
 conn = get_conn()
@@ -83,21 +86,27 @@ else:
     # ============================================================================
     st.subheader("📋 Resumo do Período")
     
+    # Totais do período lidos dos agregados diários (finance_daily), sem somar linha a linha
+    totais = period_totals(start_iso, end_iso)
+    vazio = {'entries': 0, 'cost': 0.0, 'sale': 0.0, 'margin': 0.0}
+    pago = totais[1] if status_filter != "⏳ Pendentes" else vazio
+    pendente = totais[0] if status_filter != "✅ Pagos" else vazio
+
     # Calcular totais gerais
     total_pedidos = len(rows)
-    total_custo_geral = sum(r['_cost'] for r in data)
-    total_venda_geral = sum(r['_sale'] for r in data)
+    total_custo_geral = pago['cost'] + pendente['cost']
+    total_venda_geral = pago['sale'] + pendente['sale']
     total_lucro_geral = total_venda_geral - total_custo_geral
     
     # Pedidos pagos vs pendentes
-    pedidos_pagos = len([r for r in data if r['_settled'] == 1])
-    pedidos_pendentes = len([r for r in data if r['_settled'] == 0])
+    pedidos_pagos = pago['entries']
+    pedidos_pendentes = pendente['entries']
     
     # Valores pagos vs pendentes
-    valor_custo_pago = sum(r['_cost'] for r in data if r['_settled'] == 1)
-    valor_custo_pendente = sum(r['_cost'] for r in data if r['_settled'] == 0)
-    valor_venda_pago = sum(r['_sale'] for r in data if r['_settled'] == 1)
-    valor_venda_pendente = sum(r['_sale'] for r in data if r['_settled'] == 0)
+    valor_custo_pago = pago['cost']
+    valor_custo_pendente = pendente['cost']
+    valor_venda_pago = pago['sale']
+    valor_venda_pendente = pendente['sale']
     lucro_pago = valor_venda_pago - valor_custo_pago
     lucro_pendente = valor_venda_pendente - valor_custo_pendente
     
@@ -131,6 +140,7 @@ else:
     
     st.divider()
     
+    import pandas as pd    # só quando há lançamentos para montar a tabela
     df = pd.DataFrame(data)
     
     # Estado para controlar seleções
@@ -273,3 +283,5 @@ else:
                     st.rerun()
         else:
             st.info("👆 Selecione pelo menos um pedido pendente para simular o pagamento")
+
+metrics.page_finish(_page)
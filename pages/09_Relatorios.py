@@ -1,14 +1,151 @@
 import streamlit as st
+from datetime import date, timedelta
 from core.db import get_conn, exec_query
+from services import reports
+from services.rollups import monthly_trend
+from services import quality
+from core import metrics
+
+_page = metrics.page_start(__file__)
 
 st.title("Relatórios")
 conn = get_conn()
-# Stubs simples de contagem (compatível com Postgres dict rows e sqlite3.Row)
-r = exec_query("SELECT COUNT(*) AS c FROM orders").fetchone()
-criadas = r['c'] if (isinstance(r, dict) or hasattr(r, 'keys')) else (r[0] if r else 0)
 
-r = exec_query("SELECT COUNT(*) AS c FROM orders WHERE status='FINALIZADO_FIN'").fetchone()
-finalizadas = r['c'] if (isinstance(r, dict) or hasattr(r, 'keys')) else (r[0] if r else 0)
+# Contagens gerais
+criadas = exec_query("SELECT COUNT(*) AS c FROM orders").fetchone()['c']
+finalizadas = exec_query("SELECT COUNT(*) AS c FROM orders WHERE status='FINALIZADO_FIN'").fetchone()['c']
+
+col1, col2 = st.columns(2)
+col1.metric("Total de pedidos", criadas)
+col2.metric("Finalizados (financeiro)", finalizadas)
+
+# Período (resultados cacheados por período em services.reports)
+st.subheader("Período")
+col1, col2 = st.columns(2)
+with col1:
+    start = st.date_input("Data inicial", value=date.today() - timedelta(days=365), format="DD/MM/YYYY")
+with col2:
+    end = st.date_input("Data final", value=date.today(), format="DD/MM/YYYY")
+
+tab1, tab2, tab3, tab4, tab5 = st.tabs(["⏱️ Lead times", "❌ Não conformidades", "📊 Margens", "🏆 Clientes", "📈 Tendência"])
+
+with tab1:
+    st.caption("Dias que os pedidos permanecem em cada status")
+    rows = reports.lead_times(start, end)
+    if rows:
+        st.dataframe(
+            [{
+                "Status": r['status'],
+                "Permanências": r['n'],
+                "Média (dias)": round(r['avg_days'], 1),
+                "Mediana (dias)": round(r['median_days'], 1),
+                "P90 (dias)": round(r['p90_days'], 1),
+            } for r in rows],
+            hide_index=True,
+            use_container_width=True,
+        )
+    else:
+        st.info("Nenhuma mudança de status no período")
+
+    st.caption("Permanência em um status por categoria")
+    sel_status = st.selectbox("Status", ["AGUARDANDO_CONF", "RECEBIDO_NC", "EM_ESTOQUE", "ENTREGUE"])
+    rows = reports.time_in_status(sel_status, start, end)
+    if rows:
+        st.dataframe(
+            [{
+                "Categoria": r['category'],
+                "Permanências": r['n'],
+                "Média (dias)": round(r['avg_days'], 1),
+                "Mediana (dias)": round(r['median_days'], 1),
+            } for r in rows],
+            hide_index=True,
+            use_container_width=True,
+        )
+
+with tab2:
+    level = st.radio("Agrupar por", ["category", "type", "product"], horizontal=True,
+                     format_func={"category": "Categoria", "type": "Tipo", "product": "Produto"}.get)
+    rows = reports.nc_rates(start, end, level)
+    if rows:
+        st.dataframe(
+            [{
+                "Produto": " / ".join(r[c] for c in reports.NC_LEVELS[level]),
+                "Pedidos": r['orders'],
+                "Pedidos com NC": r['orders_nc'],
+                "NCs": r['ncs'],
+                "Taxa NC": f"{r['nc_rate'] * 100:.1f}%",
+            } for r in rows],
+            hide_index=True,
+            use_container_width=True,
+        )
+    else:
+        st.info("Nenhum pedido no período")
+
+    # Reincidência geral (contadores incrementais de services.quality)
+    resumo = quality.summary()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("NCs registradas (total)", resumo['ncs'])
+    col2.metric("Pedidos com NC", resumo['orders_with_nc'])
+    col3.metric("Taxa de reincidência", f"{resumo['recurrence_rate'] * 100:.1f}%", f"{resumo['recurrent_orders']} pedido(s)")
+
+    kinds = reports.nc_kinds(start, end)
+    if kinds:
+        st.caption("NCs por tipo")
+        st.bar_chart({k['kind']: k['ncs'] for k in kinds})
+
+with tab3:
+    stats, histogram = reports.margin_distribution(start, end)
+    if stats:
+        st.dataframe(
+            [{
+                "Categoria": r['category'],
+                "Lançamentos": r['n'],
+                "Média %": round(r['avg_pct'], 1),
+                "P25 %": round(r['p25_pct'], 1),
+                "Mediana %": round(r['p50_pct'], 1),
+                "P75 %": round(r['p75_pct'], 1),
+            } for r in stats],
+            hide_index=True,
+            use_container_width=True,
+        )
+        st.caption("Distribuição da margem (% sobre a venda)")
+        st.bar_chart({(f"{int(h['bucket'])}%" if h['bucket'] >= 0 else "< 0%"): h['entries'] for h in histogram})
+    else:
+        st.info("Nenhum lançamento financeiro no período")
+
+with tab4:
+    rows = reports.top_clients(start, end, 10)
+    if rows:
+        st.dataframe(
+            [{
+                "#": r['ranking'],
+                "Cliente": r['name'],
+                "Pedidos": r['orders'],
+                "Venda": f"R$ {r['sale']:.2f}",
+                "Margem": f"R$ {r['margin']:.2f}",
+                "Participação": f"{r['share'] * 100:.1f}%",
+            } for r in rows],
+            hide_index=True,
+            use_container_width=True,
+        )
+    else:
+        st.info("Nenhum lançamento financeiro no período")
+
+with tab5:
+    # Tendência mensal (lê finance_monthly: poucas centenas de linhas para 2 anos)
+    st.caption("Tendência financeira (24 meses)")
+    hoje = date.today()
+    inicio = date(hoje.year - 2, hoje.month, 1)
+    trend = monthly_trend(inicio.strftime("%Y-%m"), hoje.strftime("%Y-%m"))
+    if trend:
+        st.line_chart(
+            {
+                "Custo": {t['month']: t['cost'] for t in trend},
+                "Venda": {t['month']: t['sale'] for t in trend},
+                "Margem": {t['month']: t['margin'] for t in trend},
+            }
+        )
+    else:
+        st.info("Nenhum lançamento financeiro no período")
 
-st.write(f"Total de pedidos: {criadas}")
-st.write(f"Finalizados (financeiro): {finalizadas}")
+metrics.page_finish(_page)
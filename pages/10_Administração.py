@@ -1,9 +1,14 @@
 import streamlit as st
 import os
 import shutil
+import sqlite3
 from pathlib import Path
-from core.db import get_conn, now_iso, exec_query
+from core.db import get_conn, now_iso, exec_query, is_postgres_conn, journal_mode, set_query_stats, query_stats_enabled
+from core import querystats, metrics
 from core.audit import log_change
+from services import audit_archive, audit_query, backup, reconcile, storage_stats
+
+_page = metrics.page_start(__file__)
 
 st.set_page_config(page_title="Administração", page_icon="🔧", layout="wide")
 st.title("🔧 Administração do Sistema")
@@ -11,19 +16,10 @@ st.title("🔧 Administração do Sistema")
 conn = get_conn()
 
 # Paths
-UPLOADS_DIR = Path("uploads")
-EXPORTS_DIR = Path("exports")
+UPLOADS_DIR = Path(storage_stats.AREAS["uploads"])
+EXPORTS_DIR = Path(storage_stats.AREAS["exports"])
 DB_FILE = "exonvais.db"
 
-def get_dir_size(path):
-    """Calcula tamanho total de um diretório em bytes."""
-    total = 0
-    if path.exists():
-        for entry in path.rglob("*"):
-            if entry.is_file():
-                total += entry.stat().st_size
-    return total
-
 def format_bytes(bytes_size):
     """Formata bytes para unidade legível."""
     for unit in ["B", "KB", "MB", "GB"]:
@@ -32,39 +28,13 @@ def format_bytes(bytes_size):
         bytes_size /= 1024.0
     return f"{bytes_size:.2f} TB"
 
-def get_file_count(path):
-    """Conta arquivos em um diretório."""
-    if not path.exists():
-        return 0
-    return len(list(path.rglob("*")))
-
-def find_orphaned_uploads():
-    """Encontra fotos sem pedido associado."""
-    orphaned = []
-    if UPLOADS_DIR.exists():
-        for photo_file in UPLOADS_DIR.rglob("*.jpg"):
-            # Verificar se foto existe em algum pedido
-            filename = photo_file.name
-            # Buscar em todas as linhas da coluna photos
-            result = exec_query(  # type: ignore
-                "SELECT COUNT(*) as count FROM orders WHERE photos LIKE ?",
-                (f"%{filename}%",)
-            ).fetchone()
-            
-            # Só marcar como órfã se realmente não encontrou em nenhum pedido
-            if result and result['count'] == 0:
-                orphaned.append(photo_file)
-    return orphaned
-
-def get_audit_log(limit=20):
-    """Busca últimas mudanças do sistema."""
-    return exec_query(  # type: ignore
-        "SELECT * FROM audit_log ORDER BY ts DESC LIMIT ?",
-        (limit,)
-    ).fetchall()
+@st.cache_data(ttl=300)
+def audit_actions():
+    """Ações distintas para o filtro (muda pouco: cache de 5 min)."""
+    return audit_query.actions()
 
 # Tabs
-tab1, tab2, tab3, tab4 = st.tabs(["📈 Estatísticas", "🧹 Limpeza", "📋 Auditoria", "⚙️ Avançado"])
+tab1, tab2, tab3, tab4, tab5 = st.tabs(["📈 Estatísticas", "🧹 Limpeza", "📋 Auditoria", "⚙️ Avançado", "⏱️ Desempenho"])
 
 # ==================== TAB 1: ESTATÍSTICAS ====================
 with tab1:
@@ -82,23 +52,24 @@ with tab1:
     with col2:
         st.metric("📦 Pedidos", total_orders['count'])
     
+    # Arquivos locais: totais mantidos por services.storage_stats (sem varrer a cada rerun)
+    storage = storage_stats.stats()
+    
     # Total de fotos
-    total_photos = get_file_count(UPLOADS_DIR)
     with col3:
-        st.metric("📸 Fotos", total_photos)
+        st.metric("📸 Fotos", storage["uploads"]["files"])
     
     # Total de PDFs
-    total_pdfs = get_file_count(EXPORTS_DIR)
     with col4:
-        st.metric("📄 PDFs", total_pdfs)
+        st.metric("📄 PDFs", storage["exports"]["files"])
     
     st.divider()
     
     # Tamanhos
     col1, col2, col3, col4 = st.columns(4)
     
-    uploads_size = get_dir_size(UPLOADS_DIR)
-    exports_size = get_dir_size(EXPORTS_DIR)
+    uploads_size = storage["uploads"]["bytes"]
+    exports_size = storage["exports"]["bytes"]
     db_size = os.path.getsize(DB_FILE) if os.path.exists(DB_FILE) else 0
     total_size = uploads_size + exports_size + db_size
     
@@ -113,6 +84,16 @@ with tab1:
     
     with col4:
         st.metric("💾 Total", format_bytes(total_size))
+    
+    if storage["scanning"]:
+        st.caption("🔄 Recalculando o uso de disco em segundo plano...")
+    elif storage["error"]:
+        st.caption(f"⚠️ Última varredura falhou: {storage['error']}")
+    else:
+        st.caption(f"Arquivos contados em {storage['scanned_at'] or '—'} (atualizados a cada gravação; varredura completa periódica)")
+    if st.button("🔄 Recalcular agora", key="rescan_storage"):
+        storage_stats.start_rescan()
+        st.rerun()
 
 # ==================== TAB 2: LIMPEZA ====================
 with tab2:
@@ -157,12 +138,16 @@ with tab2:
         if confirm == "DELETAR PDFS":
             if EXPORTS_DIR.exists():
                 deleted_count = 0
+                freed = 0
                 for pdf_file in EXPORTS_DIR.glob("*.pdf"):
                     try:
+                        size = pdf_file.stat().st_size
                         os.remove(pdf_file)
                         deleted_count += 1
+                        freed += size
                     except Exception as e:
                         st.error(f"Erro ao deletar {pdf_file.name}: {e}")
+                storage_stats.record_delete("exports", freed, files=deleted_count)
                 
                 log_change("system", "cleanup", "PDFs_DELETED", "count", 0, deleted_count)
                 st.success(f"✅ {deleted_count} PDFs deletados com sucesso!")
@@ -175,21 +160,36 @@ with tab2:
     # Limpeza de uploads órfãos
     st.markdown("### 📸 Limpar Fotos Órfãs")
     
+    st.caption(f"Compara as fotos do armazenamento ({reconcile.storage_backend()}) com as referências de pedidos e NCs")
+
     if st.button("📋 Listar fotos sem pedido", key="list_orphaned"):
-        orphaned = find_orphaned_uploads()
+        if not reconcile.start_scan():
+            st.info("ℹ️ Já existe uma varredura em andamento")
+
+    scan = reconcile.scan_status()
+    if scan['running']:
+        st.info(f"⏳ Varredura em andamento desde {scan['started_at']}...")
+        if st.button("🔄 Atualizar", key="refresh_orphaned"):
+            st.rerun()
+    elif scan['error']:
+        st.error(f"❌ Falha na varredura: {scan['error']}")
+    elif scan['result']:
+        result = scan['result']
+        orphaned = result['orphans']
+        st.caption(f"{result['files']} arquivos, {result['references']} referências, "
+                   f"{result['elapsed_s']:.2f}s (concluída em {result['finished_at']})")
         if orphaned:
             st.warning(f"⚠️ Encontradas {len(orphaned)} fotos órfãs")
-            total_save = sum(p.stat().st_size for p in orphaned)
-            st.info(f"💾 Economia esperada: {format_bytes(total_save)}")
-            
+            st.info(f"💾 Economia esperada: {format_bytes(result['orphan_bytes'])}")
+
             for photo in orphaned[:10]:
-                st.text(f"• {photo.name} ({format_bytes(photo.stat().st_size)})")
-            
+                st.text(f"• {photo['name']} ({format_bytes(photo['size'])})")
+
             if len(orphaned) > 10:
                 st.text(f"... e mais {len(orphaned) - 10} arquivos")
         else:
             st.success("✅ Nenhuma foto órfã encontrada!")
-    
+
     if st.button("🗑️ Deletar fotos órfãs", key="delete_orphaned"):
         # Confirmação MUITO FORTE
         st.warning("⚠️⚠️⚠️ OPERAÇÃO IRREVERSÍVEL ⚠️⚠️⚠️")
@@ -198,19 +198,14 @@ with tab2:
         confirm = st.text_input("Confirmação (deixe vazio e clique novamente para cancelar):", key="confirm_orphaned")
         
         if confirm == "DELETAR FOTOS":
-            orphaned = find_orphaned_uploads()
-            deleted_count = 0
-            
+            # Recalcula na hora: a lista exibida pode estar desatualizada
+            orphaned = reconcile.find_orphans()['orphans']
             st.info(f"Deletando {len(orphaned)} fotos órfãs...")
-            
-            for photo in orphaned:
-                try:
-                    os.remove(photo)
-                    deleted_count += 1
-                    st.text(f"✅ Deletado: {photo.name}")
-                except Exception as e:
-                    st.error(f"❌ Erro ao deletar {photo.name}: {e}")
-            
+
+            deleted_count, errors = reconcile.delete_orphans(orphaned)
+            for error in errors:
+                st.error(f"❌ Erro ao deletar {error}")
+
             log_change("system", "cleanup", "ORPHANED_PHOTOS_DELETED", "count", 0, deleted_count)
             st.success(f"✅ {deleted_count} fotos órfãs deletadas!")
             st.rerun()
@@ -219,72 +214,157 @@ with tab2:
     
     st.divider()
     
-    # Compactação do banco
-    st.markdown("### 🗄️ Compactar Banco de Dados")
+    # Backup e compactação do banco (SQLite)
+    st.markdown("### 💾 Backup do Banco de Dados")
     
-    db_size_before = os.path.getsize(DB_FILE) if os.path.exists(DB_FILE) else 0
+    if is_postgres_conn(conn):
+        st.info("ℹ️ PostgreSQL: use os backups do provedor (Supabase/Neon) ou pg_dump")
+    else:
+        st.caption(f"Cópia online em passos curtos (as outras sessões continuam gravando), comprimida em {backup.BACKUP_DIR}; mantém os {backup.KEEP} mais recentes")
+        
+        if st.button("💾 Gerar backup agora", key="create_backup"):
+            bar = st.progress(0.0, text="Copiando páginas...")
+            try:
+                info = backup.create_backup(lambda done, total: bar.progress(done / total if total else 1.0, text=f"{done}/{total} páginas"))
+                bar.progress(1.0, text="Concluído")
+                log_change("system", "maintenance", "BACKUP_CREATED", "path", None, os.path.basename(info['path']))
+                st.success(f"✅ Backup gerado: {os.path.basename(info['path'])} "
+                           f"({format_bytes(info['bytes'])} de {format_bytes(info['db_bytes'])}, {info['elapsed_s']:.1f}s)")
+                if info['removed']:
+                    st.caption(f"Rotação: {len(info['removed'])} backup(s) antigo(s) removido(s)")
+            except Exception as e:
+                st.error(f"❌ Erro no backup: {e}")
+        
+        backups = backup.list_backups()
+        if backups:
+            for b in backups:
+                col1, col2 = st.columns([4, 1])
+                with col1:
+                    st.text(f"• {b['name']} ({format_bytes(b['bytes'])}, {b['created_at']})")
+                with col2:
+                    with open(b['path'], "rb") as f:
+                        st.download_button("⬇️", data=f.read(), file_name=b['name'], mime="application/gzip", key=f"dl_{b['name']}")
+        else:
+            st.caption("Nenhum backup ainda")
     
-    col1, col2 = st.columns(2)
-    with col1:
-        st.metric("Tamanho atual", format_bytes(db_size_before))
+    st.divider()
     
-    if st.button("🔧 Executar VACUUM (Compactar)", key="vacuum_db"):
-        try:
-            exec_query("VACUUM", commit=True)  # type: ignore
-            db_size_after = os.path.getsize(DB_FILE) if os.path.exists(DB_FILE) else 0
-            saved = db_size_before - db_size_after
-            
-            log_change("system", "maintenance", "VACUUM_EXECUTED", "saved_bytes", db_size_before, db_size_after)
-            
-            with col2:
-                st.metric("Tamanho após", format_bytes(db_size_after))
-            
-            if saved > 0:
-                st.success(f"✅ Banco compactado! Economizados: {format_bytes(saved)}")
-            else:
-                st.info("ℹ️ Banco já estava otimizado")
-        except Exception as e:
-            st.error(f"❌ Erro ao compactar: {e}")
+    st.markdown("### 🗄️ Compactar Banco de Dados")
+    
+    if not is_postgres_conn(conn):
+        vac = backup.vacuum_status()
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("Tamanho atual", format_bytes(vac['pages'] * vac['page_size']))
+        with col2:
+            st.metric("Espaço livre recuperável", format_bytes(vac['free_bytes']))
+        
+        if vac['auto_vacuum'] == "incremental":
+            if st.button("🔧 Liberar espaço (incremental)", key="incremental_vacuum", disabled=not vac['free_pages']):
+                bar = st.progress(0.0, text="Liberando páginas...")
+                try:
+                    freed = backup.incremental_vacuum(progress=lambda done, total: bar.progress(min(1.0, done / total) if total else 1.0))
+                    log_change("system", "maintenance", "INCREMENTAL_VACUUM", "freed_bytes", 0, freed * vac['page_size'])
+                    st.success(f"✅ {format_bytes(freed * vac['page_size'])} devolvidos ao disco")
+                except Exception as e:
+                    st.error(f"❌ Erro ao compactar: {e}")
+        else:
+            st.warning("⚠️ Este banco ainda não usa compactação incremental. A ativação faz um VACUUM completo "
+                       "uma única vez, que bloqueia as outras sessões enquanto reescreve o arquivo.")
+            if st.button("🔧 Ativar compactação incremental (VACUUM único)", key="enable_incremental_vacuum"):
+                try:
+                    before = vac['pages'] * vac['page_size']
+                    after = backup.enable_incremental_vacuum()
+                    log_change("system", "maintenance", "VACUUM_EXECUTED", "saved_bytes", before, after['pages'] * after['page_size'])
+                    st.success(f"✅ Compactação incremental ativada ({format_bytes(after['pages'] * after['page_size'])})")
+                except Exception as e:
+                    st.error(f"❌ Erro ao compactar: {e}")
 
 # ==================== TAB 3: AUDITORIA ====================
 with tab3:
     st.subheader("📋 Logs de Auditoria")
-    
-    limit = st.slider("Mostrar últimos (registros):", 10, 100, 20)
-    
-    audit_logs = get_audit_log(limit)
-    
-    if audit_logs:
-        # Criar tabela formatada incluindo o usuário responsável
-        for log in audit_logs:
-            col1, col2, col3 = st.columns([2, 2, 4])
-
-            with col1:
-                st.caption(log['ts'])
-
-            with col2:
-                st.caption(f"**{log['entity']}** #{log['entity_id']}")
-                # Mostrar username se presente (compatível com sqlite3.Row e dicts)
-                username = None
-                try:
-                    # dict-like with get
-                    username = log.get('username')
-                except AttributeError:
-                    # sqlite3.Row doesn't have get(); fallback seguro
-                    if 'username' in log:
-                        username = log['username']
-
-                if username:
-                    st.caption(f"Usuário: {username}")
-
-            with col3:
-                st.caption(f"{log['action']}: {log['field']} ({log['before']} → {log['after']})")
-        
-        st.divider()
-        st.info(f"Total de {len(audit_logs)} registros mostrados")
+
+    with st.form("audit_filters"):
+        col1, col2, col3, col4 = st.columns(4)
+        f_entity = col1.selectbox("Entidade", ["", "order", "system"])
+        f_entity_id = col2.text_input("ID", placeholder="ex.: 4312")
+        f_action = col3.selectbox("Ação", [""] + audit_actions())
+        f_field = col4.text_input("Campo", placeholder="ex.: price_sale")
+        col1, col2, col3, col4 = st.columns(4)
+        f_user = col1.text_input("Usuário")
+        f_since = col2.date_input("De", value=None)
+        f_until = col3.date_input("Até", value=None)
+        page_size = col4.selectbox("Por página", [50, 100, 200, 500])
+        st.form_submit_button("🔎 Filtrar")
+
+    filters = dict(
+        entity=f_entity or None,
+        entity_id=int(f_entity_id) if f_entity_id.strip().isdigit() else None,
+        action=f_action or None,
+        field=f_field.strip() or None,
+        username=f_user.strip() or None,
+        since=f_since,
+        until=f_until,
+    )
+    # cursores das páginas já vistas; voltam ao início quando os filtros mudam
+    filters_key = repr((filters, page_size))
+    if st.session_state.get("audit_filters_key") != filters_key:
+        st.session_state["audit_filters_key"] = filters_key
+        st.session_state["audit_cursors"] = [None]
+    cursors = st.session_state["audit_cursors"]
+
+    rows, next_cursor = audit_query.query(**filters, after=cursors[-1], limit=page_size)
+
+    if rows:
+        st.dataframe(
+            [dict(r) for r in rows],
+            column_config={
+                "id": None,
+                "ts": "Data/hora (UTC)",
+                "entity": "Entidade",
+                "entity_id": "ID",
+                "action": "Ação",
+                "field": "Campo",
+                "before": "Antes",
+                "after": "Depois",
+                "username": "Usuário",
+            },
+            hide_index=True,
+            use_container_width=True,
+        )
     else:
         st.info("ℹ️ Nenhum log de auditoria encontrado")
 
+    col_prev, col_page, col_next = st.columns([1, 2, 1])
+    if col_prev.button("⬅️ Anterior", disabled=len(cursors) == 1, use_container_width=True):
+        cursors.pop()
+        st.rerun()
+    col_page.caption(f"Página {len(cursors)} · {len(rows)} registros")
+    if col_next.button("Próxima ➡️", disabled=next_cursor is None, use_container_width=True):
+        cursors.append(next_cursor)
+        st.rerun()
+
+    with st.expander("🗄️ Retenção e arquivo"):
+        ast = audit_archive.stats()
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Tabela ativa", f"{ast['live']:,}".replace(",", "."))
+        col2.metric("Tabela de arquivo", f"{ast['archived']:,}".replace(",", "."))
+        col3.metric("Arquivos .jsonl.gz", ast['files'], format_bytes(ast['file_bytes']), delta_color="off")
+        retention = audit_archive.RETENTION_DAYS
+        st.caption(
+            f"Entrada mais antiga na tabela ativa: {ast['oldest_live'] or '-'} · "
+            f"após {audit_archive.HOT_DAYS} dias vai para o arquivo"
+            + (f" · após {retention} dias sai do banco para {audit_archive.ARCHIVE_DIR}" if retention else " · sem retenção em arquivos (EXONVAIS_AUDIT_RETENTION_DAYS)")
+            + f" · última manutenção: {ast['last_run'] or 'nunca'}"
+        )
+        if st.button("▶️ Executar manutenção agora", key="audit_maintenance"):
+            with st.spinner("Arquivando..."):
+                result = audit_archive.run_maintenance()
+            st.success(f"✅ {result['moved_to_archive']} movidas para o arquivo, "
+                       f"{sum(result['exported'].values())} exportadas para arquivos, "
+                       f"{result['partitions_created']} partições criadas")
+
 # ==================== TAB 4: AVANÇADO ====================
 with tab4:
     st.subheader("⚙️ Configurações Avançadas")
@@ -310,9 +390,110 @@ with tab4:
     
     with col2:
         st.info("ℹ️ **Informações do Sistema**")
-        st.text(f"Versão do banco: SQLite")
-        st.text(f"Modo WAL: Ativado")
+        mode = journal_mode()
+        if mode == "postgres":
+            st.text("Versão do banco: PostgreSQL")
+        else:
+            st.text(f"Versão do banco: SQLite {sqlite3.sqlite_version}")
+            st.text(f"Modo WAL: {'Ativado' if mode == 'wal' else f'Desativado ({mode})'}")
         st.text(f"Última execução: {now_iso()}")
 
+# ==================== TAB 5: DESEMPENHO ====================
+with tab5:
+    st.subheader("⏱️ Consultas ao Banco")
+    st.caption("Instrumentação do exec_query (vale para todas as sessões deste processo enquanto ligada)")
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        enabled = st.toggle("Registrar consultas", value=query_stats_enabled(), key="query_stats_toggle")
+        if enabled != query_stats_enabled():
+            set_query_stats(enabled)
+    with col2:
+        top_n = st.number_input("Top N", min_value=5, max_value=100, value=20, step=5)
+    with col3:
+        order_by = st.selectbox("Ordenar por", ["total_ms", "calls", "max_ms", "rows"],
+                                format_func={"total_ms": "Tempo total", "calls": "Chamadas", "max_ms": "Pior caso", "rows": "Linhas"}.get)
+        if st.button("🔄 Zerar estatísticas", key="reset_query_stats"):
+            querystats.reset()
+
+    top = querystats.top(int(top_n), order_by)
+    if top:
+        labels = querystats.histogram_labels()
+        st.dataframe(
+            [{
+                "Consulta": e['sql'][:300],
+                "Chamadas": e['calls'],
+                "Total (ms)": round(e['total_ms'], 1),
+                "Média (ms)": round(e['avg_ms'], 2),
+                "Pior (ms)": round(e['max_ms'], 1),
+                "Linhas": e['rows'],
+                "Erros": e['errors'],
+                "Origem": ", ".join(f"{k} ({v})" for k, v in sorted(e['callers'].items(), key=lambda kv: -kv[1])),
+                "Histograma": " · ".join(f"{label}: {n}" for label, n in zip(labels, e['histogram']) if n),
+            } for e in top],
+            hide_index=True,
+            use_container_width=True,
+        )
+    elif enabled:
+        st.info("ℹ️ Nenhuma consulta registrada ainda. Navegue pelas páginas e volte aqui.")
+    else:
+        st.info("ℹ️ Instrumentação desligada (ligue acima ou defina EXONVAIS_QUERY_STATS=1)")
+
+    slow = querystats.slow_queries()
+    if slow:
+        st.markdown(f"### 🐢 Consultas lentas (≥ {querystats.SLOW_QUERY_MS:.0f} ms)")
+        st.dataframe(slow, hide_index=True, use_container_width=True)
+
+    st.divider()
+    st.subheader("📊 Métricas do Processo")
+    st.caption("Desde o início do processo (core/metrics.py)")
+
+    rss = metrics.rss_bytes()
+    hits = metrics.counter_value("cache_requests_total", cache="reports", result="hit")
+    misses = metrics.counter_value("cache_requests_total", cache="reports", result="miss")
+    queries = metrics.timer_summary("db_query_seconds")
+    col1, col2, col3 = st.columns(3)
+    col1.metric("🧠 Memória (RSS)", format_bytes(rss) if rss is not None else "—")
+    col2.metric("🎯 Cache de relatórios", f"{hits / (hits + misses) * 100:.0f}%" if hits + misses else "—",
+                f"{int(hits)} acertos / {int(misses)} faltas", delta_color="off")
+    col3.metric("🗄️ Consultas", queries[0]['count'] if queries else 0,
+                f"média {queries[0]['avg_ms']:.1f} ms" if queries else None, delta_color="off")
+
+    renders = metrics.timer_summary("page_render_seconds")
+    if renders:
+        db_time = {r['page']: r for r in metrics.timer_summary("page_db_seconds")}
+        st.markdown("### 🖥️ Páginas")
+        st.dataframe(
+            [{
+                "Página": r['page'],
+                "Execuções": r['count'],
+                "Média (ms)": round(r['avg_ms'], 1),
+                "Pior (ms)": round(r['max_ms'], 1),
+                "Banco (ms, média)": round(db_time[r['page']]['avg_ms'], 1) if r['page'] in db_time else None,
+                "Consultas/execução": round(metrics.counter_value("page_queries_total", page=r['page']) / r['count'], 1),
+            } for r in renders],
+            hide_index=True,
+            use_container_width=True,
+        )
+
+    durations = [("📸 Upload", r) for r in metrics.timer_summary("upload_seconds")] + \
+                [(f"📄 PDF ({r['kind']})", r) for r in metrics.timer_summary("pdf_seconds")]
+    if durations:
+        st.markdown("### ⏳ Uploads e PDFs")
+        st.dataframe(
+            [{
+                "Operação": label,
+                "Quantidade": r['count'],
+                "Média (ms)": round(r['avg_ms'], 1),
+                "Pior (ms)": round(r['max_ms'], 1),
+            } for label, r in durations],
+            hide_index=True,
+            use_container_width=True,
+        )
+
+    st.download_button("⬇️ Exportar (Prometheus)", metrics.to_prometheus(), file_name="exonvais_metrics.prom", mime="text/plain")
+
 st.divider()
 st.caption("🔧 Página de Administração • Úlltimas ações são auditadas")
+
+metrics.page_finish(_page)
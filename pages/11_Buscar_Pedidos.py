@@ -0,0 +1,72 @@
+import streamlit as st
+from core.models import OrderStatus
+from core.db import load_config
+from services.order_search import search_orders
+from services.order_specs import find_orders_by_spec
+from core import metrics
+
+_page = metrics.page_start(__file__)
+
+st.set_page_config(page_title="Buscar Pedidos", page_icon="🔎", layout="wide")
+st.title("🔎 Buscar Pedidos")
+
+COLUMNS = {
+    "id": st.column_config.NumberColumn("Pedido", format="#%d"),
+    "client": "Cliente",
+    "category": "Categoria",
+    "type": "Tipo",
+    "product": "Produto",
+    "status": "Status",
+    "price_sale": st.column_config.NumberColumn("Venda (R$)", format="%.2f"),
+    "created_at": "Criado em",
+    "snippet": "Trecho",
+    "rank": None,
+    "notes_struct": None,
+}
+statuses = ["Todos"] + [v for k, v in vars(OrderStatus).items() if not k.startswith("_")]
+tab_text, tab_specs = st.tabs(["Texto", "Especificações"])
+
+with tab_text:
+    col_q, col_status = st.columns([3, 1])
+    query = col_q.text_input("Buscar", placeholder="Produto, tecido, cor, medidas, observação, cliente ou nº do pedido")
+    status = col_status.selectbox("Status", statuses)
+
+    if query.strip():
+        rows = search_orders(query, None if status == "Todos" else status)
+        if rows:
+            st.dataframe(
+                [dict(r) for r in rows],
+                column_config=COLUMNS,
+                hide_index=True,
+                use_container_width=True,
+            )
+            st.caption(f"{len(rows)} pedidos (mais relevantes primeiro)")
+        else:
+            st.info("Nenhum pedido encontrado")
+    else:
+        st.caption("Cada palavra é buscada pelo início (\"perc azu\" encontra percal azul); todas precisam aparecer.")
+
+with tab_specs:
+    ANY = "Qualquer"
+    cols = st.columns(4)
+    tecido = cols[0].selectbox("Tecido", [ANY] + load_config("tecidos", ["Algodão", "Percal", "Cetim", "Microfibra", "Linho"]))
+    cor = cols[1].selectbox("Cor", [ANY] + load_config("cores", ["Branco", "Bege", "Azul", "Rosa", "Cinza", "Colorido"]))
+    acabamento = cols[2].selectbox("Acabamento", [ANY] + load_config("acabamentos", ["Bordado", "Renda", "Babado", "Liso", "Estampado"]))
+    spec_status = cols[3].selectbox("Status", statuses, key="spec_status")
+    chosen = {k: v for k, v in (("tecido", tecido), ("cor", cor), ("acabamento", acabamento)) if v != ANY}
+    if chosen:
+        rows = find_orders_by_spec(None if spec_status == "Todos" else spec_status, **chosen)
+        if rows:
+            st.dataframe(
+                [{**r, "specs": ", ".join(f"{k}: {v}" for k, v in r["notes_struct"].items() if not isinstance(v, dict))} for r in rows],
+                column_config={**COLUMNS, "specs": "Especificações"},
+                hide_index=True,
+                use_container_width=True,
+            )
+            st.caption(f"{len(rows)} pedidos (mais recentes primeiro)")
+        else:
+            st.info("Nenhum pedido com essas especificações")
+    else:
+        st.caption("Escolha ao menos um tecido, cor ou acabamento.")
+
+metrics.page_finish(_page)
@@ -0,0 +1,379 @@
+"""Retenção do audit_log: tabela quente pequena, histórico arquivado e consultável.
+
+Camadas:
+- PostgreSQL: audit_log particionado por mês (audit_log_AAAA_MM, RANGE em
+  ts, mais uma partição DEFAULT). Bancos antigos são convertidos uma vez;
+  as partições do mês corrente e das PARTITIONS_AHEAD seguintes são criadas
+  adiantadas.
+- SQLite: linhas com mais de HOT_DAYS dias saem do audit_log para
+  audit_log_archive (mesmas colunas), em lotes de BATCH_ROWS.
+- Com EXONVAIS_AUDIT_RETENTION_DAYS definido, os meses inteiros mais
+  antigos que isso saem do banco para ARCHIVE_DIR/audit_AAAA-MM.jsonl.gz
+  (uma linha JSON por entrada). No PostgreSQL a partição do mês é
+  exportada e removida com DROP TABLE. Os arquivos continuam consultáveis
+  por `search_archive`. Sem a variável, nada sai do banco (no Streamlit
+  Cloud o disco local não é persistente).
+
+A manutenção roda numa thread, no máximo uma vez por MAINTENANCE_INTERVAL_S,
+por uma conexão própria (sem misturar com as transações das sessões).
+
+    python -m services.audit_archive run
+    python -m services.audit_archive stats
+    python -m services.audit_archive search --entity order --id 42 [--action DELETE] [--since 2024-01] [--until 2024-06]
+"""
+import argparse
+import gzip
+import json
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from core.db import SCHEMA_SQL_PG, exec_query, init_db, is_postgres_conn, open_conn
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+ARCHIVE_DIR = os.environ.get("EXONVAIS_AUDIT_ARCHIVE_DIR") or os.path.join(ROOT, "archive", "audit")
+HOT_DAYS = int(os.environ.get("EXONVAIS_AUDIT_HOT_DAYS", "90"))
+RETENTION_DAYS = int(os.environ["EXONVAIS_AUDIT_RETENTION_DAYS"]) if os.environ.get("EXONVAIS_AUDIT_RETENTION_DAYS") else None
+PARTITIONS_AHEAD = 2
+BATCH_ROWS = 5000
+PAUSE_S = 0.01
+MAINTENANCE_INTERVAL_S = 24 * 3600
+LAST_RUN_KEY = "audit_maintenance_ts"
+COLUMNS = ("id", "entity", "entity_id", "action", "field", "before", "after", "username", "ts")
+_COLS = ", ".join(COLUMNS)
+_MONTH = re.compile(r"^\d{4}-\d{2}$")
+
+_started = False
+_start_lock = threading.Lock()
+
+
+def _next_month(month: str) -> str:
+    year, mon = int(month[:4]), int(month[5:7])
+    return f"{year + mon // 12:04d}-{mon % 12 + 1:02d}"
+
+
+def _months_from(month: str, count: int) -> list:
+    months = [month]
+    for _ in range(count):
+        months.append(_next_month(months[-1]))
+    return months
+
+
+def _partition_name(month: str) -> str:
+    return "audit_log_" + month.replace("-", "_")
+
+
+def _archive_path(month: str) -> str:
+    return os.path.join(ARCHIVE_DIR, f"audit_{month}.jsonl.gz")
+
+
+def _cutoff_month(days: int) -> str:
+    """Primeiro mês que fica no banco: os anteriores têm só linhas com mais de `days` dias."""
+    return (datetime.utcnow() - timedelta(days=days)).strftime("%Y-%m")
+
+
+# ---------------------------------------------------------------------------
+# PostgreSQL: particionamento mensal
+# ---------------------------------------------------------------------------
+
+def is_partitioned(conn) -> bool:
+    row = exec_query(
+        "SELECT c.relkind AS kind FROM pg_class c JOIN pg_namespace n ON n.oid=c.relnamespace "
+        "WHERE c.relname='audit_log' AND n.nspname=current_schema()",
+        conn=conn,
+    ).fetchone()
+    return bool(row) and row["kind"] == "p"
+
+
+def partition_audit_log(conn) -> bool:
+    """Converte um audit_log comum em particionado (uma vez). Retorna True se converteu.
+
+    Mantém a sequência de ids; as linhas entram pela partição DEFAULT e
+    `ensure_partitions` as distribui pelos meses.
+    """
+    if is_partitioned(conn):
+        return False
+    seq = exec_query("SELECT pg_get_serial_sequence('audit_log', 'id') AS seq", conn=conn).fetchone()["seq"]
+    exec_query("LOCK TABLE audit_log IN ACCESS EXCLUSIVE MODE", conn=conn)
+    exec_query(f"ALTER SEQUENCE {seq} OWNED BY NONE", conn=conn)
+    exec_query("ALTER TABLE audit_log RENAME TO audit_log_legacy", conn=conn)
+    exec_query(
+        f"""
+        CREATE TABLE audit_log (
+          id INTEGER NOT NULL DEFAULT nextval('{seq}'),
+          entity TEXT NOT NULL,
+          entity_id INTEGER NOT NULL,
+          action TEXT NOT NULL,
+          field TEXT,
+          before TEXT,
+          after TEXT,
+          username TEXT,
+          ts TEXT NOT NULL,
+          PRIMARY KEY (id, ts)
+        ) PARTITION BY RANGE (ts)
+        """,
+        conn=conn,
+    )
+    exec_query(f"ALTER SEQUENCE {seq} OWNED BY audit_log.id", conn=conn)
+    exec_query("CREATE TABLE audit_log_default PARTITION OF audit_log DEFAULT", conn=conn)
+    exec_query(f"INSERT INTO audit_log({_COLS}) SELECT {_COLS} FROM audit_log_legacy", conn=conn)
+    exec_query("DROP TABLE audit_log_legacy", conn=conn)
+    # os mesmos índices do schema, agora no pai (propagados às partições)
+    for stmt in SCHEMA_SQL_PG.split(";"):
+        if " ON audit_log(" in stmt:
+            exec_query(stmt.strip(), conn=conn)
+    conn.commit()
+    return True
+
+
+def _partitions(conn) -> set:
+    rows = exec_query(
+        "SELECT c.relname AS name FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid=i.inhrelid JOIN pg_class p ON p.oid=i.inhparent "
+        "WHERE p.relname='audit_log'",
+        conn=conn,
+    ).fetchall()
+    return {r["name"] for r in rows}
+
+
+def ensure_partitions(conn, ahead: int = PARTITIONS_AHEAD) -> int:
+    """Cria as partições mensais que faltam (mês corrente, `ahead` seguintes e meses presos na DEFAULT)."""
+    exec_query("CREATE TABLE IF NOT EXISTS audit_log_default PARTITION OF audit_log DEFAULT", conn=conn, commit=True)
+    stray = exec_query("SELECT DISTINCT substr(ts, 1, 7) AS m FROM audit_log_default", conn=conn).fetchall()
+    months = set(_months_from(datetime.utcnow().strftime("%Y-%m"), ahead))
+    months.update(r["m"] for r in stray if r["m"] and _MONTH.match(r["m"]))
+    existing = _partitions(conn)
+    created = 0
+    for month in sorted(months):
+        name = _partition_name(month)
+        if name in existing:
+            continue
+        lo, hi = month, _next_month(month)
+        # a DEFAULT não pode ter linhas do intervalo na hora do ATTACH: move antes, com escritas bloqueadas
+        exec_query("LOCK TABLE audit_log_default IN SHARE ROW EXCLUSIVE MODE", conn=conn)
+        exec_query(f"CREATE TABLE {name} (LIKE audit_log INCLUDING DEFAULTS)", conn=conn)
+        exec_query(
+            f"WITH moved AS (DELETE FROM audit_log_default WHERE ts >= ? AND ts < ? RETURNING {_COLS}) "
+            f"INSERT INTO {name}({_COLS}) SELECT {_COLS} FROM moved",
+            (lo, hi), conn=conn,
+        )
+        exec_query(f"ALTER TABLE audit_log ATTACH PARTITION {name} FOR VALUES FROM ('{lo}') TO ('{hi}')", conn=conn)
+        conn.commit()
+        created += 1
+    return created
+
+
+# ---------------------------------------------------------------------------
+# SQLite: audit_log → audit_log_archive
+# ---------------------------------------------------------------------------
+
+def move_to_archive_table(conn, days: int = HOT_DAYS, batch: int = BATCH_ROWS) -> int:
+    """Move as linhas com mais de `days` dias para audit_log_archive, em lotes curtos."""
+    cutoff = (datetime.utcnow() - timedelta(days=days)).isoformat()
+    moved = 0
+    while True:
+        row = exec_query(
+            "SELECT COUNT(*) AS n, MAX(id) AS last_id FROM (SELECT id FROM audit_log WHERE ts < ? ORDER BY id LIMIT ?) t",
+            (cutoff, batch), conn=conn,
+        ).fetchone()
+        if not row["n"]:
+            break
+        exec_query(
+            f"INSERT INTO audit_log_archive({_COLS}) SELECT {_COLS} FROM audit_log WHERE ts < ? AND id <= ? "
+            "ON CONFLICT (id) DO NOTHING",
+            (cutoff, row["last_id"]), conn=conn,
+        )
+        exec_query("DELETE FROM audit_log WHERE ts < ? AND id <= ?", (cutoff, row["last_id"]), conn=conn)
+        conn.commit()
+        moved += row["n"]
+        time.sleep(PAUSE_S)  # deixa as sessões escreverem entre os lotes
+    return moved
+
+
+# ---------------------------------------------------------------------------
+# Arquivos JSONL.gz
+# ---------------------------------------------------------------------------
+
+def _export(conn, source: str, lo: str, hi: str, month: str) -> int:
+    """Acrescenta as linhas de `source` com lo <= ts < hi ao arquivo do mês (novo membro gzip)."""
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    cur = exec_query(f"SELECT {_COLS} FROM {source} WHERE ts >= ? AND ts < ? ORDER BY id", (lo, hi), conn=conn)
+    written = 0
+    with gzip.open(_archive_path(month), "ab") as f:
+        while True:
+            rows = cur.fetchmany(BATCH_ROWS)
+            if not rows:
+                break
+            f.write("".join(json.dumps(dict(r), ensure_ascii=False) + "\n" for r in rows).encode("utf-8"))
+            written += len(rows)
+    return written
+
+
+def archive_to_files(conn, days: int) -> dict:
+    """Tira do banco os meses inteiros com mais de `days` dias. Retorna {mês: linhas}."""
+    cutoff = _cutoff_month(days)
+    is_pg = is_postgres_conn(conn)
+    done = {}
+    for table in ("audit_log_archive", "audit_log"):
+        rows = exec_query(f"SELECT DISTINCT substr(ts, 1, 7) AS m FROM {table} WHERE ts < ?", (cutoff,), conn=conn).fetchall()
+        for month in sorted(r["m"] for r in rows if r["m"] and _MONTH.match(r["m"])):
+            lo, hi = month, _next_month(month)
+            partition = _partition_name(month)
+            if is_pg and table == "audit_log" and partition in _partitions(conn):
+                exec_query(f"LOCK TABLE {partition} IN SHARE MODE", conn=conn)
+                n = _export(conn, partition, lo, hi, month)
+                exec_query(f"DROP TABLE {partition}", conn=conn)
+            else:
+                n = _export(conn, table, lo, hi, month)
+                exec_query(f"DELETE FROM {table} WHERE ts >= ? AND ts < ?", (lo, hi), conn=conn)
+            conn.commit()
+            done[month] = done.get(month, 0) + n
+    return done
+
+
+def archive_files() -> list:
+    """Arquivos existentes: [{'month', 'path', 'bytes'}], do mais novo para o mais antigo."""
+    try:
+        entries = [e for e in os.scandir(ARCHIVE_DIR) if e.name.startswith("audit_") and e.name.endswith(".jsonl.gz")]
+    except FileNotFoundError:
+        return []
+    files = [{"month": e.name[6:-9], "path": e.path, "bytes": e.stat().st_size} for e in entries]
+    return sorted(files, key=lambda f: f["month"], reverse=True)
+
+
+def search_archive(entity=None, entity_id=None, action=None, since=None, until=None, limit: int | None = 200) -> list:
+    """Entradas arquivadas em arquivo que casam com os filtros, das mais novas para as mais antigas.
+
+    `since`/`until` (prefixos ISO, ex. '2024-01' ou '2024-01-15') limitam
+    também quais arquivos são abertos.
+    """
+    found = []
+    for info in archive_files():
+        if since and info["month"] < since[:7]:
+            continue
+        if until and info["month"] > until[:7]:
+            continue
+        seen, rows = set(), []
+        with gzip.open(info["path"], "rt", encoding="utf-8") as f:
+            for line in f:
+                r = json.loads(line)
+                if r["id"] in seen:
+                    continue  # exportação repetida após uma falha entre gravar e apagar
+                seen.add(r["id"])
+                if entity is not None and r["entity"] != entity:
+                    continue
+                if entity_id is not None and str(r["entity_id"]) != str(entity_id):
+                    continue
+                if action is not None and r["action"] != action:
+                    continue
+                if since and r["ts"] < since:
+                    continue
+                if until and r["ts"][:len(until)] > until:
+                    continue
+                rows.append(r)
+        rows.sort(key=lambda r: (r["ts"], r["id"]), reverse=True)
+        found.extend(rows)
+        if limit and len(found) >= limit:
+            return found[:limit]
+    return found
+
+
+# ---------------------------------------------------------------------------
+# Manutenção
+# ---------------------------------------------------------------------------
+
+def run_maintenance(retention_days: int | None = RETENTION_DAYS, hot_days: int = HOT_DAYS) -> dict:
+    """Uma rodada completa: particiona/move para o arquivo e aplica a retenção."""
+    conn = open_conn()
+    try:
+        result = {"converted": False, "partitions_created": 0, "moved_to_archive": 0, "exported": {}}
+        if is_postgres_conn(conn):
+            result["converted"] = partition_audit_log(conn)
+            result["partitions_created"] = ensure_partitions(conn)
+        else:
+            result["moved_to_archive"] = move_to_archive_table(conn, hot_days)
+        if retention_days:
+            result["exported"] = archive_to_files(conn, retention_days)
+        exec_query(
+            "INSERT INTO config(key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            (LAST_RUN_KEY, json.dumps(time.time())), commit=True, conn=conn,
+        )
+        return result
+    finally:
+        conn.close()
+
+
+def stats() -> dict:
+    """{'live', 'archived', 'files', 'file_bytes', 'oldest_live', 'last_run'} para a Administração."""
+    live = exec_query("SELECT COUNT(*) AS n, MIN(ts) AS oldest FROM audit_log").fetchone()
+    archived = exec_query("SELECT COUNT(*) AS n FROM audit_log_archive").fetchone()["n"]
+    last = exec_query("SELECT value FROM config WHERE key=?", (LAST_RUN_KEY,)).fetchone()
+    files = archive_files()
+    return {
+        "live": live["n"],
+        "oldest_live": live["oldest"],
+        "archived": archived,
+        "files": len(files),
+        "file_bytes": sum(f["bytes"] for f in files),
+        "last_run": datetime.fromtimestamp(float(json.loads(last["value"]))).isoformat(timespec="seconds") if last else None,
+    }
+
+
+def start_audit_maintenance():
+    """Thread de manutenção do audit_log (uma por processo, no máximo uma rodada por intervalo)."""
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+
+    def loop():
+        while True:
+            row = exec_query("SELECT value FROM config WHERE key=?", (LAST_RUN_KEY,)).fetchone()
+            age = time.time() - float(json.loads(row["value"])) if row else MAINTENANCE_INTERVAL_S
+            if age >= MAINTENANCE_INTERVAL_S:
+                try:
+                    result = run_maintenance()
+                    if result["converted"] or result["moved_to_archive"] or result["exported"]:
+                        print(f"[audit] manutenção: {result}")
+                except Exception as e:
+                    print(f"[audit] manutenção falhou: {e}")
+                age = 0
+            time.sleep(max(60.0, MAINTENANCE_INTERVAL_S - age))
+    threading.Thread(target=loop, name="audit-maintenance", daemon=True).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retenção e arquivo do audit_log")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    run = sub.add_parser("run", help="particiona/arquiva agora")
+    run.add_argument("--retention-days", type=int, default=RETENTION_DAYS)
+    run.add_argument("--hot-days", type=int, default=HOT_DAYS)
+    sub.add_parser("stats")
+    search = sub.add_parser("search", help="procura nos arquivos .jsonl.gz")
+    search.add_argument("--entity")
+    search.add_argument("--id", dest="entity_id")
+    search.add_argument("--action")
+    search.add_argument("--since")
+    search.add_argument("--until")
+    search.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+
+    init_db()
+    if args.cmd == "run":
+        result = run_maintenance(args.retention_days, args.hot_days)
+        print(f"✅ {json.dumps(result, ensure_ascii=False)}")
+    elif args.cmd == "stats":
+        for key, value in stats().items():
+            print(f"{key}: {value}")
+    else:
+        rows = search_archive(args.entity, args.entity_id, args.action, args.since, args.until, args.limit)
+        for r in rows:
+            print(json.dumps(r, ensure_ascii=False))
+        print(f"ℹ️ {len(rows)} entradas", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
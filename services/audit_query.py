@@ -0,0 +1,67 @@
+"""Consulta do audit_log com filtros e paginação por chave (ts, id).
+
+Cada filtro tem índice próprio (entity+entity_id, action, username, ts),
+todos terminando em (ts, id): a página seguinte continua de onde a
+anterior parou com `(ts, id) < (?, ?)` em vez de OFFSET, então o custo por
+página não cresce com o tamanho da tabela. audit_log e audit_log_archive
+são consultadas com o mesmo filtro e intercaladas por (ts, id).
+
+Entradas já exportadas para arquivos .jsonl.gz ficam em
+services.audit_archive.search_archive.
+
+    rows, cursor = query(entity="order", entity_id=4312, field="price_sale")
+    more, cursor = query(entity="order", entity_id=4312, field="price_sale", after=cursor)
+"""
+from datetime import date, timedelta
+from core.db import exec_query
+
+TABLES = ("audit_log", "audit_log_archive")
+COLUMNS = "id, ts, entity, entity_id, action, field, before, after, username"
+PAGE_SIZE = 50
+
+
+def _where(entity, entity_id, action, field, username, since, until, after) -> tuple:
+    clauses, params = [], []
+    for column, value in (("entity", entity), ("entity_id", entity_id), ("action", action),
+                          ("field", field), ("username", username)):
+        if value not in (None, ""):
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    if since:
+        clauses.append("ts >= ?")
+        params.append(since.isoformat() if isinstance(since, date) else since)
+    if until:
+        # data: o dia inteiro entra; texto: prefixo ISO comparado como está
+        clauses.append("ts < ?")
+        params.append((until + timedelta(days=1)).isoformat() if isinstance(until, date) else until)
+    if after:
+        clauses.append("(ts, id) < (?, ?)")
+        params.extend(after)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def query(entity=None, entity_id=None, action=None, field=None, username=None,
+          since=None, until=None, after=None, limit: int = PAGE_SIZE, include_archive: bool = True):
+    """Entradas mais recentes primeiro. Retorna (linhas, cursor da próxima página ou None).
+
+    `after` é o cursor devolvido pela chamada anterior ((ts, id) da última linha).
+    """
+    where, params = _where(entity, entity_id, action, field, username, since, until, after)
+    rows = []
+    for table in TABLES if include_archive else TABLES[:1]:
+        rows.extend(exec_query(
+            f"SELECT {COLUMNS} FROM {table}{where} ORDER BY ts DESC, id DESC LIMIT ?",
+            (*params, limit + 1),
+        ).fetchall())
+    rows.sort(key=lambda r: (r["ts"], r["id"]), reverse=True)
+    page = rows[:limit]
+    cursor = (page[-1]["ts"], page[-1]["id"]) if len(rows) > limit else None
+    return page, cursor
+
+
+def actions() -> list:
+    """Ações distintas registradas (para o filtro da Administração)."""
+    names = set()
+    for table in TABLES:
+        names.update(r["action"] for r in exec_query(f"SELECT DISTINCT action FROM {table}").fetchall())
+    return sorted(n for n in names if n)
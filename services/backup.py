@@ -0,0 +1,272 @@
+"""Backups online do banco SQLite e compactação incremental.
+
+Backup: API de backup do SQLite (`Connection.backup`) em passos de
+BACKUP_PAGES páginas, a partir da conexão compartilhada de core.db. Entre
+um passo e outro a conexão é devolvida às outras sessões por PAUSE_S
+segundos; escritas feitas por ela entram no backup sem reiniciá-lo. A
+cópia é conferida (PRAGMA quick_check), comprimida com gzip em
+BACKUP_DIR e só as KEEP mais recentes são mantidas.
+
+Compactação: com auto_vacuum=INCREMENTAL, `incremental_vacuum` devolve as
+páginas livres ao sistema em lotes curtos, sem o bloqueio longo do VACUUM
+completo. Bancos criados antes disso precisam de um VACUUM único
+(`enable_incremental_vacuum`) para trocar o modo.
+
+No PostgreSQL o backup é do provedor (ou pg_dump); aqui só SQLite.
+
+    python -m services.backup create
+    python -m services.backup list
+    python -m services.backup restore backups/exonvais_20250101_120000.db.gz restaurado.db
+    python -m services.backup vacuum
+"""
+import gzip
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from core import db
+from core.db import dialect, hold_conn, pause_conn
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+BACKUP_DIR = os.environ.get("EXONVAIS_BACKUP_DIR") or os.path.join(ROOT, "backups")
+KEEP = int(os.environ.get("EXONVAIS_BACKUP_KEEP", "7"))
+BACKUP_PAGES = 256          # páginas por passo (1 MB com páginas de 4 KB)
+PAUSE_S = 0.005             # pausa entre passos com a conexão liberada
+BUSY_TIMEOUT_S = 30.0       # desiste se uma transação aberta não terminar
+VACUUM_PAGES = 512          # páginas liberadas por lote no vacuum incremental
+PREFIX = "exonvais_"
+SUFFIX = ".db.gz"
+
+_auto_started = False
+_auto_lock = threading.Lock()
+
+
+def _require_sqlite():
+    if dialect().is_postgres:
+        raise RuntimeError("Backup/compactação só para SQLite; no PostgreSQL use os backups do provedor ou pg_dump")
+
+
+def create_backup(progress=None, pages: int = BACKUP_PAGES, pause_s: float = PAUSE_S) -> dict:
+    """Gera BACKUP_DIR/exonvais_<data>.db.gz e aplica a rotação.
+
+    `progress(copiadas, total)` é chamado a cada passo. Retorna
+    {'path', 'bytes', 'db_bytes', 'elapsed_s', 'removed'}.
+    """
+    _require_sqlite()
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    t0 = time.perf_counter()
+    name = f"{PREFIX}{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    tmp_db = os.path.join(BACKUP_DIR, f".{name}.db.tmp")
+    final = os.path.join(BACKUP_DIR, name + SUFFIX)
+
+    busy_since = [None]
+
+    def step(status, remaining, total):
+        if status in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED):
+            # transação de escrita aberta na conexão: espera o commit dela
+            busy_since[0] = busy_since[0] or time.monotonic()
+            if time.monotonic() - busy_since[0] > BUSY_TIMEOUT_S:
+                raise TimeoutError(f"banco ocupado por mais de {BUSY_TIMEOUT_S:.0f}s")
+        else:
+            busy_since[0] = None
+            if progress:
+                progress(total - remaining, total)
+        if remaining or busy_since[0]:
+            pause_conn(pause_s)
+
+    target = sqlite3.connect(tmp_db)
+    try:
+        with hold_conn() as conn:
+            conn.backup(target, pages=pages, progress=step, sleep=pause_s)
+        check = target.execute("PRAGMA quick_check").fetchone()[0]
+        if check != "ok":
+            raise RuntimeError(f"cópia inconsistente: {check}")
+    finally:
+        target.close()
+
+    try:
+        db_bytes = os.path.getsize(tmp_db)
+        with open(tmp_db, "rb") as src, gzip.open(final + ".tmp", "wb", compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.replace(final + ".tmp", final)
+    finally:
+        for leftover in (tmp_db, final + ".tmp"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+    return {
+        "path": final,
+        "bytes": os.path.getsize(final),
+        "db_bytes": db_bytes,
+        "elapsed_s": time.perf_counter() - t0,
+        "removed": rotate(),
+    }
+
+
+def list_backups() -> list:
+    """Backups existentes, do mais novo para o mais antigo: [{'name', 'path', 'bytes', 'created_at'}]."""
+    try:
+        entries = [e for e in os.scandir(BACKUP_DIR)
+                   if e.is_file() and e.name.startswith(PREFIX) and e.name.endswith(SUFFIX)]
+    except FileNotFoundError:
+        return []
+    items = []
+    for e in entries:
+        st = e.stat()
+        items.append({
+            "name": e.name,
+            "path": e.path,
+            "bytes": st.st_size,
+            "created_at": datetime.fromtimestamp(st.st_mtime).isoformat(timespec="seconds"),
+        })
+    return sorted(items, key=lambda b: b["name"], reverse=True)
+
+
+def rotate(keep: int = KEEP) -> list:
+    """Apaga os backups além dos `keep` mais recentes. Retorna os nomes removidos."""
+    removed = []
+    for b in list_backups()[keep:]:
+        try:
+            os.remove(b["path"])
+            removed.append(b["name"])
+        except OSError as e:
+            print(f"[backup] não foi possível remover {b['name']}: {e}")
+    return removed
+
+
+def restore(backup_path: str, dest_path: str, overwrite: bool = False) -> str:
+    """Descomprime um backup em `dest_path` (nunca sobre o banco em uso)."""
+    if os.path.abspath(dest_path) == os.path.abspath(db.DB_PATH):
+        raise ValueError("Não restaure sobre o banco em uso: pare o app e troque o arquivo manualmente")
+    if os.path.exists(dest_path) and not overwrite:
+        raise FileExistsError(dest_path)
+    with gzip.open(backup_path, "rb") as src, open(dest_path, "wb") as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    return dest_path
+
+
+# ---------------------------------------------------------------------------
+# Compactação
+# ---------------------------------------------------------------------------
+
+def _pragma(conn, name: str):
+    return conn.execute(f"PRAGMA {name}").fetchone()[0]
+
+
+def vacuum_status() -> dict:
+    """{'auto_vacuum': 'none'|'full'|'incremental', 'page_size', 'pages', 'free_pages', 'free_bytes'}."""
+    _require_sqlite()
+    with hold_conn() as conn:
+        mode = _pragma(conn, "auto_vacuum")
+        page_size = _pragma(conn, "page_size")
+        pages = _pragma(conn, "page_count")
+        free = _pragma(conn, "freelist_count")
+    return {
+        "auto_vacuum": {0: "none", 1: "full", 2: "incremental"}.get(mode, str(mode)),
+        "page_size": page_size,
+        "pages": pages,
+        "free_pages": free,
+        "free_bytes": free * page_size,
+    }
+
+
+def incremental_vacuum(batch_pages: int = VACUUM_PAGES, pause_s: float = PAUSE_S, progress=None) -> int:
+    """Libera as páginas livres em lotes curtos. Retorna quantas foram liberadas.
+
+    Exige auto_vacuum=INCREMENTAL (ver enable_incremental_vacuum).
+    """
+    status = vacuum_status()
+    if status["auto_vacuum"] != "incremental":
+        raise RuntimeError("auto_vacuum não está em INCREMENTAL: execute enable_incremental_vacuum() uma vez")
+    total = status["free_pages"]
+    freed = 0
+    waited_since = None
+    with hold_conn() as conn:
+        while True:
+            if conn.in_transaction:
+                # não mistura o vacuum com a transação de outra sessão: espera o commit dela
+                waited_since = waited_since or time.monotonic()
+                if time.monotonic() - waited_since > BUSY_TIMEOUT_S:
+                    raise TimeoutError(f"banco ocupado por mais de {BUSY_TIMEOUT_S:.0f}s")
+                pause_conn(pause_s)
+                continue
+            waited_since = None
+            before = _pragma(conn, "freelist_count")
+            if not before:
+                break
+            conn.execute(f"PRAGMA incremental_vacuum({int(batch_pages)})").fetchall()
+            conn.commit()
+            after = _pragma(conn, "freelist_count")
+            if after >= before:
+                break
+            freed += before - after
+            if progress:
+                progress(freed, total)
+            pause_conn(pause_s)
+    return freed
+
+
+def enable_incremental_vacuum() -> dict:
+    """Troca o banco para auto_vacuum=INCREMENTAL. Faz um VACUUM completo (bloqueante), uma única vez."""
+    _require_sqlite()
+    with hold_conn() as conn:
+        conn.commit()
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+    return vacuum_status()
+
+
+# ---------------------------------------------------------------------------
+# Backup automático
+# ---------------------------------------------------------------------------
+
+def start_auto_backup():
+    """Backup periódico em segundo plano se EXONVAIS_BACKUP_INTERVAL_H estiver definido (uma vez por processo)."""
+    global _auto_started
+    hours = os.environ.get("EXONVAIS_BACKUP_INTERVAL_H")
+    if not hours or dialect().is_postgres:
+        return
+    with _auto_lock:
+        if _auto_started:
+            return
+        _auto_started = True
+    interval = float(hours) * 3600
+
+    def loop():
+        while True:
+            latest = list_backups()[:1]
+            age = time.time() - os.path.getmtime(latest[0]["path"]) if latest else interval
+            if age >= interval:
+                try:
+                    info = create_backup()
+                    print(f"[backup] {os.path.basename(info['path'])} ({info['bytes']} bytes, {info['elapsed_s']:.1f}s)")
+                except Exception as e:
+                    print(f"[backup] falhou: {e}")
+                age = 0
+            time.sleep(max(60.0, interval - age))
+    threading.Thread(target=loop, name="auto-backup", daemon=True).start()
+
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ""
+    if cmd == "create":
+        info = create_backup(lambda done, total: print(f"\r{done}/{total} páginas", end="", flush=True))
+        print(f"\n✅ {info['path']} ({info['bytes']} bytes de {info['db_bytes']}, {info['elapsed_s']:.1f}s)")
+        for name in info["removed"]:
+            print(f"🗑️ rotação: {name}")
+    elif cmd == "list":
+        for b in list_backups():
+            print(f"{b['created_at']}  {b['bytes']:>12}  {b['name']}")
+    elif cmd == "restore" and len(sys.argv) == 4:
+        print(f"✅ restaurado em {restore(sys.argv[2], sys.argv[3])}")
+    elif cmd == "vacuum":
+        if vacuum_status()["auto_vacuum"] != "incremental":
+            print("ℹ️ Ativando auto_vacuum=INCREMENTAL (VACUUM completo, uma vez)...")
+            enable_incremental_vacuum()
+        print(f"✅ {incremental_vacuum()} páginas liberadas")
+    else:
+        print("Uso: python -m services.backup create|list|vacuum|restore <backup.db.gz> <destino.db>")
+        sys.exit(1)
@@ -0,0 +1,328 @@
+"""Busca de clientes por nome, CPF ou telefone (índices FTS5 / pg_trgm).
+
+- SQLite: tabela FTS5 `clients_fts` (rowid = clients.id) com o nome
+  (tokenizer unicode61 remove_diacritics: "josé" encontra "Jose") e as
+  chaves numéricas (CPF e telefone só com dígitos, telefone também sem
+  DDD). Triggers em clients mantêm o índice. Cada palavra digitada vira
+  um prefixo: "mar sil" encontra "Maria da Silva".
+- PostgreSQL: extensão pg_trgm com índices GIN nas expressões do nome sem
+  acento e dos dígitos: prefixo/substring por palavra (LIKE) e, se nada
+  casar, semelhança por trigramas (erros de digitação).
+
+Sem FTS5 ou sem permissão para pg_trgm a busca cai para LIKE sem índice.
+`ensure_client_search()` cria as estruturas (startup) e é idempotente.
+"""
+import re
+import unicodedata
+from core.db import dialect, exec_query, get_conn, hold_conn, is_postgres_conn
+from core.models import OrderStatus
+
+SEARCH_LIMIT = 20
+MIN_DIGITS = 3          # a partir de quantos dígitos (sem letras) a busca é por CPF/telefone
+
+# Expressões do PostgreSQL (iguais nos índices e nas consultas, para o planner usar os índices)
+_ACCENTS = "áàâãäéèêëíìîïóòôõöúùûüçñ"
+_PLAIN = "aaaaaeeeeiiiiooooouuuucn"
+
+
+def pg_fold(expr: str) -> str:
+    """Expressão do PostgreSQL com `expr` em minúsculas e sem acento."""
+    return f"translate(lower({expr}), '{_ACCENTS}', '{_PLAIN}')"
+
+
+PG_NAME_EXPR = pg_fold("name")
+PG_DIGITS_EXPR = "regexp_replace(coalesce(cpf, '') || ' ' || coalesce(phone, ''), '[^0-9 ]', '', 'g')"
+
+_available = None   # None = ainda não verificado; depois True/False
+
+
+def _digits_sql(column: str) -> str:
+    """Só os dígitos de uma coluna (SQLite não tem regexp_replace)."""
+    expr = f"coalesce({column}, '')"
+    for ch in (" ", ".", "-", "(", ")", "/", "+"):
+        expr = f"replace({expr}, '{ch}', '')"
+    return expr
+
+
+_CPF = _digits_sql("new.cpf")
+_PHONE = _digits_sql("new.phone")
+_FTS_ROW = f"(new.id, new.name, {_CPF} || ' ' || {_PHONE} || ' ' || substr({_PHONE}, 3))"
+
+SQLITE_FTS_SQL = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS clients_fts USING fts5(
+  name, keys,
+  tokenize = "unicode61 remove_diacritics 2",
+  prefix = '2 3'
+);
+CREATE TRIGGER IF NOT EXISTS clients_fts_ai AFTER INSERT ON clients BEGIN
+  INSERT INTO clients_fts(rowid, name, keys) VALUES {_FTS_ROW};
+END;
+CREATE TRIGGER IF NOT EXISTS clients_fts_au AFTER UPDATE OF name, cpf, phone ON clients BEGIN
+  DELETE FROM clients_fts WHERE rowid = old.id;
+  INSERT INTO clients_fts(rowid, name, keys) VALUES {_FTS_ROW};
+END;
+CREATE TRIGGER IF NOT EXISTS clients_fts_ad AFTER DELETE ON clients BEGIN
+  DELETE FROM clients_fts WHERE rowid = old.id;
+END;
+"""
+
+PG_TRGM_SQL = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS idx_clients_name_trgm ON clients USING gin (({PG_NAME_EXPR}) gin_trgm_ops)",
+    f"CREATE INDEX IF NOT EXISTS idx_clients_digits_trgm ON clients USING gin (({PG_DIGITS_EXPR}) gin_trgm_ops)",
+)
+
+
+def normalize(text: str) -> str:
+    """Minúsculas, sem acentos e com espaços simples ("  José  Antônio" → "jose antonio")."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(text.lower().split())
+
+
+def digits(text: str) -> str:
+    return re.sub(r"\D", "", text or "")
+
+
+def _is_numeric_query(text: str) -> bool:
+    return not re.search(r"[^\W\d_]", text) and len(digits(text)) >= MIN_DIGITS
+
+
+def ensure_client_search() -> bool:
+    """Cria o índice de busca (FTS5 + triggers no SQLite, pg_trgm no PostgreSQL). Retorna se está disponível.
+
+    Roda uma vez por processo; o FTS5 vazio é preenchido, um índice divergente
+    se reconstrói com rebuild_index.
+    """
+    global _available
+    if _available is not None:
+        return _available
+    conn = get_conn()
+    if is_postgres_conn(conn):
+        try:
+            for stmt in PG_TRGM_SQL:
+                exec_query(stmt)
+            conn.commit()
+            _available = True
+        except Exception as e:
+            # exec_query já desfez a transação; sem pg_trgm a busca usa LIKE
+            print(f"⚠️ pg_trgm indisponível ({e}); busca de clientes sem índice")
+            _available = False
+        return _available
+    try:
+        with hold_conn():
+            conn.executescript(SQLITE_FTS_SQL)
+            empty = conn.execute("SELECT 1 FROM clients_fts LIMIT 1").fetchone() is None
+            if empty and conn.execute("SELECT 1 FROM clients LIMIT 1").fetchone():
+                rebuild_index(conn)
+            conn.commit()
+        _available = True
+    except Exception as e:
+        print(f"⚠️ FTS5 indisponível ({e}); busca de clientes sem índice")
+        _available = False
+    return _available
+
+
+def rebuild_index(conn=None):
+    """Recria clients_fts a partir de clients (SQLite). Não faz commit."""
+    conn = conn or get_conn()
+    conn.execute("DELETE FROM clients_fts")
+    conn.execute(
+        "INSERT INTO clients_fts(rowid, name, keys) "
+        f"SELECT id, name, {_digits_sql('cpf')} || ' ' || {_digits_sql('phone')} || ' ' || substr({_digits_sql('phone')}, 3) "
+        "FROM clients"
+    )
+
+
+def _words(text: str, fold: bool = True) -> list:
+    """Palavras buscáveis: sem aspas (quebrariam a sintaxe do FTS5) e com ao menos uma letra/dígito.
+
+    `fold=False` mantém os acentos (o lower() do SQLite não os remove da coluna).
+    """
+    text = normalize(text) if fold else " ".join(text.lower().split())
+    return [w for w in (w.replace('"', "") for w in text.split()) if re.search(r"\w", w)]
+
+
+def like_escape(text: str) -> str:
+    """Texto literal para um padrão LIKE ... ESCAPE '\\' (escapa \\, % e _)."""
+    return re.sub(r"([\\%_])", r"\\\1", text)
+
+
+def _fts_query(text: str) -> str:
+    if _is_numeric_query(text):
+        return f'keys : "{digits(text)}"*'
+    return "name : (" + " AND ".join(f'"{w}"*' for w in _words(text)) + ")"
+
+
+def _filter(text: str) -> tuple:
+    """Condição SQL sobre `clients` (sem alias) para o texto buscado: (sql, params)."""
+    if _available is None:
+        ensure_client_search()
+    numeric = _is_numeric_query(text)
+    if dialect().is_postgres:
+        if numeric:
+            return f"{PG_DIGITS_EXPR} LIKE ?", [f"%{digits(text)}%"]
+        words = _words(text)
+        return " AND ".join(f"{PG_NAME_EXPR} LIKE ? ESCAPE '\\'" for _ in words), [f"%{like_escape(w)}%" for w in words]
+    if _available:
+        return "id IN (SELECT rowid FROM clients_fts WHERE clients_fts MATCH ?)", [_fts_query(text)]
+    if numeric:
+        return f"{_digits_sql('cpf')} || ' ' || {_digits_sql('phone')} LIKE ?", [f"%{digits(text)}%"]
+    words = _words(text, fold=False)
+    return " AND ".join("lower(name) LIKE ? ESCAPE '\\'" for _ in words), [f"%{like_escape(w)}%" for w in words]
+
+
+def _has_terms(text: str) -> bool:
+    """Se o texto tem o que buscar; só pontuação ('"', '-') conta como busca vazia."""
+    return _is_numeric_query(text) or bool(_words(text))
+
+
+def search_clients(text: str, limit: int = SEARCH_LIMIT) -> list:
+    """Até `limit` clientes que casam com o texto digitado: [{'id', 'name', 'cpf', 'phone', 'status'}]."""
+    text = (text or "").strip()
+    if not _has_terms(text):
+        return []
+    where, params = _filter(text)
+    conn = get_conn()
+    if is_postgres_conn(conn):
+        return _search_pg(text, where, params, limit)
+    if _available:
+        # mais relevantes primeiro (bm25 do FTS5)
+        return exec_query(
+            """
+            SELECT c.id, c.name, c.cpf, c.phone, c.status
+            FROM clients_fts f JOIN clients c ON c.id = f.rowid
+            WHERE clients_fts MATCH ?
+            ORDER BY f.rank, c.name
+            LIMIT ?
+            """,
+            (*params, limit),
+        ).fetchall()
+    return exec_query(
+        f"SELECT id, name, cpf, phone, status FROM clients WHERE {where} ORDER BY name LIMIT ?", (*params, limit)
+    ).fetchall()
+
+
+def _search_pg(text: str, where: str, params: list, limit: int) -> list:
+    if _is_numeric_query(text):
+        return exec_query(
+            f"SELECT id, name, cpf, phone, status FROM clients WHERE {where} ORDER BY name LIMIT ?", (*params, limit)
+        ).fetchall()
+    q = normalize(text)
+    rows = exec_query(
+        f"""
+        SELECT id, name, cpf, phone, status FROM clients
+        WHERE {where}
+        ORDER BY {PG_NAME_EXPR} LIKE ? ESCAPE '\\' DESC, name
+        LIMIT ?
+        """,
+        (*params, f"{like_escape(q)}%", limit),
+    ).fetchall()
+    if rows or not _available:
+        return rows
+    # nada por palavra: tenta por semelhança (erros de digitação; operador % do pg_trgm, limiar 0.3, usa o índice)
+    return exec_query(
+        f"""
+        SELECT id, name, cpf, phone, status FROM clients
+        WHERE {PG_NAME_EXPR} % ?
+        ORDER BY similarity({PG_NAME_EXPR}, ?) DESC, name
+        LIMIT ?
+        """,
+        (q, q, limit),
+    ).fetchall()
+
+
+# Pedidos que ainda não foram entregues: o valor de venda deles está "em aberto" para o cliente
+OPEN_STATUSES = (
+    OrderStatus.CRIADO, OrderStatus.ENVIADO_FORNECEDOR, OrderStatus.AGUARDANDO_CONF,
+    OrderStatus.RECEBIDO_CONF, OrderStatus.RECEBIDO_NC, OrderStatus.EM_ESTOQUE,
+)
+DIRECTORY_PAGE = 50
+
+
+def list_clients(text: str = "", status: str | None = None, after_id: int | None = None, limit: int = DIRECTORY_PAGE):
+    """Página do cadastro (mais novos primeiro), com busca e filtro de status.
+
+    Paginação por chave: `after_id` é o cursor devolvido pela página anterior.
+    Retorna (linhas, próximo cursor ou None); cada linha traz também
+    'orders' (total de pedidos) e 'open_balance' (venda dos pedidos não
+    entregues), calculados por uma única consulta agregada para a página.
+    """
+    clauses, params = [], []
+    text = (text or "").strip()
+    if _has_terms(text):
+        where, p = _filter(text)
+        clauses.append(f"({where})")
+        params += p
+    if status:
+        clauses.append("status = ?")
+        params.append(status)
+    if after_id is not None:
+        clauses.append("id < ?")
+        params.append(after_id)
+    where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+    rows = exec_query(
+        f"SELECT id, name, address, cpf, phone, status FROM clients{where} ORDER BY id DESC LIMIT ?",
+        (*params, limit + 1),
+    ).fetchall()
+    page = [dict(r) for r in rows[:limit]]
+    cursor = page[-1]["id"] if len(rows) > limit else None
+    if page:
+        ids = [r["id"] for r in page]
+        marks = ",".join("?" * len(ids))
+        open_marks = ",".join("?" * len(OPEN_STATUSES))
+        totals = {
+            r["client_id"]: r for r in exec_query(
+                f"""
+                SELECT client_id,
+                       COUNT(*) AS orders,
+                       COALESCE(SUM(CASE WHEN status IN ({open_marks}) THEN price_sale ELSE 0 END), 0) AS open_balance
+                FROM orders
+                WHERE client_id IN ({marks})
+                GROUP BY client_id
+                """,
+                (*OPEN_STATUSES, *ids),
+            ).fetchall()
+        }
+        for r in page:
+            t = totals.get(r["id"])
+            r["orders"] = t["orders"] if t else 0
+            r["open_balance"] = float(t["open_balance"]) if t else 0.0
+    return page, cursor
+
+
+def count_clients(text: str = "", status: str | None = None) -> int:
+    clauses, params = [], []
+    text = (text or "").strip()
+    if _has_terms(text):
+        where, p = _filter(text)
+        clauses.append(f"({where})")
+        params += p
+    if status:
+        clauses.append("status = ?")
+        params.append(status)
+    where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+    return exec_query(f"SELECT COUNT(*) AS n FROM clients{where}", params).fetchone()["n"]
+
+
+def recent_clients(limit: int = 5) -> list:
+    """Clientes dos pedidos mais recentes e os recém-cadastrados, sem repetição."""
+    ids = [r["client_id"] for r in exec_query(
+        "SELECT client_id FROM orders ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()]
+    ids += [r["id"] for r in exec_query("SELECT id FROM clients ORDER BY id DESC LIMIT ?", (limit,)).fetchall()]
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return []
+    rows = exec_query(
+        f"SELECT id, name, cpf, phone, status FROM clients WHERE id IN ({','.join('?' * len(ids))})", ids
+    ).fetchall()
+    by_id = {r["id"]: r for r in rows}
+    return [by_id[i] for i in ids if i in by_id]
+
+
+def has_clients() -> bool:
+    return exec_query("SELECT 1 AS x FROM clients LIMIT 1").fetchone() is not None
+
+
+def client_label(row) -> str:
+    return f"{row['name']} (#{row['id']})"
@@ -2,7 +2,8 @@
 # Recebe pedido + fotos e cria um PDF. Retorna caminho.
 import os
 from datetime import datetime
-from core.db import from_json
+from core.db import order_specs
+from services import storage_stats
 
 def export_order_pdf(order_row) -> str:
     """Gera um arquivo texto/sumário do pedido para enviar ao fornecedor.
@@ -17,7 +18,7 @@ def export_order_pdf(order_row) -> str:
     filepath = os.path.join(exports_dir, filename)
     
     # Montar conteúdo
-    notes_struct = from_json(order_row['notes_struct'], {})
+    notes_struct = order_specs(order_row)
     content = f"""
 ╔════════════════════════════════════════════════════════════╗
 ║                    PEDIDO #{order_row['id']}                   ║
@@ -56,6 +57,7 @@ OBSERVAÇÕES
     
     with open(filepath, 'w', encoding='utf-8') as f:
         f.write(content)
+    storage_stats.record_file("exports", filepath)
     
     return filepath
 
@@ -1,10 +1,10 @@
 # Integração com WhatsApp (URL-deeplink)
 import urllib.parse
-from core.db import from_json
+from core.db import order_specs
 
 def generate_whatsapp_message(order_row) -> str:
     """Gera mensagem formatada com detalhes do pedido para WhatsApp."""
-    notes_struct = from_json(order_row['notes_struct'], {})
+    notes_struct = order_specs(order_row)
     specs = "\n".join([f"• {k}: {v}" for k, v in notes_struct.items()])
     
     message = f"""
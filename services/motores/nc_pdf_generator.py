@@ -1,23 +1,17 @@
 """Motor de geração de PDF para Não Conformidades (NC)"""
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak, Image
-from reportlab.lib import colors
 from datetime import datetime
 import os
 import tempfile
 from pathlib import Path
-from PIL import Image as PILImage
-import requests
+from core import metrics
+from services import storage_stats
 
 EXPORTS_DIR = Path("exports")
-EXPORTS_DIR.mkdir(exist_ok=True)
 
 # Diretório temporário para processamento de fotos
 TEMP_DIR = Path(tempfile.gettempdir()) / "enxovais_nc"
-TEMP_DIR.mkdir(exist_ok=True)
 
+@metrics.timer("pdf_seconds", kind="nc")
 def generate_nc_pdf(order_row, nc_kind, nc_description, problem_photos):
     """
     Gera PDF de Não Conformidade com fotos do problema.
@@ -31,7 +25,18 @@ def generate_nc_pdf(order_row, nc_kind, nc_description, problem_photos):
     Returns:
         Caminho do arquivo PDF gerado (str)
     """
-    
+    # importados aqui: a página de NCs abre sem carregar ReportLab/PIL
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak, Image
+    from reportlab.lib import colors
+    from PIL import Image as PILImage
+    import requests
+
+    EXPORTS_DIR.mkdir(exist_ok=True)
+    TEMP_DIR.mkdir(exist_ok=True)
+
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     filename = f"nc_pedido_{order_row['id']}_{timestamp}.pdf"
     pdf_path = EXPORTS_DIR / filename
@@ -179,8 +184,8 @@ def generate_nc_pdf(order_row, nc_kind, nc_description, problem_photos):
             story.append(Spacer(1, 0.2*inch))
     
     # Fotos Originais para Comparação
-    from core.db import from_json
-    original_photos = from_json(order_row['photos'], [])
+    from services.photos import order_photos
+    original_photos = [p['url'] for p in order_photos(order_row['id'])]
     
     if original_photos:
         story.append(Paragraph("<b>FOTOS ORIGINAIS (PARA COMPARAÇÃO)</b>", heading_style))
@@ -249,5 +254,6 @@ def generate_nc_pdf(order_row, nc_kind, nc_description, problem_photos):
     
     # Gerar PDF
     doc.build(story)
+    storage_stats.record_file("exports", str(pdf_path))
     
     return str(pdf_path)
@@ -3,32 +3,36 @@ import os
 from datetime import datetime
 from io import BytesIO
 from typing import Optional
-from PIL import Image
-import requests
 from io import BytesIO as _BytesIO
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib.units import inch
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.colors import HexColor, grey
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image as RLImage, Table, TableStyle, PageBreak
-from reportlab.lib import colors
-from core.db import from_json
+from core.db import order_specs
+from services.photos import order_photos
+from services import storage_stats
+from core import metrics
 
 
+@metrics.timer("pdf_seconds", kind="order")
 def generate_order_pdf(order_row, photos_paths: Optional[list] = None) -> str:
     """
     Gera PDF completo do pedido com fotos embutidas.
     
     Args:
         order_row: dict com dados do pedido (de database)
-        photos_paths: lista de caminhos das fotos
+        photos_paths: lista de caminhos das fotos (padrão: order_photos do pedido)
     
     Returns:
         str: caminho do arquivo PDF gerado
     """
-    
+    # ReportLab, PIL e requests só quando um PDF é gerado (não ao abrir a página)
+    from PIL import Image
+    import requests
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import inch
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.colors import HexColor, grey
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image as RLImage, Table, TableStyle
+
     if photos_paths is None:
-        photos_paths = from_json(order_row['photos'], [])
+        photos_paths = [p['url'] for p in order_photos(order_row['id'])]
     
     # Criar diretório de exports
     exports_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "exports"))
@@ -129,7 +133,7 @@ def generate_order_pdf(order_row, photos_paths: Optional[list] = None) -> str:
     story.append(Spacer(1, 0.2*inch))
     
     # Especificações
-    notes_struct = from_json(order_row['notes_struct'], {})
+    notes_struct = order_specs(order_row)
     if notes_struct:
         story.append(Paragraph("ESPECIFICAÇÕES", heading_style))
         for key, value in notes_struct.items():
@@ -228,5 +232,6 @@ def generate_order_pdf(order_row, photos_paths: Optional[list] = None) -> str:
     
     # Gerar PDF
     doc.build(story)
+    storage_stats.record_file("exports", filepath)
     
     return filepath
@@ -0,0 +1,246 @@
+"""Projeção das listagens de pedidos (tabela order_listing).
+
+Uma linha por pedido com tudo o que as páginas de status mostram: cliente,
+caminho do produto, preços, observações, resumo das especificações (uma
+linha "chave: valor" por item do notes_struct), quantidade de fotos e
+primeira miniatura, quantidade de NCs e situação financeira (PENDENTE /
+PAGO; NULL sem lançamento). As páginas leem só esta tabela, indexada por
+(status, id), em vez de juntar orders + clients e decodificar JSON a cada
+rerun.
+
+A tabela é derivada: triggers em orders, clients, order_photos,
+nonconformities e finance_entries recalculam a linha do pedido afetado na
+mesma transação da escrita. Sem a projeção (erro ao criar os triggers) as
+páginas recebem as mesmas colunas direto das tabelas de origem.
+
+    python -m services.order_listing rebuild
+"""
+import sys
+from core.db import dialect, exec_query, get_conn, hold_conn, init_db, is_postgres_conn
+
+_COLUMNS = ("id, status, client_id, client_name, category, type, product, product_path, price_cost, price_sale, "
+            "notes_free, specs, photo_count, thumb_url, nc_count, finance_state, created_at, updated_at")
+
+_available = None   # None = ainda não verificado; depois True/False
+
+
+def _select(specs_expr: str) -> str:
+    """SELECT das colunas da projeção a partir das tabelas de origem (sem WHERE)."""
+    return f"""
+    SELECT o.id, o.status, o.client_id, c.name, o.category, o.type, o.product,
+           o.category || '/' || o.type || '/' || o.product,
+           o.price_cost, o.price_sale, coalesce(o.notes_free, ''), {specs_expr},
+           (SELECT COUNT(*) FROM order_photos p WHERE p.order_id = o.id AND p.nc_id IS NULL),
+           (SELECT coalesce(p.thumb_url, p.url) FROM order_photos p
+            WHERE p.order_id = o.id AND p.nc_id IS NULL ORDER BY p.position LIMIT 1),
+           (SELECT COUNT(*) FROM nonconformities n WHERE n.order_id = o.id),
+           (SELECT CASE WHEN COUNT(*) = 0 THEN NULL WHEN MIN(f.settled) = 1 THEN 'PAGO' ELSE 'PENDENTE' END
+            FROM finance_entries f WHERE f.order_id = o.id),
+           o.created_at, o.updated_at
+    FROM orders o JOIN clients c ON c.id = o.client_id"""
+
+
+# Folhas do JSON (medidas aninhadas entram como "medidas.largura: 2"), na ordem do documento
+SQLITE_SELECT = _select(
+    "CASE WHEN json_valid(o.notes_struct) THEN coalesce((SELECT group_concat(substr(fullkey, 3) || ': ' || value, char(10)) "
+    "FROM json_tree(o.notes_struct) WHERE type NOT IN ('object', 'array', 'null')), '') ELSE '' END"
+)
+PG_SELECT = _select("order_specs_summary(o.notes_struct)")
+
+_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS order_listing (
+  id INTEGER PRIMARY KEY,
+  status TEXT NOT NULL,
+  client_id INTEGER NOT NULL,
+  client_name TEXT NOT NULL,
+  category TEXT NOT NULL,
+  type TEXT NOT NULL,
+  product TEXT NOT NULL,
+  product_path TEXT NOT NULL,
+  price_cost REAL NOT NULL,
+  price_sale REAL NOT NULL,
+  notes_free TEXT NOT NULL DEFAULT '',
+  specs TEXT NOT NULL DEFAULT '',
+  photo_count INTEGER NOT NULL DEFAULT 0,
+  thumb_url TEXT,
+  nc_count INTEGER NOT NULL DEFAULT 0,
+  finance_state TEXT,
+  created_at TEXT NOT NULL,
+  updated_at TEXT NOT NULL
+)"""
+_INDEX_SQL = "CREATE INDEX IF NOT EXISTS idx_order_listing_status ON order_listing(status, id)"
+
+# Tabelas que alimentam a projeção: (tabela, coluna com o id do pedido)
+_SOURCES = (("order_photos", "order_id"), ("nonconformities", "order_id"), ("finance_entries", "order_id"))
+
+
+def _sqlite_refresh(ref: str) -> str:
+    return (f"DELETE FROM order_listing WHERE id = {ref}; "
+            f"INSERT INTO order_listing({_COLUMNS}) {SQLITE_SELECT} WHERE o.id = {ref};")
+
+
+SQLITE_LISTING_SQL = f"""
+{_TABLE_SQL};
+{_INDEX_SQL};
+CREATE TRIGGER IF NOT EXISTS order_listing_ai AFTER INSERT ON orders BEGIN {_sqlite_refresh('new.id')} END;
+CREATE TRIGGER IF NOT EXISTS order_listing_au AFTER UPDATE ON orders BEGIN {_sqlite_refresh('new.id')} END;
+CREATE TRIGGER IF NOT EXISTS order_listing_ad AFTER DELETE ON orders BEGIN DELETE FROM order_listing WHERE id = old.id; END;
+CREATE TRIGGER IF NOT EXISTS order_listing_client AFTER UPDATE OF name ON clients BEGIN
+  UPDATE order_listing SET client_name = new.name WHERE client_id = new.id;
+END;
+""" + "".join(
+    f"""CREATE TRIGGER IF NOT EXISTS order_listing_{table}_ai AFTER INSERT ON {table} BEGIN {_sqlite_refresh(f'new.{col}')} END;
+CREATE TRIGGER IF NOT EXISTS order_listing_{table}_au AFTER UPDATE ON {table} BEGIN {_sqlite_refresh(f'new.{col}')} END;
+CREATE TRIGGER IF NOT EXISTS order_listing_{table}_ad AFTER DELETE ON {table} BEGIN {_sqlite_refresh(f'old.{col}')} END;
+"""
+    for table, col in _SOURCES
+)
+
+# Cada item é um statement inteiro (os corpos PL/pgSQL têm ';' e não passam pelo split do init_db)
+PG_LISTING_SQL = (
+    _TABLE_SQL,
+    _INDEX_SQL,
+    """
+    CREATE OR REPLACE FUNCTION order_specs_summary(j jsonb) RETURNS text LANGUAGE sql IMMUTABLE AS $$
+      WITH RECURSIVE t(key, value) AS (
+        SELECT e.key, e.value FROM jsonb_each(CASE WHEN jsonb_typeof(j) = 'object' THEN j ELSE '{}'::jsonb END) e
+        UNION ALL
+        SELECT t.key || '.' || e.key, e.value
+        FROM t, jsonb_each(CASE WHEN jsonb_typeof(t.value) = 'object' THEN t.value ELSE '{}'::jsonb END) e
+      )
+      SELECT coalesce(string_agg(key || ': ' || (value #>> '{}'), chr(10)), '') FROM t
+      WHERE jsonb_typeof(value) NOT IN ('object', 'array', 'null')
+    $$
+    """,
+    # Upsert (DELETE + INSERT concorrentes no mesmo pedido violariam a PK). O lock na
+    # linha do pedido enfileira os refreshes dele: o segundo recalcula depois do commit
+    # do primeiro e vê as escritas dele. Sem o pedido (excluído), a linha sai.
+    f"""
+    CREATE OR REPLACE FUNCTION order_listing_refresh_order(oid integer) RETURNS void LANGUAGE plpgsql AS $$
+    BEGIN
+      PERFORM 1 FROM orders WHERE id = oid FOR NO KEY UPDATE;
+      INSERT INTO order_listing({_COLUMNS}) {PG_SELECT} WHERE o.id = oid
+      ON CONFLICT (id) DO UPDATE SET {", ".join(f"{c} = EXCLUDED.{c}" for c in _COLUMNS.split(", ")[1:])};
+      IF NOT FOUND THEN
+        DELETE FROM order_listing WHERE id = oid;
+      END IF;
+    END
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION order_listing_refresh() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+      IF TG_TABLE_NAME = 'orders' THEN
+        IF TG_OP = 'DELETE' THEN
+          DELETE FROM order_listing WHERE id = OLD.id;
+        ELSE
+          PERFORM order_listing_refresh_order(NEW.id);
+        END IF;
+      ELSE
+        IF TG_OP <> 'INSERT' THEN
+          PERFORM order_listing_refresh_order(OLD.order_id);
+        END IF;
+        IF TG_OP = 'INSERT' THEN
+          PERFORM order_listing_refresh_order(NEW.order_id);
+        ELSIF TG_OP = 'UPDATE' AND NEW.order_id IS DISTINCT FROM OLD.order_id THEN
+          PERFORM order_listing_refresh_order(NEW.order_id);
+        END IF;
+      END IF;
+      RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION order_listing_client() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+      UPDATE order_listing SET client_name = NEW.name WHERE client_id = NEW.id;
+      RETURN NULL;
+    END
+    $$
+    """,
+    "DROP TRIGGER IF EXISTS clients_listing_refresh ON clients",
+    "CREATE TRIGGER clients_listing_refresh AFTER UPDATE OF name ON clients FOR EACH ROW EXECUTE FUNCTION order_listing_client()",
+) + tuple(
+    stmt
+    for table in ("orders",) + tuple(t for t, _ in _SOURCES)
+    for stmt in (
+        f"DROP TRIGGER IF EXISTS {table}_listing_refresh ON {table}",
+        f"CREATE TRIGGER {table}_listing_refresh AFTER INSERT OR UPDATE OR DELETE ON {table} "
+        "FOR EACH ROW EXECUTE FUNCTION order_listing_refresh()",
+    )
+)
+
+
+def ensure_order_listing() -> bool:
+    """Cria a projeção e os triggers (idempotente, uma vez por processo); calcula tudo se estiver vazia.
+
+    Depois disso os triggers mantêm a projeção; uma projeção divergente se
+    reconstrói pela linha de comando (`rebuild`).
+    """
+    global _available
+    if _available is not None:
+        return _available
+    conn = get_conn()
+    try:
+        if is_postgres_conn(conn):
+            for stmt in PG_LISTING_SQL:
+                exec_query(stmt)
+            conn.commit()
+        else:
+            with hold_conn():
+                conn.executescript(SQLITE_LISTING_SQL)
+        empty = exec_query("SELECT 1 AS x FROM order_listing LIMIT 1").fetchone() is None
+        if empty and exec_query("SELECT 1 AS x FROM orders LIMIT 1").fetchone():
+            rebuild_listing()
+        _available = True
+    except Exception as e:
+        conn.rollback()
+        print(f"⚠️ Projeção de pedidos indisponível ({e}); listagens direto de orders")
+        _available = False
+    return _available
+
+
+def rebuild_listing():
+    """Recalcula a projeção inteira a partir das tabelas de origem (uma transação)."""
+    conn = get_conn()
+    select = PG_SELECT if is_postgres_conn(conn) else SQLITE_SELECT
+    exec_query("DELETE FROM order_listing")
+    exec_query(f"INSERT INTO order_listing({_COLUMNS}) {select}")
+    conn.commit()
+
+
+def list_orders(status: str) -> list:
+    """Pedidos de um status, mais recentes primeiro, com as colunas de _COLUMNS."""
+    if _available is None:
+        ensure_order_listing()
+    if _available:
+        return exec_query(f"SELECT {_COLUMNS} FROM order_listing WHERE status = ? ORDER BY id DESC", (status,)).fetchall()
+    # sem projeção: as mesmas colunas calculadas na hora
+    select = PG_SELECT if dialect().is_postgres else SQLITE_SELECT
+    return exec_query(
+        f"WITH l({_COLUMNS}) AS ({select} WHERE o.status = ?) SELECT * FROM l ORDER BY id DESC",
+        (status,),
+    ).fetchall()
+
+
+def specs_items(row) -> list:
+    """[(chave, valor)] do resumo de especificações de uma linha da projeção."""
+    return [tuple(line.partition(": ")[::2]) for line in (row["specs"] or "").splitlines()]
+
+
+def order_row(order_id: int):
+    """Pedido completo (orders.* + client_name), para PDF e mensagem."""
+    return exec_query(
+        "SELECT o.*, c.name AS client_name FROM orders o JOIN clients c ON c.id = o.client_id WHERE o.id = ?",
+        (order_id,),
+    ).fetchone()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] != "rebuild":
+        print("Uso: python -m services.order_listing rebuild")
+        sys.exit(1)
+    init_db()
+    if ensure_order_listing():
+        rebuild_listing()
+        print("✅ Projeção de pedidos reconstruída")
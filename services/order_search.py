@@ -0,0 +1,243 @@
+"""Busca textual de pedidos: produto, observações, especificações e cliente.
+
+- SQLite: tabela FTS5 `orders_fts` (rowid = orders.id) com quatro colunas
+  (produto = categoria/tipo/produto, notas = notes_free, specs = valores
+  do JSON notes_struct, cliente = nome) e tokenizer unicode61 sem acentos.
+  Triggers em orders (inclusão, alteração dos campos indexados, exclusão)
+  e em clients (troca de nome) mantêm o índice a cada escrita.
+- PostgreSQL: tabela `order_search(order_id, doc tsvector)` com índice GIN,
+  mantida por triggers PL/pgSQL; o documento usa a configuração 'simple'
+  sobre o texto sem acentos, com peso A para produto e cliente, B para as
+  especificações e C para as observações.
+
+Cada palavra buscada é um prefixo e todas precisam aparecer; o resultado
+vem ordenado por relevância (bm25 / ts_rank). Um número sozinho também
+encontra o pedido com aquele id. Sem FTS5/PL/pgSQL a busca cai para LIKE.
+
+    python -m services.order_search rebuild
+"""
+import re
+import sys
+from core.db import exec_query, get_conn, hold_conn, init_db, is_postgres_conn
+from services.clients import like_escape, normalize, pg_fold
+
+SEARCH_LIMIT = 50
+
+_available = None   # None = ainda não verificado; depois True/False
+
+
+def _sqlite_doc(o: str) -> str:
+    """Valores das quatro colunas do orders_fts para a linha `o` (new ou alias de orders)."""
+    return (
+        f"{o}.category || ' ' || {o}.type || ' ' || {o}.product, "
+        f"coalesce({o}.notes_free, ''), "
+        f"CASE WHEN json_valid({o}.notes_struct) THEN "
+        f"(SELECT group_concat(value, ' ') FROM json_tree({o}.notes_struct) WHERE type NOT IN ('object', 'array', 'null')) "
+        "ELSE '' END, "
+        f"coalesce((SELECT name FROM clients WHERE id = {o}.client_id), '')"
+    )
+
+
+SQLITE_FTS_SQL = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS orders_fts USING fts5(
+  product, notes, specs, client,
+  tokenize = "unicode61 remove_diacritics 2",
+  prefix = '2 3'
+);
+CREATE TRIGGER IF NOT EXISTS orders_fts_ai AFTER INSERT ON orders BEGIN
+  INSERT INTO orders_fts(rowid, product, notes, specs, client) VALUES (new.id, {_sqlite_doc('new')});
+END;
+CREATE TRIGGER IF NOT EXISTS orders_fts_au AFTER UPDATE OF category, type, product, notes_free, notes_struct, client_id ON orders BEGIN
+  DELETE FROM orders_fts WHERE rowid = old.id;
+  INSERT INTO orders_fts(rowid, product, notes, specs, client) VALUES (new.id, {_sqlite_doc('new')});
+END;
+CREATE TRIGGER IF NOT EXISTS orders_fts_ad AFTER DELETE ON orders BEGIN
+  DELETE FROM orders_fts WHERE rowid = old.id;
+END;
+CREATE TRIGGER IF NOT EXISTS orders_fts_client AFTER UPDATE OF name ON clients BEGIN
+  UPDATE orders_fts SET client = new.name WHERE rowid IN (SELECT id FROM orders WHERE client_id = new.id);
+END;
+"""
+
+# Cada item é um statement inteiro (os corpos PL/pgSQL têm ';' e não passam pelo split do init_db)
+PG_SEARCH_SQL = (
+    """
+    CREATE TABLE IF NOT EXISTS order_search (
+      order_id INTEGER PRIMARY KEY REFERENCES orders(id) ON DELETE CASCADE,
+      doc tsvector NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_order_search_doc ON order_search USING gin (doc)",
+    """
+    CREATE OR REPLACE FUNCTION order_specs_text(txt text) RETURNS text LANGUAGE plpgsql IMMUTABLE AS $$
+    BEGIN
+      RETURN coalesce((SELECT string_agg(value, ' ') FROM jsonb_each_text(txt::jsonb)), '');
+    EXCEPTION WHEN others THEN
+      RETURN '';
+    END
+    $$
+    """,
+    f"""
+    CREATE OR REPLACE FUNCTION order_search_doc(o orders) RETURNS tsvector LANGUAGE sql STABLE AS $$
+      SELECT setweight(to_tsvector('simple', {pg_fold("o.category || ' ' || o.type || ' ' || o.product")}), 'A')
+          || setweight(to_tsvector('simple', {pg_fold("coalesce((SELECT name FROM clients WHERE id = o.client_id), '')")}), 'A')
+          || setweight(to_tsvector('simple', {pg_fold("order_specs_text(o.notes_struct::text)")}), 'B')
+          || setweight(to_tsvector('simple', {pg_fold("coalesce(o.notes_free, '')")}), 'C')
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION order_search_refresh() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+      INSERT INTO order_search(order_id, doc) VALUES (NEW.id, order_search_doc(NEW))
+      ON CONFLICT (order_id) DO UPDATE SET doc = EXCLUDED.doc;
+      RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION order_search_client() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+      UPDATE order_search s SET doc = order_search_doc(o) FROM orders o
+      WHERE o.client_id = NEW.id AND s.order_id = o.id;
+      RETURN NULL;
+    END
+    $$
+    """,
+    "DROP TRIGGER IF EXISTS orders_search_refresh ON orders",
+    "CREATE TRIGGER orders_search_refresh AFTER INSERT OR UPDATE OF category, type, product, notes_free, notes_struct, client_id "
+    "ON orders FOR EACH ROW EXECUTE FUNCTION order_search_refresh()",
+    "DROP TRIGGER IF EXISTS clients_search_refresh ON clients",
+    "CREATE TRIGGER clients_search_refresh AFTER UPDATE OF name ON clients FOR EACH ROW EXECUTE FUNCTION order_search_client()",
+)
+
+
+def ensure_order_search() -> bool:
+    """Cria o índice e os triggers (idempotente, uma vez por processo); indexa tudo se estiver vazio.
+
+    Depois disso os triggers mantêm o índice; um índice divergente se
+    reconstrói pela linha de comando (`rebuild`).
+    """
+    global _available
+    if _available is not None:
+        return _available
+    conn = get_conn()
+    try:
+        if is_postgres_conn(conn):
+            for stmt in PG_SEARCH_SQL:
+                exec_query(stmt)
+            conn.commit()
+            table = "order_search"
+        else:
+            with hold_conn():
+                conn.executescript(SQLITE_FTS_SQL)
+            table = "orders_fts"
+        empty = exec_query(f"SELECT 1 AS x FROM {table} LIMIT 1").fetchone() is None
+        if empty and exec_query("SELECT 1 AS x FROM orders LIMIT 1").fetchone():
+            rebuild_index()
+        _available = True
+    except Exception as e:
+        print(f"⚠️ Índice de busca de pedidos indisponível ({e}); busca sem índice")
+        _available = False
+    return _available
+
+
+def rebuild_index():
+    """Recria o índice inteiro a partir de orders (uma transação)."""
+    conn = get_conn()
+    if is_postgres_conn(conn):
+        exec_query("DELETE FROM order_search")
+        exec_query("INSERT INTO order_search(order_id, doc) SELECT o.id, order_search_doc(o) FROM orders o")
+    else:
+        exec_query("DELETE FROM orders_fts")
+        exec_query(f"INSERT INTO orders_fts(rowid, product, notes, specs, client) SELECT o.id, {_sqlite_doc('o')} FROM orders o")
+    conn.commit()
+
+
+def _words(text: str) -> list:
+    return [w for w in (re.sub(r"[^\w]", "", w) for w in normalize(text).split()) if w]
+
+
+def search_orders(text: str, status: str | None = None, limit: int = SEARCH_LIMIT) -> list:
+    """Pedidos que casam com o texto, mais relevantes primeiro.
+
+    Cada linha: id, client, category, type, product, status, price_sale,
+    created_at e snippet (trecho com o termo encontrado, quando houver).
+    """
+    words = _words(text)
+    if not words:
+        return []
+    if _available is None:
+        ensure_order_search()
+    status_sql, status_params = ("AND o.status = ?", [status]) if status else ("", [])
+    # número sozinho: o pedido com esse id vem primeiro
+    by_id = []
+    if len(words) == 1 and words[0].isdigit():
+        by_id = exec_query(
+            f"""
+            SELECT o.id, c.name AS client, o.category, o.type, o.product, o.status, o.price_sale, o.created_at, '' AS snippet
+            FROM orders o JOIN clients c ON c.id = o.client_id
+            WHERE o.id = ? {status_sql}
+            """,
+            (int(words[0]), *status_params),
+        ).fetchall()
+    rows = _search(words, status_sql, status_params, limit)
+    seen = {r["id"] for r in by_id}
+    return (list(by_id) + [r for r in rows if r["id"] not in seen])[:limit]
+
+
+def _search(words: list, status_sql: str, status_params: list, limit: int) -> list:
+    conn = get_conn()
+    if _available and is_postgres_conn(conn):
+        return exec_query(
+            f"""
+            SELECT o.id, c.name AS client, o.category, o.type, o.product, o.status, o.price_sale, o.created_at,
+                   '' AS snippet, ts_rank(s.doc, q) AS rank
+            FROM order_search s
+            JOIN orders o ON o.id = s.order_id
+            JOIN clients c ON c.id = o.client_id,
+                 to_tsquery('simple', ?) q
+            WHERE s.doc @@ q {status_sql}
+            ORDER BY rank DESC, o.id DESC
+            LIMIT ?
+            """,
+            (" & ".join(f"{w}:*" for w in words), *status_params, limit),
+        ).fetchall()
+    if _available:
+        return exec_query(
+            f"""
+            SELECT o.id, c.name AS client, o.category, o.type, o.product, o.status, o.price_sale, o.created_at,
+                   snippet(orders_fts, -1, '[', ']', '…', 8) AS snippet
+            FROM orders_fts f
+            JOIN orders o ON o.id = f.rowid
+            JOIN clients c ON c.id = o.client_id
+            WHERE orders_fts MATCH ? {status_sql}
+            ORDER BY bm25(orders_fts, 10.0, 2.0, 4.0, 6.0), o.id DESC
+            LIMIT ?
+            """,
+            (" AND ".join(f'"{w}"*' for w in words), *status_params, limit),
+        ).fetchall()
+    # sem índice: LIKE em cada campo (sem acento só no PostgreSQL)
+    name_expr = pg_fold("c.name") if is_postgres_conn(conn) else "lower(c.name)"
+    fields = "lower(o.category || ' ' || o.type || ' ' || o.product || ' ' || coalesce(o.notes_free, '') || ' ' || coalesce(CAST(o.notes_struct AS TEXT), ''))"
+    where = " AND ".join(f"({fields} LIKE ? ESCAPE '\\' OR {name_expr} LIKE ? ESCAPE '\\')" for _ in words)
+    params = [p for w in words for p in (f"%{like_escape(w)}%",) * 2]
+    return exec_query(
+        f"""
+        SELECT o.id, c.name AS client, o.category, o.type, o.product, o.status, o.price_sale, o.created_at, '' AS snippet
+        FROM orders o JOIN clients c ON c.id = o.client_id
+        WHERE {where} {status_sql}
+        ORDER BY o.id DESC
+        LIMIT ?
+        """,
+        (*params, *status_params, limit),
+    ).fetchall()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] != "rebuild":
+        print("Uso: python -m services.order_search rebuild")
+        sys.exit(1)
+    init_db()
+    if ensure_order_search():
+        rebuild_index()
+        print("✅ Índice de busca de pedidos reconstruído")
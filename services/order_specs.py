@@ -0,0 +1,132 @@
+"""Especificações estruturadas dos pedidos (orders.notes_struct) consultadas no banco.
+
+- PostgreSQL: a coluna é JSONB (bancos antigos com TEXT são convertidos uma
+  vez por `ensure_order_specs`; texto inválido vira {"observacao": texto})
+  com índice GIN jsonb_path_ops: o filtro é `notes_struct @> '{...}'`.
+- SQLite: a coluna continua TEXT; índices de expressão json_extract para as
+  chaves mais usadas (tecido, cor, acabamento). Outras chaves funcionam do
+  mesmo jeito, só sem índice.
+
+    find_orders_by_spec(tecido="Percal", cor="Azul", status=OrderStatus.AGUARDANDO_CONF)
+"""
+import json
+from core.db import dialect, exec_query, get_conn, hold_conn, is_postgres_conn, order_specs
+
+SPEC_LIMIT = 200
+INDEXED_KEYS = ("tecido", "cor", "acabamento")
+
+_available = None   # None = ainda não verificado; depois True/False
+
+# Cada item é um statement inteiro (o corpo PL/pgSQL tem ';')
+PG_CONVERT_SQL = (
+    """
+    CREATE OR REPLACE FUNCTION notes_struct_jsonb(txt text) RETURNS jsonb LANGUAGE plpgsql IMMUTABLE AS $$
+    BEGIN
+      IF txt IS NULL OR btrim(txt) = '' THEN
+        RETURN '{}'::jsonb;
+      END IF;
+      RETURN txt::jsonb;
+    EXCEPTION WHEN others THEN
+      RETURN jsonb_build_object('observacao', txt);
+    END
+    $$
+    """,
+    # o trigger da busca de pedidos depende da coluna (UPDATE OF); ensure_order_search o recria
+    "DROP TRIGGER IF EXISTS orders_search_refresh ON orders",
+    "ALTER TABLE orders ALTER COLUMN notes_struct DROP DEFAULT, "
+    "ALTER COLUMN notes_struct TYPE jsonb USING notes_struct_jsonb(notes_struct), "
+    "ALTER COLUMN notes_struct SET DEFAULT '{}'::jsonb",
+)
+PG_INDEX_SQL = "CREATE INDEX IF NOT EXISTS idx_orders_notes_struct ON orders USING gin (notes_struct jsonb_path_ops)"
+
+
+def _sqlite_expr(path: tuple, column: str = "notes_struct") -> str:
+    """Valor de uma chave (caminho) do notes_struct; igual no índice e na consulta."""
+    json_path = "$" + "".join(f'."{k}"' for k in path)
+    return f"(CASE WHEN json_valid({column}) THEN json_extract({column}, '{json_path}') END)"
+
+
+def _sqlite_index_sql() -> str:
+    return "\n".join(
+        f"CREATE INDEX IF NOT EXISTS idx_orders_spec_{key} ON orders{_sqlite_expr((key,))};"
+        for key in INDEXED_KEYS
+    )
+
+
+def ensure_order_specs() -> bool:
+    """Converte notes_struct para JSONB (PostgreSQL) e cria os índices (idempotente, uma vez por processo)."""
+    global _available
+    if _available is not None:
+        return _available
+    conn = get_conn()
+    try:
+        if is_postgres_conn(conn):
+            kind = exec_query(
+                "SELECT data_type FROM information_schema.columns WHERE table_name = 'orders' AND column_name = 'notes_struct'"
+            ).fetchone()
+            converted = kind is not None and kind["data_type"] != "jsonb"
+            if converted:
+                print("🔄 Convertendo orders.notes_struct para JSONB...")
+                for stmt in PG_CONVERT_SQL:
+                    exec_query(stmt)
+            exec_query(PG_INDEX_SQL)
+            conn.commit()
+            if converted:
+                from services.order_search import ensure_order_search
+                ensure_order_search()
+        else:
+            with hold_conn():
+                conn.executescript(_sqlite_index_sql())
+        _available = True
+    except Exception as e:
+        conn.rollback()
+        print(f"⚠️ Índices de especificações indisponíveis ({e}); filtros sem índice")
+        _available = False
+    return _available
+
+
+def _flatten(specs: dict, prefix: tuple = ()) -> list:
+    """[(caminho, valor)] das folhas de um dict aninhado ({"medidas": {"largura": 2}})."""
+    items = []
+    for key, value in specs.items():
+        if isinstance(value, dict):
+            items.extend(_flatten(value, prefix + (key,)))
+        else:
+            items.append((prefix + (key,), value))
+    return items
+
+
+def find_orders_by_spec(status: str | None = None, limit: int = SPEC_LIMIT, **specs) -> list:
+    """Pedidos cujas especificações contêm todos os pares pedidos, mais recentes primeiro.
+
+    Valores None são ignorados; dicts filtram chaves aninhadas. Cada linha é
+    um dict com id, client, category, type, product, status, price_sale,
+    created_at e notes_struct já decodificado.
+    """
+    if _available is None:
+        ensure_order_specs()    # no PostgreSQL o @> precisa da coluna já em JSONB
+    specs = {k: v for k, v in specs.items() if v is not None}
+    clauses, params = [], []
+    if specs:
+        if dialect().is_postgres:
+            clauses.append("o.notes_struct @> ?::jsonb")
+            params.append(json.dumps(specs, ensure_ascii=False))
+        else:
+            for path, value in _flatten(specs):
+                clauses.append(f"{_sqlite_expr(path, 'o.notes_struct')} = ?")
+                params.append(value)
+    if status:
+        clauses.append("o.status = ?")
+        params.append(status)
+    where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+    rows = exec_query(
+        f"""
+        SELECT o.id, c.name AS client, o.category, o.type, o.product, o.status, o.price_sale, o.created_at, o.notes_struct
+        FROM orders o JOIN clients c ON c.id = o.client_id
+        {where}
+        ORDER BY o.id DESC
+        LIMIT ?
+        """,
+        (*params, limit),
+    ).fetchall()
+    return [{**dict(r), "notes_struct": order_specs(r)} for r in rows]
@@ -0,0 +1,149 @@
+"""Fotos de pedidos e de NCs (tabela order_photos).
+
+Uma linha por foto: pedido, NC (NULL para as fotos originais do pedido),
+URL, miniatura, sha256, tamanho e posição. Acrescentar uma foto é um
+INSERT; listagens carregam as fotos de todos os pedidos da página numa
+consulta só (`photos_for_orders`).
+
+As colunas JSON orders.photos / nonconformities.photos continuam sendo
+gravadas por compatibilidade. Bancos anteriores à tabela são migrados uma
+vez a partir delas:
+    python -m services.photos backfill
+"""
+import sys
+from core.db import exec_query, from_json, init_db, load_config, now_iso, save_config
+
+BACKFILL_KEY = "order_photos_backfilled"
+IN_CHUNK = 500
+FETCH_ROWS = 2000
+
+_COLUMNS = "id, order_id, nc_id, url, thumb_url, content_hash, size, position, created_at"
+
+
+def _as_meta(photo) -> dict:
+    """Aceita o dict de core.storage.save_photo ou uma URL solta (legado)."""
+    return photo if isinstance(photo, dict) else {"url": photo}
+
+
+def add_photos(order_id: int, photos: list, nc_id: int | None = None) -> int:
+    """Acrescenta fotos ao pedido (ou à NC) depois das existentes. Não faz commit.
+
+    `photos`: dicts de save_photo ou URLs. Retorna quantas foram gravadas.
+    """
+    metas = [_as_meta(p) for p in photos if p]
+    if not metas:
+        return 0
+    if nc_id is None:
+        r = exec_query("SELECT MAX(position) AS pos FROM order_photos WHERE order_id=? AND nc_id IS NULL", (order_id,)).fetchone()
+    else:
+        r = exec_query("SELECT MAX(position) AS pos FROM order_photos WHERE nc_id=?", (nc_id,)).fetchone()
+    start = r['pos'] + 1 if r and r['pos'] is not None else 0
+    ts = now_iso()
+    for i, m in enumerate(metas):
+        exec_query(
+            """
+            INSERT INTO order_photos(order_id, nc_id, url, thumb_url, content_hash, size, position, created_at)
+            VALUES (?,?,?,?,?,?,?,?)
+            """,
+            (order_id, nc_id, m["url"], m.get("thumb_url"), m.get("content_hash"), m.get("size"), start + i, ts),
+        )
+    return len(metas)
+
+
+def order_photos(order_id: int) -> list:
+    """Fotos originais do pedido, na ordem de envio."""
+    rows = exec_query(
+        f"SELECT {_COLUMNS} FROM order_photos WHERE order_id=? AND nc_id IS NULL ORDER BY position",
+        (order_id,),
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def nc_photos(nc_id: int) -> list:
+    """Fotos de evidência de uma NC."""
+    rows = exec_query(f"SELECT {_COLUMNS} FROM order_photos WHERE nc_id=? ORDER BY position", (nc_id,)).fetchall()
+    return [dict(r) for r in rows]
+
+
+def photos_for_orders(order_ids) -> dict:
+    """{order_id: [fotos originais]} para uma lista de pedidos (uma consulta por bloco de IN_CHUNK)."""
+    ids = list(dict.fromkeys(order_ids))
+    result = {}
+    for i in range(0, len(ids), IN_CHUNK):
+        chunk = ids[i:i + IN_CHUNK]
+        rows = exec_query(
+            f"""
+            SELECT {_COLUMNS} FROM order_photos
+            WHERE order_id IN ({','.join('?' * len(chunk))}) AND nc_id IS NULL
+            ORDER BY order_id, position
+            """,
+            chunk,
+        ).fetchall()
+        for r in rows:
+            result.setdefault(r['order_id'], []).append(dict(r))
+    return result
+
+
+def display_url(photo: dict) -> str:
+    """URL para exibir em listagens: a miniatura quando existir."""
+    return photo.get('thumb_url') or photo['url']
+
+
+def _legacy_rows(sql: str):
+    cur = exec_query(sql)
+    while True:
+        rows = cur.fetchmany(FETCH_ROWS)
+        if not rows:
+            break
+        yield from rows
+
+
+def backfill_order_photos() -> int:
+    """Copia os arrays JSON de orders.photos e nonconformities.photos para order_photos.
+
+    Pedidos/NCs que já têm linhas na tabela são ignorados, então pode ser
+    repetido sem duplicar. Sem miniatura, hash ou tamanho (não se baixa a foto).
+    """
+    pending = []
+    for r in _legacy_rows(
+        """
+        SELECT o.id, o.photos, o.created_at FROM orders o
+        WHERE o.photos IS NOT NULL AND o.photos <> '[]'
+          AND NOT EXISTS (SELECT 1 FROM order_photos p WHERE p.order_id = o.id AND p.nc_id IS NULL)
+        """
+    ):
+        for pos, url in enumerate(u for u in from_json(r['photos'], []) if u):
+            pending.append((r['id'], None, url, pos, r['created_at']))
+    for r in _legacy_rows(
+        """
+        SELECT n.id, n.order_id, n.photos, n.created_at FROM nonconformities n
+        WHERE n.photos IS NOT NULL AND n.photos <> '[]'
+          AND NOT EXISTS (SELECT 1 FROM order_photos p WHERE p.nc_id = n.id)
+        """
+    ):
+        for pos, url in enumerate(u for u in from_json(r['photos'], []) if u):
+            pending.append((r['order_id'], r['id'], url, pos, r['created_at']))
+
+    for row in pending:
+        exec_query(
+            "INSERT INTO order_photos(order_id, nc_id, url, position, created_at) VALUES (?,?,?,?,?)",
+            row,
+        )
+    save_config(BACKFILL_KEY, True)  # commit junto com os INSERTs
+    return len(pending)
+
+
+def ensure_order_photos():
+    """Migra as fotos em JSON na primeira execução de um banco anterior à tabela."""
+    if load_config(BACKFILL_KEY, False):
+        return
+    backfill_order_photos()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] != "backfill":
+        print("Uso: python -m services.photos backfill")
+        sys.exit(1)
+    init_db()
+    n = backfill_order_photos()
+    print(f"✅ {n} fotos copiadas para order_photos" if n else "ℹ️ Nenhuma foto pendente de migração")
@@ -1 +1,217 @@
-# Helpers de Não Conformidade (estatísticas, reincidência)
+"""Helpers de Não Conformidade (estatísticas, reincidência).
+
+Os contadores ficam em `nc_counters`, mantidos incrementalmente: cada NC
+registrada soma 1 em (escopo, chave, tipo) e em (escopo, chave, '*') para os
+escopos global, categoria, produto e pedido. Dois contadores especiais
+tornam a reincidência uma leitura por chave primária:
+
+- '#orders': pedidos com pelo menos uma NC
+- '#recurrent': pedidos com duas ou mais NCs
+
+Reconstrução a partir de `nonconformities`:
+    python -m services.quality rebuild
+"""
+import sys
+from core.db import get_conn, exec_query, exec_insert, init_db, now_iso, to_json
+from services.photos import add_photos
+
+TOTAL = "*"
+ORDERS_WITH_NC = "#orders"
+RECURRENT_ORDERS = "#recurrent"
+SPECIAL_KINDS = (TOTAL, ORDERS_WITH_NC, RECURRENT_ORDERS)
+
+# escopo → expressão SQL da chave (usada no rebuild) sobre nonconformities n JOIN orders o
+_SCOPES = {
+    "global": "'*'",
+    "category": "o.category",
+    "product": "o.category || ' / ' || o.type || ' / ' || o.product",
+}
+
+
+def _group_by(*exprs: str) -> str:
+    """GROUP BY das expressões, sem as constantes (o PostgreSQL não aceita literal no GROUP BY).
+
+    Sem nenhuma coluna sobra uma agregação só, que não pode gerar linha com 0.
+    """
+    cols = [e for e in exprs if not e.startswith("'")]
+    return f"GROUP BY {', '.join(cols)}" if cols else "HAVING COUNT(*) > 0"
+
+
+def product_key(order_row) -> str:
+    return f"{order_row['category']} / {order_row['type']} / {order_row['product']}"
+
+
+def _scope_keys(order_row):
+    return [("global", "*"), ("category", order_row['category']), ("product", product_key(order_row))]
+
+
+def _bump(scope: str, key: str, kind: str, delta: int = 1):
+    exec_query(
+        """
+        INSERT INTO nc_counters(scope, scope_key, kind, n) VALUES (?,?,?,?)
+        ON CONFLICT (scope, scope_key, kind) DO UPDATE SET n = nc_counters.n + excluded.n
+        """,
+        (scope, key, kind, delta),
+    )
+
+
+def _get(scope: str, key: str, kind: str) -> int:
+    r = exec_query(
+        "SELECT n FROM nc_counters WHERE scope=? AND scope_key=? AND kind=?",
+        (scope, str(key), kind),
+    ).fetchone()
+    return int(r['n']) if r else 0
+
+
+def order_nc_count(order_id: int) -> int:
+    """Quantas NCs o pedido já teve."""
+    return _get("order", str(order_id), TOTAL)
+
+
+def register_nc(order_row, kind: str, description: str, photos: list) -> int:
+    """Registra uma NC, suas fotos e atualiza os contadores. Não faz commit: roda na transação do chamador.
+
+    `photos`: dicts de core.storage.save_photo (ou URLs).
+    Retorna o número de ordem da NC para o pedido (gravado em nonconformities.count).
+    """
+    nth = order_nc_count(order_row['id']) + 1
+    photos = [p for p in photos if p]
+    urls = [p['url'] if isinstance(p, dict) else p for p in photos]
+    nc_id = exec_insert(
+        "INSERT INTO nonconformities(order_id, kind, description, photos, count, created_at) VALUES (?,?,?,?,?,?)",
+        (order_row['id'], kind, description, to_json(urls), nth, now_iso()),
+    )
+    add_photos(order_row['id'], photos, nc_id=nc_id)
+
+    _bump("order", str(order_row['id']), kind)
+    _bump("order", str(order_row['id']), TOTAL)
+    for scope, key in _scope_keys(order_row):
+        _bump(scope, key, kind)
+        _bump(scope, key, TOTAL)
+        if nth == 1:
+            _bump(scope, key, ORDERS_WITH_NC)
+        elif nth == 2:
+            _bump(scope, key, RECURRENT_ORDERS)
+    return nth
+
+
+def unregister_order_ncs(order_row):
+    """Desconta dos contadores as NCs do pedido (antes de excluí-las). Não faz commit.
+
+    Inverso de register_nc para todas as NCs do pedido de uma vez.
+    """
+    rows = exec_query(
+        "SELECT kind, COUNT(*) AS n FROM nonconformities WHERE order_id=? GROUP BY kind",
+        (order_row['id'],),
+    ).fetchall()
+    total = sum(int(r['n']) for r in rows)
+    if not total:
+        return
+    exec_query("DELETE FROM nc_counters WHERE scope='order' AND scope_key=?", (str(order_row['id']),))
+    for scope, key in _scope_keys(order_row):
+        for r in rows:
+            _bump(scope, key, r['kind'], -int(r['n']))
+        _bump(scope, key, TOTAL, -total)
+        _bump(scope, key, ORDERS_WITH_NC, -1)
+        if total >= 2:
+            _bump(scope, key, RECURRENT_ORDERS, -1)
+        # contador zerado some, como no rebuild
+        exec_query("DELETE FROM nc_counters WHERE scope=? AND scope_key=? AND n <= 0", (scope, key))
+
+
+def recurrence_rate(scope: str = "global", key: str = "*") -> float:
+    """Fração dos pedidos com NC que tiveram mais de uma NC."""
+    with_nc = _get(scope, key, ORDERS_WITH_NC)
+    return _get(scope, key, RECURRENT_ORDERS) / with_nc if with_nc else 0.0
+
+
+def top_kinds(scope: str = "global", key: str = "*", limit: int = 5):
+    """Tipos de NC mais frequentes no escopo: [(kind, n), ...]."""
+    rows = exec_query(
+        "SELECT kind, n FROM nc_counters WHERE scope=? AND scope_key=? ORDER BY n DESC",
+        (scope, str(key)),
+    ).fetchall()
+    return [(r['kind'], int(r['n'])) for r in rows if r['kind'] not in SPECIAL_KINDS][:limit]
+
+
+def summary(scope: str = "global", key: str = "*"):
+    """Totais do escopo: NCs, pedidos com NC, pedidos reincidentes e taxa de reincidência."""
+    rows = exec_query(
+        "SELECT kind, n FROM nc_counters WHERE scope=? AND scope_key=? AND kind IN (?,?,?)",
+        (scope, str(key), *SPECIAL_KINDS),
+    ).fetchall()
+    values = {r['kind']: int(r['n']) for r in rows}
+    with_nc = values.get(ORDERS_WITH_NC, 0)
+    recurrent = values.get(RECURRENT_ORDERS, 0)
+    return {
+        'ncs': values.get(TOTAL, 0),
+        'orders_with_nc': with_nc,
+        'recurrent_orders': recurrent,
+        'recurrence_rate': recurrent / with_nc if with_nc else 0.0,
+    }
+
+
+def rebuild_counters():
+    """Recalcula contadores e nonconformities.count a partir das NCs existentes (set-based)."""
+    exec_query("DELETE FROM nc_counters")
+    exec_query(
+        """
+        UPDATE nonconformities SET count = (
+          SELECT COUNT(*) FROM nonconformities n2
+          WHERE n2.order_id = nonconformities.order_id AND n2.id <= nonconformities.id
+        )
+        """
+    )
+
+    scopes = dict(_SCOPES, order="CAST(n.order_id AS TEXT)")
+    for scope, key_sql in scopes.items():
+        exec_query(
+            f"""
+            INSERT INTO nc_counters(scope, scope_key, kind, n)
+            SELECT '{scope}', {key_sql}, n.kind, COUNT(*)
+            FROM nonconformities n JOIN orders o ON o.id=n.order_id
+            {_group_by(key_sql, "n.kind")}
+            """
+        )
+        exec_query(
+            f"""
+            INSERT INTO nc_counters(scope, scope_key, kind, n)
+            SELECT '{scope}', {key_sql}, '{TOTAL}', COUNT(*)
+            FROM nonconformities n JOIN orders o ON o.id=n.order_id
+            {_group_by(key_sql)}
+            """
+        )
+
+    for scope, key_sql in _SCOPES.items():
+        for kind, min_ncs in ((ORDERS_WITH_NC, 1), (RECURRENT_ORDERS, 2)):
+            exec_query(
+                f"""
+                INSERT INTO nc_counters(scope, scope_key, kind, n)
+                SELECT '{scope}', scope_key, '{kind}', COUNT(*)
+                FROM (
+                  SELECT {key_sql} AS scope_key, n.order_id
+                  FROM nonconformities n JOIN orders o ON o.id=n.order_id
+                  {_group_by(key_sql, "n.order_id")}
+                  HAVING COUNT(*) >= {min_ncs}
+                ) per_order
+                GROUP BY scope_key
+                """
+            )
+    get_conn().commit()
+
+
+def ensure_counters():
+    """Constrói os contadores na primeira execução de um banco que já tem NCs."""
+    if exec_query("SELECT 1 AS x FROM nc_counters LIMIT 1").fetchone():
+        return
+    if exec_query("SELECT 1 AS x FROM nonconformities LIMIT 1").fetchone():
+        rebuild_counters()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] != "rebuild":
+        print("Uso: python -m services.quality rebuild")
+        sys.exit(1)
+    init_db()
+    rebuild_counters()
+    print(f"✅ Contadores de NC reconstruídos: {summary()}")
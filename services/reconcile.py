@@ -0,0 +1,191 @@
+"""Reconciliação de uploads: fotos no armazenamento sem referência no banco.
+
+Uma passada só: as referências de order_photos (fotos e miniaturas) são
+lidas em blocos para um set de nomes de arquivo, e o armazenamento (pasta
+local de uploads ou listagem do bucket Supabase) é percorrido uma vez.
+Custo O(arquivos + referências), sem LIKE por arquivo.
+
+Pode rodar em segundo plano (`start_scan` / `scan_status`) para a página de
+Administração não travar com muitos arquivos.
+"""
+import os
+import threading
+import time
+from urllib.parse import unquote, urlparse
+from core.db import exec_query, now_iso
+from core.storage import BASE_UPLOAD
+from services import storage_stats
+from services.photos import ensure_order_photos
+
+UPLOAD_DIR = BASE_UPLOAD
+FETCH_ROWS = 2000
+SUPABASE_PAGE = 1000
+PHOTO_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+_job_lock = threading.Lock()
+_job = {"running": False, "started_at": None, "finished_at": None, "result": None, "error": None}
+
+
+def photo_key(ref: str) -> str:
+    """Nome do arquivo de uma referência (URL pública do Supabase ou caminho local)."""
+    if "?" in ref or "#" in ref:
+        ref = urlparse(ref).path
+    name = ref.replace("\\", "/").rsplit("/", 1)[-1]
+    return unquote(name) if "%" in name else name
+
+
+def photo_references() -> set:
+    """Nomes de arquivo referenciados por pedidos e NCs (fotos e miniaturas em order_photos)."""
+    refs = set()
+    cur = exec_query("SELECT url, thumb_url FROM order_photos")
+    while True:
+        rows = cur.fetchmany(FETCH_ROWS)
+        if not rows:
+            break
+        for r in rows:
+            refs.add(photo_key(r['url']))
+            if r['thumb_url']:
+                refs.add(photo_key(r['thumb_url']))
+    return refs
+
+
+def _supabase_config():
+    url = os.environ.get('SUPABASE_URL')
+    key = os.environ.get('SUPABASE_KEY')
+    if not (url and key):
+        return None
+    return url.rstrip('/'), key, os.environ.get('SUPABASE_BUCKET', 'uploads')
+
+
+def list_local_uploads(base: str | None = None):
+    """Gera (nome, caminho, tamanho) das fotos na pasta local (os.scandir, recursivo)."""
+    stack = [base or UPLOAD_DIR]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.lower().endswith(PHOTO_EXTENSIONS):
+                    yield entry.name, entry.path, entry.stat().st_size
+
+
+def list_supabase_objects():
+    """Gera (nome, chave, tamanho) dos objetos na raiz do bucket, paginando a listagem."""
+    import requests
+    url, key, bucket = _supabase_config()
+    headers = {'apikey': key, 'Authorization': f'Bearer {key}'}
+    offset = 0
+    while True:
+        resp = requests.post(
+            f"{url}/storage/v1/object/list/{bucket}",
+            headers=headers,
+            json={"prefix": "", "limit": SUPABASE_PAGE, "offset": offset, "sortBy": {"column": "name", "order": "asc"}},
+            timeout=30,
+        )
+        resp.raise_for_status()
+        items = resp.json()
+        for item in items:
+            if item.get('id') is None:  # "pastas" não têm id
+                continue
+            yield item['name'], item['name'], (item.get('metadata') or {}).get('size', 0)
+        if len(items) < SUPABASE_PAGE:
+            break
+        offset += SUPABASE_PAGE
+
+
+def storage_backend() -> str:
+    return "supabase" if _supabase_config() else "local"
+
+
+def find_orphans(backend: str | None = None) -> dict:
+    """Fotos do armazenamento sem referência no banco.
+
+    Retorna {'backend', 'files', 'references', 'orphans': [{'name', 'location', 'size'}],
+    'orphan_bytes', 'elapsed_s', 'finished_at'}.
+    """
+    # as referências vêm só de order_photos: sem a migração das fotos em JSON
+    # (normalmente feita no início do app), toda foto antiga pareceria órfã
+    ensure_order_photos()
+    backend = backend or storage_backend()
+    t0 = time.perf_counter()
+    refs = photo_references()
+    listing = list_supabase_objects() if backend == "supabase" else list_local_uploads()
+    files = 0
+    orphans = []
+    for name, location, size in listing:
+        files += 1
+        if name not in refs:
+            orphans.append({"name": name, "location": location, "size": size or 0})
+    return {
+        "backend": backend,
+        "files": files,
+        "references": len(refs),
+        "orphans": orphans,
+        "orphan_bytes": sum(o["size"] for o in orphans),
+        "elapsed_s": time.perf_counter() - t0,
+        "finished_at": now_iso(),
+    }
+
+
+def delete_orphans(orphans: list, backend: str | None = None) -> tuple[int, list]:
+    """Apaga as fotos órfãs informadas. Retorna (apagadas, erros)."""
+    backend = backend or storage_backend()
+    errors = []
+    if backend == "supabase":
+        import requests
+        url, key, bucket = _supabase_config()
+        deleted = 0
+        for i in range(0, len(orphans), SUPABASE_PAGE):
+            chunk = [o["location"] for o in orphans[i:i + SUPABASE_PAGE]]
+            try:
+                resp = requests.delete(
+                    f"{url}/storage/v1/object/{bucket}",
+                    headers={'apikey': key, 'Authorization': f'Bearer {key}'},
+                    json={"prefixes": chunk},
+                    timeout=60,
+                )
+                resp.raise_for_status()
+                deleted += len(chunk)
+            except Exception as e:
+                errors.append(f"{chunk[0]}…: {e}")
+        return deleted, errors
+
+    deleted = freed = 0
+    for o in orphans:
+        try:
+            os.remove(o["location"])
+            deleted += 1
+            freed += o["size"]
+        except OSError as e:
+            errors.append(f"{o['name']}: {e}")
+    storage_stats.record_delete("uploads", freed, files=deleted)
+    return deleted, errors
+
+
+def _run_job(backend):
+    try:
+        result, error = find_orphans(backend), None
+    except Exception as e:
+        result, error = None, str(e)
+    with _job_lock:
+        _job.update(running=False, finished_at=now_iso(), result=result, error=error)
+
+
+def start_scan(backend: str | None = None) -> bool:
+    """Dispara a varredura numa thread. Retorna False se já houver uma em andamento."""
+    with _job_lock:
+        if _job["running"]:
+            return False
+        _job.update(running=True, started_at=now_iso(), finished_at=None, error=None)
+    threading.Thread(target=_run_job, args=(backend,), name="orphan-scan", daemon=True).start()
+    return True
+
+
+def scan_status() -> dict:
+    """Estado da última varredura em segundo plano (running, started_at, finished_at, result, error)."""
+    with _job_lock:
+        return dict(_job)
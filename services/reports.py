@@ -0,0 +1,292 @@
+"""Motor de relatórios: lead times, taxas de NC, margens e melhores clientes.
+
+Todas as consultas são set-based (CTEs + funções de janela) e rodam no banco;
+PostgreSQL e SQLite compartilham o SQL, exceto a aritmética de datas e o FLOOR.
+Os resultados são cacheados por (relatório, período, parâmetros).
+"""
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from core.db import dialect, exec_query
+from core import metrics
+
+CACHE_TTL = 300  # segundos
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+NC_LEVELS = {
+    "category": ["category"],
+    "type": ["category", "type"],
+    "product": ["category", "type", "product"],
+}
+
+
+def _days_between(later: str, earlier: str) -> str:
+    """Expressão SQL com a diferença em dias entre duas colunas ISO (TEXT)."""
+    if dialect().is_postgres:
+        return f"EXTRACT(EPOCH FROM (CAST({later} AS timestamp) - CAST({earlier} AS timestamp))) / 86400.0"
+    return f"(julianday({later}) - julianday({earlier}))"
+
+
+def _floor(expr: str) -> str:
+    """Parte inteira de uma expressão não negativa (CAST arredonda no PostgreSQL)."""
+    if dialect().is_postgres:
+        return f"FLOOR({expr})"
+    return f"CAST({expr} AS INTEGER)"
+
+
+def _bounds(start: date, end: date):
+    """Período fechado [start, end] em dias → intervalo ISO semiaberto [start, end+1)."""
+    return start.isoformat(), (end + timedelta(days=1)).isoformat()
+
+
+def _cached(key, compute):
+    now = time.monotonic()
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit and now - hit[0] < CACHE_TTL:
+            metrics.inc("cache_requests_total", cache="reports", result="hit")
+            return hit[1]
+    metrics.inc("cache_requests_total", cache="reports", result="miss")
+    value = compute()
+    with _cache_lock:
+        _cache[key] = (now, value)
+    return value
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+def _rows(sql: str, params=()):
+    # PostgreSQL devolve NUMERIC como Decimal; normaliza para float
+    return [
+        {k: float(v) if isinstance(v, Decimal) else v for k, v in dict(r).items()}
+        for r in exec_query(sql, params).fetchall()
+    ]
+
+
+def lead_times(start: date, end: date):
+    """Tempo (dias) que os pedidos passam em cada status, para permanências iniciadas no período.
+
+    Eventos: criação do pedido (CRIADO) + cada linha de order_status_history.
+    Como o próximo evento nunca é anterior ao atual, basta ler eventos a partir do início.
+    Retorna por status: n, média, mediana e p90.
+    """
+    lo, hi = _bounds(start, end)
+
+    def compute():
+        return _rows(
+            f"""
+            WITH events AS (
+              SELECT id AS order_id, 'CRIADO' AS status, created_at AS ts FROM orders
+              WHERE created_at >= ?
+              UNION ALL
+              SELECT order_id, to_status, ts FROM order_status_history
+              WHERE ts >= ?
+            ),
+            spans AS (
+              SELECT status, ts, LEAD(ts) OVER (PARTITION BY order_id ORDER BY ts) AS next_ts
+              FROM events
+            ),
+            durations AS (
+              SELECT status, {_days_between('next_ts', 'ts')} AS days
+              FROM spans
+              WHERE next_ts IS NOT NULL AND ts < ?
+            ),
+            ranked AS (
+              SELECT status, days,
+                     ROW_NUMBER() OVER (PARTITION BY status ORDER BY days) AS rn,
+                     COUNT(*) OVER (PARTITION BY status) AS n
+              FROM durations
+            )
+            SELECT status, MAX(n) AS n, AVG(days) AS avg_days,
+                   AVG(CASE WHEN rn IN ((n + 1) / 2, (n + 2) / 2) THEN days END) AS median_days,
+                   MAX(CASE WHEN rn = (9 * n + 9) / 10 THEN days END) AS p90_days
+            FROM ranked
+            GROUP BY status
+            ORDER BY status
+            """,
+            (lo, lo, hi),
+        )
+
+    return _cached(("lead_times", lo, hi), compute)
+
+
+def time_in_status(status: str, start: date, end: date, level: str = "category"):
+    """Dias que os pedidos ficaram em `status` (entradas no período), por categoria/tipo/produto.
+
+    As entradas vêm do índice (to_status, ts) e a saída de cada uma do índice
+    (order_id, ts) de order_status_history — sem varrer a auditoria.
+    """
+    cols = NC_LEVELS[level]
+    select_cols = ", ".join(f"o.{c}" for c in cols)
+    lo, hi = _bounds(start, end)
+
+    def compute():
+        return _rows(
+            f"""
+            WITH entered AS (
+              SELECT h.order_id, h.ts,
+                     (SELECT MIN(n.ts) FROM order_status_history n
+                      WHERE n.order_id=h.order_id AND n.ts > h.ts) AS left_ts
+              FROM order_status_history h
+              WHERE h.to_status=? AND h.ts >= ? AND h.ts < ?
+            ),
+            durations AS (
+              SELECT {select_cols}, {_days_between('e.left_ts', 'e.ts')} AS days
+              FROM entered e
+              JOIN orders o ON o.id=e.order_id
+              WHERE e.left_ts IS NOT NULL
+            ),
+            ranked AS (
+              SELECT {", ".join(cols)}, days,
+                     ROW_NUMBER() OVER (PARTITION BY {", ".join(cols)} ORDER BY days) AS rn,
+                     COUNT(*) OVER (PARTITION BY {", ".join(cols)}) AS n
+              FROM durations
+            )
+            SELECT {", ".join(cols)}, MAX(n) AS n, AVG(days) AS avg_days,
+                   AVG(CASE WHEN rn IN ((n + 1) / 2, (n + 2) / 2) THEN days END) AS median_days
+            FROM ranked
+            GROUP BY {", ".join(cols)}
+            ORDER BY median_days DESC
+            """,
+            (status, lo, hi),
+        )
+
+    return _cached(("time_in_status", status, lo, hi, level), compute)
+
+
+def nc_rates(start: date, end: date, level: str = "category"):
+    """Taxa de não conformidade dos pedidos criados no período, por categoria/tipo/produto."""
+    cols = NC_LEVELS[level]
+    select_cols = ", ".join(f"o.{c}" for c in cols)
+    lo, hi = _bounds(start, end)
+
+    def compute():
+        return _rows(
+            f"""
+            WITH nc AS (
+              SELECT order_id, COUNT(*) AS n FROM nonconformities GROUP BY order_id
+            )
+            SELECT {select_cols},
+                   COUNT(*) AS orders,
+                   SUM(CASE WHEN nc.n IS NOT NULL THEN 1 ELSE 0 END) AS orders_nc,
+                   COALESCE(SUM(nc.n), 0) AS ncs,
+                   1.0 * SUM(CASE WHEN nc.n IS NOT NULL THEN 1 ELSE 0 END) / COUNT(*) AS nc_rate
+            FROM orders o
+            LEFT JOIN nc ON nc.order_id=o.id
+            WHERE o.created_at >= ? AND o.created_at < ?
+            GROUP BY {select_cols}
+            ORDER BY nc_rate DESC, orders DESC
+            """,
+            (lo, hi),
+        )
+
+    return _cached(("nc_rates", lo, hi, level), compute)
+
+
+def nc_kinds(start: date, end: date):
+    """Distribuição das NCs registradas no período por tipo (medida, tecido, ...)."""
+    lo, hi = _bounds(start, end)
+
+    def compute():
+        return _rows(
+            """
+            SELECT kind, COUNT(*) AS ncs,
+                   1.0 * COUNT(*) / SUM(COUNT(*)) OVER () AS share
+            FROM nonconformities
+            WHERE created_at >= ? AND created_at < ?
+            GROUP BY kind
+            ORDER BY ncs DESC
+            """,
+            (lo, hi),
+        )
+
+    return _cached(("nc_kinds", lo, hi), compute)
+
+
+def margin_distribution(start: date, end: date):
+    """Distribuição da margem % (margem/venda) dos lançamentos do período, por categoria.
+
+    Retorna (quartis por categoria, histograma em faixas de 10%).
+    """
+    lo, hi = _bounds(start, end)
+
+    def compute():
+        stats = _rows(
+            """
+            WITH m AS (
+              SELECT o.category, 100.0 * f.margin / f.sale AS pct
+              FROM finance_entries f
+              JOIN orders o ON o.id=f.order_id
+              WHERE f.created_at >= ? AND f.created_at < ? AND f.sale > 0
+            ),
+            ranked AS (
+              SELECT category, pct,
+                     ROW_NUMBER() OVER (PARTITION BY category ORDER BY pct) AS rn,
+                     COUNT(*) OVER (PARTITION BY category) AS n
+              FROM m
+            )
+            SELECT category, MAX(n) AS n, AVG(pct) AS avg_pct,
+                   MAX(CASE WHEN rn = (n + 3) / 4 THEN pct END) AS p25_pct,
+                   AVG(CASE WHEN rn IN ((n + 1) / 2, (n + 2) / 2) THEN pct END) AS p50_pct,
+                   MAX(CASE WHEN rn = (3 * n + 3) / 4 THEN pct END) AS p75_pct
+            FROM ranked
+            GROUP BY category
+            ORDER BY category
+            """,
+            (lo, hi),
+        )
+        histogram = _rows(
+            f"""
+            WITH m AS (
+              SELECT 100.0 * margin / sale AS pct
+              FROM finance_entries
+              WHERE created_at >= ? AND created_at < ? AND sale > 0
+            )
+            SELECT CASE WHEN pct < 0 THEN -10
+                        WHEN pct >= 100 THEN 100
+                        ELSE {_floor('pct / 10')} * 10 END AS bucket,
+                   COUNT(*) AS entries
+            FROM m
+            GROUP BY 1
+            ORDER BY 1
+            """,
+            (lo, hi),
+        )
+        return stats, histogram
+
+    return _cached(("margin_distribution", lo, hi), compute)
+
+
+def top_clients(start: date, end: date, limit: int = 10):
+    """Clientes com maior venda no período (lançamentos financeiros), com ranking."""
+    lo, hi = _bounds(start, end)
+
+    def compute():
+        return _rows(
+            """
+            WITH t AS (
+              SELECT c.id AS client_id, c.name, COUNT(*) AS orders,
+                     SUM(f.sale) AS sale, SUM(f.margin) AS margin
+              FROM finance_entries f
+              JOIN orders o ON o.id=f.order_id
+              JOIN clients c ON c.id=o.client_id
+              WHERE f.created_at >= ? AND f.created_at < ?
+              GROUP BY c.id, c.name
+            )
+            SELECT client_id, name, orders, sale, margin,
+                   RANK() OVER (ORDER BY sale DESC) AS ranking,
+                   1.0 * sale / SUM(sale) OVER () AS share
+            FROM t
+            ORDER BY sale DESC
+            LIMIT ?
+            """,
+            (lo, hi, limit),
+        )
+
+    return _cached(("top_clients", lo, hi, limit), compute)
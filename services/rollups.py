@@ -0,0 +1,154 @@
+"""Agregados financeiros diários e mensais (finance_daily / finance_monthly).
+
+Cada lançamento de `finance_entries` contribui para uma linha por
+(período, categoria, settled). Os agregados são mantidos incrementalmente
+quando um lançamento é criado ou quitado, e podem ser reconstruídos do zero:
+
+    python -m services.rollups rebuild
+"""
+import sys
+from collections import defaultdict
+from core.db import get_conn, exec_query, init_db
+
+# (tabela, coluna de período, tamanho do prefixo ISO usado como chave)
+_ROLLUPS = (
+    ("finance_daily", "day", 10),    # YYYY-MM-DD
+    ("finance_monthly", "month", 7),  # YYYY-MM
+)
+
+
+def _bump(created_at: str, category: str, settled: int, entries: int, cost: float, sale: float, margin: float):
+    """Soma (ou subtrai, com valores negativos) um delta nos dois níveis de agregação."""
+    for table, period_col, size in _ROLLUPS:
+        exec_query(
+            f"""
+            INSERT INTO {table}({period_col}, category, settled, entries, cost, sale, margin)
+            VALUES (?,?,?,?,?,?,?)
+            ON CONFLICT ({period_col}, category, settled) DO UPDATE SET
+              entries = {table}.entries + excluded.entries,
+              cost = {table}.cost + excluded.cost,
+              sale = {table}.sale + excluded.sale,
+              margin = {table}.margin + excluded.margin
+            """,
+            (created_at[:size], category, settled, entries, cost, sale, margin),
+        )
+
+
+def record_entry(created_at: str, category: str, cost: float, sale: float, margin: float, settled: int = 0):
+    """Registra um novo lançamento nos agregados. Não faz commit: roda na transação do chamador."""
+    _bump(created_at, category, int(settled), 1, cost or 0.0, sale or 0.0, margin or 0.0)
+
+
+def record_settlement(entries):
+    """Move lançamentos de pendente (settled=0) para pago (settled=1).
+
+    `entries`: linhas com created_at, category, cost, sale, margin.
+    Agrupa por dia/categoria antes de escrever. Não faz commit.
+    """
+    grouped = defaultdict(lambda: [0, 0.0, 0.0, 0.0])
+    for e in entries:
+        acc = grouped[(e['created_at'][:10], e['category'])]
+        acc[0] += 1
+        acc[1] += e['cost'] or 0.0
+        acc[2] += e['sale'] or 0.0
+        acc[3] += e['margin'] or 0.0
+
+    for (day, category), (n, cost, sale, margin) in grouped.items():
+        _bump(day, category, 0, -n, -cost, -sale, -margin)
+        _bump(day, category, 1, n, cost, sale, margin)
+
+
+def forget_order_entries(order_id: int):
+    """Desconta dos agregados os lançamentos do pedido (antes de excluí-los). Não faz commit."""
+    rows = exec_query(
+        """
+        SELECT substr(f.created_at, 1, 10) AS day, o.category, f.settled,
+               COUNT(*) AS n, SUM(f.cost) AS cost, SUM(f.sale) AS sale, SUM(f.margin) AS margin
+        FROM finance_entries f JOIN orders o ON o.id=f.order_id
+        WHERE f.order_id=?
+        GROUP BY substr(f.created_at, 1, 10), o.category, f.settled
+        """,
+        (order_id,),
+    ).fetchall()
+    for r in rows:
+        _bump(r['day'], r['category'], int(r['settled']), -int(r['n']),
+              -(r['cost'] or 0.0), -(r['sale'] or 0.0), -(r['margin'] or 0.0))
+
+
+def rebuild_rollups():
+    """Recalcula os agregados a partir de finance_entries (operação set-based)."""
+    for table, period_col, size in _ROLLUPS:
+        exec_query(f"DELETE FROM {table}")
+        exec_query(
+            f"""
+            INSERT INTO {table}({period_col}, category, settled, entries, cost, sale, margin)
+            SELECT substr(f.created_at, 1, {size}), o.category, f.settled,
+                   COUNT(*), SUM(f.cost), SUM(f.sale), SUM(f.margin)
+            FROM finance_entries f
+            JOIN orders o ON o.id=f.order_id
+            GROUP BY substr(f.created_at, 1, {size}), o.category, f.settled
+            """
+        )
+    get_conn().commit()
+
+
+def ensure_rollups():
+    """Constrói os agregados na primeira execução de um banco que já tem lançamentos."""
+    has_rollup = exec_query("SELECT 1 AS x FROM finance_monthly LIMIT 1").fetchone()
+    if has_rollup:
+        return
+    has_entries = exec_query("SELECT 1 AS x FROM finance_entries LIMIT 1").fetchone()
+    if has_entries:
+        rebuild_rollups()
+
+
+def period_totals(start_day: str, end_day: str):
+    """Totais por estado de pagamento no intervalo [start_day, end_day] (YYYY-MM-DD).
+
+    Retorna {settled: {'entries', 'cost', 'sale', 'margin'}} para settled em (0, 1).
+    """
+    totals = {s: {'entries': 0, 'cost': 0.0, 'sale': 0.0, 'margin': 0.0} for s in (0, 1)}
+    rows = exec_query(
+        """
+        SELECT settled, SUM(entries) AS entries, SUM(cost) AS cost, SUM(sale) AS sale, SUM(margin) AS margin
+        FROM finance_daily
+        WHERE day BETWEEN ? AND ?
+        GROUP BY settled
+        """,
+        (start_day, end_day),
+    ).fetchall()
+    for r in rows:
+        totals[int(r['settled'])] = {
+            'entries': int(r['entries'] or 0),
+            'cost': r['cost'] or 0.0,
+            'sale': r['sale'] or 0.0,
+            'margin': r['margin'] or 0.0,
+        }
+    return totals
+
+
+def monthly_trend(start_month: str, end_month: str, by_category: bool = False):
+    """Série mensal (YYYY-MM) de custo/venda/margem, lida de finance_monthly."""
+    group = "month, category" if by_category else "month"
+    return exec_query(
+        f"""
+        SELECT {group},
+               SUM(entries) AS entries, SUM(cost) AS cost, SUM(sale) AS sale, SUM(margin) AS margin,
+               SUM(CASE WHEN settled=1 THEN cost ELSE 0 END) AS cost_paid
+        FROM finance_monthly
+        WHERE month BETWEEN ? AND ?
+        GROUP BY {group}
+        ORDER BY {group}
+        """,
+        (start_month, end_month),
+    ).fetchall()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] != "rebuild":
+        print("Uso: python -m services.rollups rebuild")
+        sys.exit(1)
+    init_db()
+    rebuild_rollups()
+    n = exec_query("SELECT COUNT(*) AS c FROM finance_daily").fetchone()
+    print(f"✅ Agregados financeiros reconstruídos ({n['c']} linhas diárias)")
@@ -0,0 +1,130 @@
+"""Estatísticas de armazenamento local (fotos em uploads/, PDFs em exports/).
+
+Totais (arquivos, bytes) por área mantidos em memória e atualizados por
+quem grava ou apaga arquivos (`record_file` / `record_delete`: geradores
+de PDF, limpeza de órfãos e de PDFs antigos). Uma varredura completa com
+os.scandir corrige desvios: roda em segundo plano quando o último retrato
+tem mais de RESCAN_INTERVAL_S segundos, e o resultado fica salvo em
+config para que um processo novo já abra a Administração com números.
+
+`stats()` nunca percorre os diretórios na thread de quem chama.
+"""
+import os
+import threading
+import time
+from core.db import load_config, now_iso, save_config
+from core.storage import BASE_UPLOAD
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+AREAS = {
+    "uploads": BASE_UPLOAD,
+    "exports": os.path.join(ROOT, "exports"),
+}
+CONFIG_KEY = "storage_stats"
+RESCAN_INTERVAL_S = float(os.environ.get("EXONVAIS_STORAGE_RESCAN_S", "3600"))
+
+_lock = threading.Lock()
+_state = {"totals": None, "scanned_at": None, "scanned_ts": 0.0, "scanning": False, "error": None}
+
+
+def scan_dir(path: str) -> dict:
+    """{'files', 'bytes'} de um diretório (os.scandir, recursivo, sem seguir links)."""
+    files = size = 0
+    stack = [path]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        files += 1
+                        size += entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    continue  # apagado durante a varredura
+    return {"files": files, "bytes": size}
+
+
+def rescan() -> dict:
+    """Varredura completa de todas as áreas; atualiza a memória e o retrato em config."""
+    totals = {area: scan_dir(path) for area, path in AREAS.items()}
+    scanned_at = now_iso()
+    with _lock:
+        _state.update(totals=totals, scanned_at=scanned_at, scanned_ts=time.time(), error=None)
+    save_config(CONFIG_KEY, {"totals": totals, "scanned_at": scanned_at, "scanned_ts": _state["scanned_ts"]})
+    return totals
+
+
+def _run_rescan():
+    try:
+        rescan()
+    except Exception as e:
+        with _lock:
+            _state["error"] = str(e)
+    finally:
+        with _lock:
+            _state["scanning"] = False
+
+
+def start_rescan() -> bool:
+    """Dispara a varredura numa thread. Retorna False se já houver uma em andamento."""
+    with _lock:
+        if _state["scanning"]:
+            return False
+        _state["scanning"] = True
+    threading.Thread(target=_run_rescan, name="storage-rescan", daemon=True).start()
+    return True
+
+
+def _load_snapshot():
+    snap = load_config(CONFIG_KEY, None)
+    if not snap or not isinstance(snap, dict) or "totals" not in snap:
+        return
+    with _lock:
+        if _state["totals"] is None:
+            _state.update(totals=snap["totals"], scanned_at=snap.get("scanned_at"), scanned_ts=snap.get("scanned_ts", 0.0))
+
+
+def stats() -> dict:
+    """Totais atuais: {'uploads': {'files', 'bytes'}, 'exports': {...}, 'scanned_at', 'scanning', 'error'}.
+
+    Sem retrato (primeira execução) as áreas vêm zeradas com scanning=True
+    até a varredura em segundo plano terminar.
+    """
+    if _state["totals"] is None:
+        _load_snapshot()
+    if _state["totals"] is None or time.time() - _state["scanned_ts"] > RESCAN_INTERVAL_S:
+        start_rescan()
+    with _lock:
+        totals = _state["totals"] or {}
+        result = {area: dict(totals.get(area) or {"files": 0, "bytes": 0}) for area in AREAS}
+        result.update(scanned_at=_state["scanned_at"], scanning=_state["scanning"], error=_state["error"])
+    return result
+
+
+def _bump(area: str, files: int, size: int):
+    with _lock:
+        totals = _state["totals"]
+        if totals is None or area not in totals:
+            return  # sem base ainda: a próxima varredura já conta o arquivo
+        t = totals[area]
+        t["files"] = max(0, t["files"] + files)
+        t["bytes"] = max(0, t["bytes"] + size)
+
+
+def record_file(area: str, path: str):
+    """Soma um arquivo recém-gravado na área."""
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return
+    _bump(area, 1, size)
+
+
+def record_delete(area: str, size: int, files: int = 1):
+    """Desconta arquivos apagados da área (size = bytes somados)."""
+    _bump(area, -files, -(size or 0))